@@ -0,0 +1,81 @@
+"""
+Measures how many of the exact top matches in the group of all respondents the approximate (LSH candidates + exact
+re-rank) search finds, and how much faster it is, on synthetic respondents.
+
+Usage (from the root of the project):
+    python -m benchmarks.ann_recall --respondents 5000 --candidates 100 300 1000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_data import add_synthetic_data_arguments, make_synthetic_data_from_args
+from matching.match_ann import find_top_k_all_group_approximate
+from matching.match_top_k import match_top_k_streaming
+from matching.match_vectorized import encode_questions
+from matching.question_plan import compile_question_plan
+from utils.constants import ALL_MATCHES_GROUP_CODE, MATCHING_ANN_DEFAULT_MINHASHES, MATCHING_ANN_DEFAULT_TABLES
+
+
+def _measure_recall(exact_top_matches: list[set[int]], approximate_top_matches: list[set[int]]) -> float:
+    """Fraction of all exact top matches that were also found approximately"""
+    num_found = sum(len(exact & approximate) for exact, approximate in zip(exact_top_matches, approximate_top_matches))
+    return num_found / max(1, sum(len(exact) for exact in exact_top_matches))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall and speed of approximate top match search")
+    parser.add_argument("--respondents", type=int, default=5000, metavar="NUM")
+    parser.add_argument("-k", type=int, default=5, help="Amount of top matches (default: %(default)s)")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[100, 300, 1000], metavar="NUM")
+    parser.add_argument("--tables", type=int, default=MATCHING_ANN_DEFAULT_TABLES, metavar="NUM")
+    parser.add_argument("--minhashes", type=int, default=MATCHING_ANN_DEFAULT_MINHASHES, metavar="NUM")
+    add_synthetic_data_arguments(parser)
+    args = parser.parse_args()
+
+    questions_data, respondents = make_synthetic_data_from_args(args, args.respondents)
+    question_plan = compile_question_plan(questions_data)
+    positions = {respondent.id: position for position, respondent in enumerate(respondents)}
+
+    start = time.perf_counter()
+    top_k_table = match_top_k_streaming(respondents, question_plan, args.k, verbose=False)
+    exact_seconds = time.perf_counter() - start
+    exact_top_matches = [
+        {positions[match_id] for match_id, _ in top_k_table.get_top_matches(respondent.id, ALL_MATCHES_GROUP_CODE)}
+        for respondent in respondents
+    ]
+    # exact top matches whose score ties with a match outside of the top are not a miss, so recall is also measured by
+    # the score of the k-th match
+    exact_kth_scores = np.array(
+        [
+            top_k_table.get_top_matches(respondent.id, ALL_MATCHES_GROUP_CODE)[-1][1]
+            for respondent in respondents
+        ]
+    )
+    print(f"{args.respondents} respondents, top {args.k}: exact search took {exact_seconds:.2f} s (all groups)")
+
+    encoded_questions = encode_questions(respondents, question_plan)
+    print(f"{'candidates':>10} {'seconds':>8} {'speedup':>8} {'recall':>7} {'score recall':>12}")
+    for num_candidates in args.candidates:
+        start = time.perf_counter()
+        approximate = find_top_k_all_group_approximate(
+            respondents, encoded_questions, args.k, num_candidates, args.tables, args.minhashes, args.seed
+        )
+        approximate_seconds = time.perf_counter() - start
+
+        recall = _measure_recall(exact_top_matches, [set(top_positions.tolist()) for top_positions, _ in approximate])
+        num_good_enough = sum(
+            int(np.count_nonzero(top_scores >= kth_score))
+            for (_, top_scores), kth_score in zip(approximate, exact_kth_scores)
+        )
+        score_recall = num_good_enough / max(1, sum(len(exact) for exact in exact_top_matches))
+        print(
+            f"{num_candidates:>10} {approximate_seconds:>8.2f} {exact_seconds / approximate_seconds:>8.1f} "
+            f"{recall:>7.3f} {score_recall:>12.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
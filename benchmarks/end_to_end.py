@@ -0,0 +1,262 @@
+"""
+Times and measures the peak memory of every stage of a matchmaking run on synthetic data: reading the csv data file,
+matching, writing match results into SQLite, loading them back and generating (html) result files. Results are appended
+to a machine-readable history (one JSON object per line), and compared with the previous run of the same parameters,
+so regressions show up between versions.
+
+Usage (from the root of the project):
+    python -m benchmarks.end_to_end --respondents 500 1000 --engine numpy
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.synthetic_data import add_synthetic_data_arguments, make_synthetic_data_from_args, write_synthetic_csv
+from commands.match import write_match_results
+from matching.match_all import match_all_respondents
+from matching.match_parallel import match_all_respondents_parallel
+from matching.match_vectorized import match_all_respondents_vectorized
+from program_input_handling.process_py_config_file import process_py_config_file
+from program_input_handling.read_csv_input_data import read_data_from_csv
+from results.generate_all import generate_result_files
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.classes.match_table import MatchTable
+from utils.classes.matchmaking_config import MatchmakingConfig
+from utils.classes.result_file_type import ResultFileType
+from utils.constants import (
+    CLI_DEFAULT_MAX_RESULTS_IN_GROUP,
+    CSV_DATA_DEFAULT_DELIMITER,
+    CSV_DATA_DEFAULT_MULTI_DELIMITER,
+    DEFAULT_RESULTS_PRECISION,
+    MATCHING_ENGINE_NUMPY,
+    MATCHING_ENGINE_PARALLEL,
+    MATCHING_ENGINE_PYTHON,
+)
+import utils.sql as SQL
+
+BENCHMARK_DEFAULT_HISTORY_PATH = "benchmarks/history.jsonl"
+BENCHMARK_PROJECT_CODE = "benchmark"
+
+
+def _measure_stage(function, measure_memory: bool, before=None) -> tuple[object, dict]:
+    """
+    Runs `function` (after the untimed `before`, if given) and returns its result with `{"seconds", "peak_bytes"}`.
+    The peak memory is measured in a second run, as tracing allocations slows python code down a lot.
+    """
+    if before is not None:
+        before()
+    # messages printed by the measured code are not part of the benchmark's output
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+
+    peak_bytes = None
+    if measure_memory:
+        if before is not None:
+            before()
+        with contextlib.redirect_stdout(io.StringIO()):
+            tracemalloc.start()
+            function()
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    return result, {"seconds": seconds, "peak_bytes": peak_bytes}
+
+
+def _match(engine: str, respondents, question_plan):
+    if engine == MATCHING_ENGINE_PYTHON:
+        return match_all_respondents(respondents, question_plan, verbose=False)
+    elif engine == MATCHING_ENGINE_NUMPY:
+        return match_all_respondents_vectorized(respondents, question_plan, verbose=False)
+    elif engine == MATCHING_ENGINE_PARALLEL:
+        return match_all_respondents_parallel(respondents, question_plan, verbose=False)
+    raise ValueError(f"Invalid matching engine '{engine}'")
+
+
+def _create_database(path: str, csv_path: str, respondents) -> tuple[sqlite3.Connection, int]:
+    """Creates a database with a project and its respondents, the same as 'project create' does"""
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    SQL.migrate(connection)
+
+    cursor = connection.cursor()
+    cursor.execute(
+        "INSERT INTO projects (code, csv_path, csv_sha256, csv_size, csv_delimiter, csv_multi_delimiter, created_at) VALUES(?, ?, ?, ?, ?, ?, ?)",
+        (BENCHMARK_PROJECT_CODE, csv_path, "", 0, CSV_DATA_DEFAULT_DELIMITER, CSV_DATA_DEFAULT_MULTI_DELIMITER, ""),
+    )
+    project_sql_id = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO respondents (id, project_id, name, email, gender, csv_data) VALUES(?, ?, ?, ?, ?, ?)",
+        (
+            (resp.id, project_sql_id, resp.full_name, resp.email, str(resp.gender), resp.csv_data_row)
+            for resp in respondents
+        ),
+    )
+    connection.commit()
+    return connection, project_sql_id
+
+
+def run_benchmark(num_respondents: int, args, work_dir: str) -> dict[str, dict]:
+    """Runs all stages for `num_respondents` synthetic respondents and returns the measurements of every stage"""
+    measure_memory = not args.no_memory
+    stages: dict[str, dict] = {}
+
+    csv_path = os.path.join(work_dir, f"synthetic_{num_respondents}.csv")
+    questions_data, respondents = make_synthetic_data_from_args(args, num_respondents)
+    write_synthetic_csv(csv_path, questions_data, respondents)
+
+    # read csv data file
+    (group_codes, question_plan, respondents), stages["read_data_from_csv"] = _measure_stage(
+        lambda: read_data_from_csv(csv_path, CSV_DATA_DEFAULT_DELIMITER, CSV_DATA_DEFAULT_MULTI_DELIMITER, False),
+        measure_memory,
+    )
+
+    # match
+    match_table, stages[f"match_all_respondents ({args.engine})"] = _measure_stage(
+        lambda: _match(args.engine, respondents, question_plan), measure_memory
+    )
+
+    # write match results into the database
+    database_path = os.path.join(work_dir, f"{num_respondents}.db")
+    connection, project_sql_id = _create_database(database_path, csv_path, respondents)
+    cursor = connection.cursor()
+
+    def clear_match_results():
+        cursor.execute("DELETE FROM match_results WHERE project_id = ?", (project_sql_id,))
+        connection.commit()
+
+    def write():
+        write_match_results(cursor, project_sql_id, match_table)
+        connection.commit()
+
+    _, stages["sqlite write"] = _measure_stage(write, measure_memory, before=clear_match_results)
+
+    # load match results from the database
+    _, stages["MatchTable.from_database"] = _measure_stage(
+        lambda: MatchTable.from_database(cursor, BENCHMARK_PROJECT_CODE, num_respondents), measure_memory
+    )
+    respondent_ids = [respondent.id for respondent in respondents]
+    dense_match_table, stages["DenseMatchTable.from_database"] = _measure_stage(
+        lambda: DenseMatchTable.from_database(cursor, BENCHMARK_PROJECT_CODE, num_respondents, respondent_ids),
+        measure_memory,
+    )
+    connection.close()
+
+    # generate html result files
+    config = MatchmakingConfig(
+        CSV_DATA_DEFAULT_DELIMITER,
+        CSV_DATA_DEFAULT_MULTI_DELIMITER,
+        DEFAULT_RESULTS_PRECISION,
+        CLI_DEFAULT_MAX_RESULTS_IN_GROUP,
+        os.path.join(work_dir, f"result_files_{num_respondents}"),
+        False,
+        "override",
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        config, match_groups = process_py_config_file(None, config, group_codes)
+    _, stages["generate_result_files (html)"] = _measure_stage(
+        lambda: generate_result_files(
+            match_groups, respondents, dense_match_table, [ResultFileType.EMAIL], config, verbose=False
+        ),
+        measure_memory,
+    )
+
+    return stages
+
+
+def _get_git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _read_history(path: str) -> list[dict]:
+    if not os.path.isfile(path):
+        return []
+    with open(path, "r", encoding="UTF-8") as history_file:
+        return [json.loads(line) for line in history_file if line.strip()]
+
+
+def _print_stages(stages: dict[str, dict], previous_stages: dict[str, dict] | None):
+    print(f"  {'stage':<36} {'seconds':>9} {'peak MiB':>9} {'vs previous':>12}")
+    for name, measurement in stages.items():
+        peak_bytes = measurement["peak_bytes"]
+        peak = f"{peak_bytes / 2**20:>9.2f}" if peak_bytes is not None else f"{'-':>9}"
+        previous = (previous_stages or {}).get(name)
+        change = f"{measurement['seconds'] / previous['seconds']:>11.2f}x" if previous else f"{'-':>12}"
+        print(f"  {name:<36} {measurement['seconds']:>9.3f} {peak} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark all stages of a matchmaking run on synthetic data")
+    parser.add_argument("--respondents", type=int, nargs="+", default=[500, 1000], metavar="NUM")
+    parser.add_argument(
+        "--engine",
+        choices=(MATCHING_ENGINE_PYTHON, MATCHING_ENGINE_NUMPY, MATCHING_ENGINE_PARALLEL),
+        default=MATCHING_ENGINE_PYTHON,
+    )
+    parser.add_argument("--no-memory", action="store_true", help="Do not measure peak memory (runs every stage once)")
+    parser.add_argument("--history", default=BENCHMARK_DEFAULT_HISTORY_PATH, metavar="PATH")
+    parser.add_argument("--label", default=None, help="Free text stored with the results (e.g. what changed)")
+    add_synthetic_data_arguments(parser)
+    args = parser.parse_args()
+
+    history = _read_history(args.history)
+    git_commit = _get_git_commit()
+
+    for num_respondents in args.respondents:
+        parameters = {
+            "respondents": num_respondents,
+            "engine": args.engine,
+            "questions": args.questions,
+            "groups": args.groups,
+            "genders": args.genders,
+            "any_gender_share": args.any_gender_share,
+            "noise": args.noise,
+            "seed": args.seed,
+        }
+        with tempfile.TemporaryDirectory(prefix="matchmaker_benchmark_") as work_dir:
+            stages = run_benchmark(num_respondents, args, work_dir)
+
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit,
+            "label": args.label,
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "parameters": parameters,
+            "stages": stages,
+        }
+        previous = next((old for old in reversed(history) if old["parameters"] == parameters), None)
+
+        print(f"{num_respondents} respondents (commit {git_commit}):")
+        _print_stages(stages, previous["stages"] if previous else None)
+
+        os.makedirs(os.path.dirname(args.history) or ".", exist_ok=True)
+        with open(args.history, "a", encoding="UTF-8") as history_file:
+            history_file.write(json.dumps(record) + "\n")
+        history.append(record)
+
+    print(f"Results appended to '{args.history}'.")
+
+
+if __name__ == "__main__":
+    main()
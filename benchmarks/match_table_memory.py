@@ -0,0 +1,69 @@
+"""
+Compares memory use (and lookup speed) of the dict based `MatchTable` and the array based `DenseMatchTable`.
+
+Usage (from the root of the project):
+    python -m benchmarks.match_table_memory --respondents 1000 2000 4000
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.classes.match_table import MatchTable
+
+
+def _fill_table(table, respondent_ids: list[int], rng: random.Random):
+    for i, resp1_id in enumerate(respondent_ids):
+        for resp2_id in respondent_ids[i + 1 :]:
+            table.set_compatibility(resp1_id, resp2_id, rng.uniform(0, 100))
+
+
+def _measure(table_factory, respondent_ids: list[int], seed: int) -> tuple[int, float, float]:
+    """Returns `(peak bytes allocated, fill seconds, seconds per lookup)`"""
+    rng = random.Random(seed)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    table = table_factory(respondent_ids)
+    _fill_table(table, respondent_ids, rng)
+    fill_seconds = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # look up compatibilities the same way result generation does: one respondent against everyone else
+    lookup_respondent_ids = respondent_ids[: min(len(respondent_ids), 20)]
+    num_lookups = 0
+    start = time.perf_counter()
+    for resp1_id in lookup_respondent_ids:
+        for resp2_id in respondent_ids:
+            if resp1_id != resp2_id:
+                table.get_compatibility(resp1_id, resp2_id)
+                num_lookups += 1
+    lookup_seconds = (time.perf_counter() - start) / max(1, num_lookups)
+
+    return peak_bytes, fill_seconds, lookup_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory use of MatchTable and DenseMatchTable")
+    parser.add_argument("--respondents", type=int, nargs="+", default=[500, 1000, 2000], metavar="NUM")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'respondents':>11} {'table':>16} {'peak MiB':>10} {'bytes/pair':>10} {'fill s':>8} {'lookup us':>10}")
+    for num_respondents in args.respondents:
+        respondent_ids = list(range(num_respondents))
+        num_pairs = max(1, num_respondents * (num_respondents - 1) // 2)
+
+        for name, table_factory in (("MatchTable", lambda ids: MatchTable()), ("DenseMatchTable", DenseMatchTable)):
+            peak_bytes, fill_seconds, lookup_seconds = _measure(table_factory, respondent_ids, args.seed)
+            print(
+                f"{num_respondents:>11} {name:>16} {peak_bytes / 2**20:>10.2f} {peak_bytes / num_pairs:>10.1f} "
+                f"{fill_seconds:>8.2f} {lookup_seconds * 1e6:>10.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
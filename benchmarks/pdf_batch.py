@@ -0,0 +1,88 @@
+"""
+Times generating pdf result files of synthetic respondents with one wkhtmltopdf run per file against runs that render a
+batch of files at once (see `generate_pdf_result_files`). Needs wkhtmltopdf (and pypdf for batches) installed.
+
+Usage (from the root of the project):
+    python -m benchmarks.pdf_batch --respondents 100 --batch-sizes 1 10 50
+"""
+
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+
+import numpy as np
+import pdfkit
+
+from benchmarks.synthetic_data import make_synthetic_questions, make_synthetic_respondents
+from program_input_handling.process_py_config_file import process_py_config_file
+from results.generate_all import generate_result_files
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.classes.matchmaking_config import MatchmakingConfig
+from utils.classes.result_file_type import ResultFileType
+from utils.constants import (
+    ALL_MATCHES_GROUP_CODE,
+    CLI_DEFAULT_MAX_RESULTS_IN_GROUP,
+    CSV_DATA_DEFAULT_DELIMITER,
+    CSV_DATA_DEFAULT_MULTI_DELIMITER,
+    DEFAULT_RESULTS_PRECISION,
+)
+from utils.upper_triangle import num_pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time rendering pdf result files one by one and in batches")
+    parser.add_argument("--respondents", type=int, default=100, metavar="NUM")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 50], metavar="NUM")
+    parser.add_argument("--workers", type=int, default=1, metavar="NUM")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # (raises an error if wkhtmltopdf is not found, instead of failing to generate every file)
+    pdfkit.configuration()
+
+    respondents = make_synthetic_respondents(args.respondents, make_synthetic_questions(), seed=args.seed)
+    rng = np.random.default_rng(args.seed)
+    match_table = DenseMatchTable(
+        [respondent.id for respondent in respondents],
+        rng.random(num_pairs(len(respondents))) * 100,
+    )
+    group_codes = [code for code in respondents[0].groups if code != ALL_MATCHES_GROUP_CODE]
+
+    print(f"{'batch size':>10} {'files':>6} {'seconds':>8} {'ms/file':>8} {'MiB':>8}")
+    for batch_size in args.batch_sizes:
+        with tempfile.TemporaryDirectory() as output_dir:
+            config = MatchmakingConfig(
+                CSV_DATA_DEFAULT_DELIMITER,
+                CSV_DATA_DEFAULT_MULTI_DELIMITER,
+                DEFAULT_RESULTS_PRECISION,
+                CLI_DEFAULT_MAX_RESULTS_IN_GROUP,
+                output_dir,
+                False,
+                "override",
+            )
+            with contextlib.redirect_stdout(io.StringIO()):
+                config, match_groups = process_py_config_file(None, config, group_codes)
+                start = time.perf_counter()
+                generated_files = generate_result_files(
+                    match_groups,
+                    respondents,
+                    match_table,
+                    [ResultFileType.PDF],
+                    config,
+                    verbose=False,
+                    workers=args.workers,
+                    pdf_batch_size=batch_size,
+                )
+                seconds = time.perf_counter() - start
+
+        num_bytes = sum(generated_file.size_bytes for generated_file in generated_files)
+        print(
+            f"{batch_size:>10} {len(generated_files):>6} {seconds:>8.2f} "
+            f"{seconds / max(1, len(generated_files)) * 1e3:>8.1f} {num_bytes / 2**20:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
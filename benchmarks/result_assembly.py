@@ -0,0 +1,121 @@
+"""
+Times finding every respondent's matches in their groups for result files: scanning all respondents once for genders
+and once per group (how it was done before `RespondentIndex`) against looking up the members of the groups in the
+index, and the whole assembly of match groups for results with the index. Group values are drawn so that groups keep
+about the same size as the amount of respondents grows, so with the index the time per respondent stays about the same
+(with the group of all respondents, which by itself has a quadratic amount of matches, pass `--all-group`).
+
+Usage (from the root of the project):
+    python -m benchmarks.result_assembly --respondents 1000 2000 4000 --group-size 50
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_data import make_synthetic_questions, make_synthetic_respondents
+from results.generate_all import get_respondent_match_groups_for_template
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.classes.match_group import MatchGroup
+from utils.classes.respondent import Respondent
+from utils.classes.respondent_index import RespondentIndex
+from utils.constants import ALL_MATCHES_GROUP_CODE, CLI_DEFAULT_MAX_RESULTS_IN_GROUP, NO_RESPONSE_GROUP_VALUE
+
+RESULT_ASSEMBLY_GROUP_CODES = ["CLASS", "GRADE"]
+"""Codes of the synthetic groups"""
+
+
+def _scan_matches_in_groups(respondent: Respondent, respondents: list[Respondent]) -> dict[str, list[Respondent]]:
+    """Finds matches in groups the way it was done before `RespondentIndex`, by scanning lists of respondents"""
+    matches = [match for match in respondents if match.gender in respondent.match_genders and match.id != respondent.id]
+    return {
+        group_code: [match for match in matches if match.groups.get(group_code) == value]
+        for group_code, value in respondent.groups.items()
+        if value != NO_RESPONSE_GROUP_VALUE
+    }
+
+
+def _time_scan(respondents: list[Respondent]) -> tuple[float, int]:
+    """Returns `(seconds, amount of matches found)`"""
+    start = time.perf_counter()
+    num_matches = 0
+    for respondent in respondents:
+        for matches in _scan_matches_in_groups(respondent, respondents).values():
+            num_matches += len(matches)
+    return time.perf_counter() - start, num_matches
+
+
+def _time_index(respondents: list[Respondent], match_groups: list[MatchGroup]) -> tuple[float, int]:
+    """Returns `(seconds including building the index, amount of matches found)`"""
+    start = time.perf_counter()
+    respondent_index = RespondentIndex(respondents, match_groups)
+    num_matches = 0
+    for respondent in respondents:
+        for matches in respondent_index.get_matches_in_groups(respondent).values():
+            num_matches += len(list(matches))
+    return time.perf_counter() - start, num_matches
+
+
+def _time_assembly(respondents: list[Respondent], match_groups: list[MatchGroup], seed: int) -> float:
+    """Returns seconds of assembling match groups for results of all respondents with the index"""
+    rng = np.random.default_rng(seed)
+    match_table = DenseMatchTable(
+        [respondent.id for respondent in respondents],
+        rng.random(len(respondents) * (len(respondents) - 1) // 2) * 100,
+    )
+    respondents_by_id = {respondent.id: respondent for respondent in respondents}
+
+    start = time.perf_counter()
+    respondent_index = RespondentIndex(respondents, match_groups)
+    for respondent in respondents:
+        get_respondent_match_groups_for_template(
+            respondent, respondents, match_table, match_groups, respondents_by_id, respondent_index
+        )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time finding respondents' matches in their groups for results")
+    parser.add_argument("--respondents", type=int, nargs="+", default=[1000, 2000, 4000], metavar="NUM")
+    parser.add_argument("--group-size", type=int, default=50, help="average amount of members of a group value")
+    parser.add_argument("--all-group", action="store_true", help="keep the group of all respondents")
+    parser.add_argument("--skip-scan", action="store_true", help="do not time scanning (slow for many respondents)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    questions_data = make_synthetic_questions()
+    group_codes = [*RESULT_ASSEMBLY_GROUP_CODES, *([ALL_MATCHES_GROUP_CODE] if args.all_group else [])]
+    match_groups = [
+        MatchGroup(group_code, num_results_to_show=CLI_DEFAULT_MAX_RESULTS_IN_GROUP, result_precision=2)
+        for group_code in group_codes
+    ]
+
+    print(f"{'respondents':>11} {'matches':>10} {'scan s':>8} {'index s':>8} {'assembly s':>10} {'us/respondent':>13}")
+    for num_respondents in args.respondents:
+        cardinality = max(1, num_respondents // args.group_size)
+        respondents = make_synthetic_respondents(
+            num_respondents,
+            questions_data,
+            group_cardinalities={group_code: cardinality for group_code in RESULT_ASSEMBLY_GROUP_CODES},
+            seed=args.seed,
+        )
+        if not args.all_group:
+            for respondent in respondents:
+                del respondent.groups[ALL_MATCHES_GROUP_CODE]
+
+        scan_seconds, num_scanned_matches = (None, None) if args.skip_scan else _time_scan(respondents)
+        index_seconds, num_matches = _time_index(respondents, match_groups)
+        if num_scanned_matches is not None and num_scanned_matches != num_matches:
+            raise ValueError(f"Scanning found {num_scanned_matches} matches, but the index {num_matches}")
+        assembly_seconds = _time_assembly(respondents, match_groups, args.seed)
+
+        scan_column = "-" if scan_seconds is None else f"{scan_seconds:.3f}"
+        print(
+            f"{num_respondents:>11} {num_matches:>10} {scan_column:>8} {index_seconds:>8.3f} {assembly_seconds:>10.3f} "
+            f"{assembly_seconds / num_respondents * 1e6:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares the speed (rows per second) of writing all match results of a project into SQLite row by row (an `INSERT`
+per pair, the way 'match' used to) and with the bulk write path (`commands.match.write_match_results`).
+
+Usage (from the root of the project):
+    python -m benchmarks.sqlite_write --respondents 1000 2000 4000
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+import utils.sql as SQL
+from commands.match import write_match_results
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.upper_triangle import num_pairs
+
+
+def _create_database(path: str) -> tuple[sqlite3.Connection, int]:
+    connection = sqlite3.connect(path)
+    SQL.migrate(connection)
+    cursor = connection.execute(
+        "INSERT INTO projects (code, csv_path, csv_sha256, csv_size, csv_delimiter, csv_multi_delimiter, created_at) VALUES(?, ?, ?, ?, ?, ?, ?)",
+        ("benchmark", "", "", 0, ",", ";", ""),
+    )
+    connection.commit()
+    return connection, cursor.lastrowid
+
+
+def _write_row_by_row(cursor, project_sql_id: int, match_table: DenseMatchTable):
+    respondent_ids = match_table.respondent_ids
+    for i in range(len(respondent_ids) - 1):
+        for resp2_id in respondent_ids[i + 1 :]:
+            cursor.execute(
+                "INSERT INTO match_results (project_id, resp1_id, resp2_id, score) VALUES(?, ?, ?, ?)",
+                (project_sql_id, respondent_ids[i], resp2_id, match_table.get_compatibility(respondent_ids[i], resp2_id)),
+            )
+
+
+def _write_bulk(cursor, project_sql_id: int, match_table: DenseMatchTable):
+    write_match_results(cursor, project_sql_id, match_table)
+
+
+def _measure(write, match_table: DenseMatchTable, work_dir: str, name: str, bulk_pragmas: bool) -> float:
+    """Returns the seconds it takes to write all match results into a new database (and commit them)"""
+    connection, project_sql_id = _create_database(os.path.join(work_dir, f"{name}.db"))
+    cursor = connection.cursor()
+    if bulk_pragmas:
+        SQL.set_bulk_write_pragmas(cursor)
+
+    start = time.perf_counter()
+    write(cursor, project_sql_id, match_table)
+    connection.commit()
+    seconds = time.perf_counter() - start
+
+    cursor.execute("SELECT COUNT(*) FROM match_results")
+    if cursor.fetchone()[0] != num_pairs(match_table.num_respondents):
+        raise ValueError(f"Not all match results were written by '{name}'")
+    connection.close()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare writing match results into SQLite row by row and in bulk")
+    parser.add_argument("--respondents", type=int, nargs="+", default=[1000, 2000], metavar="NUM")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'respondents':>11} {'rows':>10} {'row by row rows/s':>18} {'bulk rows/s':>12} {'speedup':>8}")
+    for num_respondents in args.respondents:
+        scores = rng.random(num_pairs(num_respondents)) * 100
+        match_table = DenseMatchTable(list(range(num_respondents)), scores)
+        num_rows = num_pairs(num_respondents)
+
+        with tempfile.TemporaryDirectory(prefix="matchmaker_benchmark_") as work_dir:
+            row_by_row_seconds = _measure(_write_row_by_row, match_table, work_dir, "row_by_row", bulk_pragmas=False)
+            bulk_seconds = _measure(_write_bulk, match_table, work_dir, "bulk", bulk_pragmas=True)
+
+        print(
+            f"{num_respondents:>11} {num_rows:>10} {num_rows / row_by_row_seconds:>18,.0f} "
+            f"{num_rows / bulk_seconds:>12,.0f} {row_by_row_seconds / bulk_seconds:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Synthetic respondents and csv data files for benchmarks. Every respondent is a noisy copy of one of a few archetypes (so
+that, like in real data, some respondents are much more alike than others), with random genders, wanted genders and
+groups.
+
+Usage (from the root of the project), to write a csv data file:
+    python -m benchmarks.synthetic_data out/synthetic.csv --respondents 5000 --questions "YN,SC|4,MC|8,RT|5" \
+        --groups CLASS=8 GRADE=4 --genders MALE=0.48 FEMALE=0.48 OTHER=0.04
+"""
+
+import argparse
+import csv
+import random
+
+from utils.classes.gender import Gender
+from utils.classes.question_data import QuestionData, QuestionType
+from utils.classes.respondent import Respondent
+from utils.constants import (
+    ALL_MATCHES_GROUP_CODE,
+    CSV_DATA_DEFAULT_DELIMITER,
+    CSV_DATA_DEFAULT_MULTI_DELIMITER,
+    CSV_DATA_PARAMETER_DELIMITER,
+    HEADER_FULL_NAME,
+    HEADER_GENDER,
+    HEADER_GENDERS_TO_MATCH_WITH,
+    HEADER_GROUP_PREFIX,
+)
+from utils.filesystem import make_parent_dirs_for_file
+
+SYNTHETIC_DEFAULT_QUESTION_MIX = "YN,YN,SC|3,SC|5,MC|6,MC|12,RT|5,RT|10"
+"""Question headings (without the question texts) of the default synthetic questions"""
+
+SYNTHETIC_DEFAULT_GROUP_CARDINALITIES: dict[str, int] = {"CLASS": 4, "GRADE": 4}
+"""Codes of the default synthetic groups and the amount of distinct values in each"""
+
+SYNTHETIC_DEFAULT_GENDER_WEIGHTS: dict[Gender, float] = {Gender.MALE: 0.48, Gender.FEMALE: 0.48, Gender.OTHER: 0.04}
+"""How often each gender is chosen for a synthetic respondent"""
+
+SYNTHETIC_DEFAULT_ANY_GENDER_SHARE = 0.15
+"""Share of male and female respondents who want random genders instead of only the opposite one"""
+
+
+def parse_question_mix(question_mix: str) -> list[QuestionData]:
+    """Returns questions from comma separated question headings (e.g. `"YN,SC|4,MC|8,RT|5"`), ids by their position"""
+    questions_data: list[QuestionData] = []
+    for question_id, heading in enumerate(heading.strip() for heading in question_mix.split(",")):
+        type_code, *params = heading.split(CSV_DATA_PARAMETER_DELIMITER)
+        try:
+            question_type = QuestionType(type_code.upper())
+        except ValueError:
+            raise ValueError(f"Invalid question type '{type_code}' in question mix '{question_mix}'")
+        num_options = int(params[0]) if params and params[0] else None
+        questions_data.append(QuestionData(question_id, question_type, num_options))
+    return questions_data
+
+
+def make_synthetic_questions(question_mix: str = SYNTHETIC_DEFAULT_QUESTION_MIX) -> list[QuestionData]:
+    return parse_question_mix(question_mix)
+
+
+def _get_question_heading(question_data: QuestionData) -> str:
+    if question_data.question_type == QuestionType.YES_NO:
+        return question_data.question_type.value
+    return f"{question_data.question_type.value}{CSV_DATA_PARAMETER_DELIMITER}{question_data.num_options}"
+
+
+def _make_random_response(question_data: QuestionData, rng: random.Random):
+    options = [f"OPTION_{option_i + 1}" for option_i in range(question_data.num_options)]
+    match question_data.question_type:
+        case QuestionType.YES_NO:
+            return rng.choice(["YES", "NO"])
+        case QuestionType.SINGLE_CHOICE:
+            return rng.choice(options)
+        case QuestionType.MULTIPLE_CHOICE:
+            return set(rng.sample(options, rng.randint(1, max(1, len(options) // 2))))
+        case QuestionType.RATING:
+            return rng.randint(1, question_data.num_options)
+
+
+def make_synthetic_respondents(
+    num_respondents: int,
+    questions_data: list[QuestionData],
+    group_cardinalities: dict[str, int] | None = None,
+    gender_weights: dict[Gender, float] | None = None,
+    any_gender_share: float = SYNTHETIC_DEFAULT_ANY_GENDER_SHARE,
+    num_archetypes: int = 20,
+    noise: float = 0.3,
+    seed: int = 0,
+) -> list[Respondent]:
+    """
+    Parameters:
+        group_cardinalities (dict[str, int] | None): code of every group and the amount of its distinct values. If
+            `None`, `SYNTHETIC_DEFAULT_GROUP_CARDINALITIES`
+        gender_weights (dict[Gender, float] | None): how often each gender is chosen. If `None`,
+            `SYNTHETIC_DEFAULT_GENDER_WEIGHTS`
+        any_gender_share (float): share of male and female respondents who want random genders (the rest want only the
+            opposite gender, respondents of other genders always want random genders)
+        num_archetypes (int): amount of archetypes respondents are copied from
+        noise (float): probability of every response being random instead of the archetype's
+    """
+    if group_cardinalities is None:
+        group_cardinalities = SYNTHETIC_DEFAULT_GROUP_CARDINALITIES
+    if gender_weights is None:
+        gender_weights = SYNTHETIC_DEFAULT_GENDER_WEIGHTS
+
+    rng = random.Random(seed)
+    archetypes = [
+        {question_data.id: _make_random_response(question_data, rng) for question_data in questions_data}
+        for _ in range(num_archetypes)
+    ]
+    genders = list(gender_weights)
+    all_genders = [Gender.MALE, Gender.FEMALE, Gender.OTHER]
+
+    respondents: list[Respondent] = []
+    for resp_id in range(num_respondents):
+        archetype = rng.choice(archetypes)
+        responses = {
+            question_data.id: (
+                _make_random_response(question_data, rng) if rng.random() < noise else archetype[question_data.id]
+            )
+            for question_data in questions_data
+        }
+        gender = rng.choices(genders, weights=list(gender_weights.values()))[0]
+        if gender in (Gender.MALE, Gender.FEMALE) and rng.random() >= any_gender_share:
+            match_genders = [Gender.FEMALE if gender == Gender.MALE else Gender.MALE]
+        else:
+            match_genders = rng.sample(all_genders, rng.randint(1, len(all_genders)))
+        groups = {
+            group_code: f"{group_code}_{rng.randrange(cardinality) + 1}"
+            for group_code, cardinality in group_cardinalities.items()
+        }
+        groups[ALL_MATCHES_GROUP_CODE] = ALL_MATCHES_GROUP_CODE
+
+        respondents.append(
+            Respondent(
+                resp_id,
+                f"Respondent {resp_id}",
+                f"respondent{resp_id}@example.com",
+                groups,
+                gender,
+                match_genders,
+                responses,
+            )
+        )
+
+    return respondents
+
+
+def write_synthetic_csv(
+    path: str,
+    questions_data: list[QuestionData],
+    respondents: list[Respondent],
+    delimiter: str = CSV_DATA_DEFAULT_DELIMITER,
+    multi_delimiter: str = CSV_DATA_DEFAULT_MULTI_DELIMITER,
+):
+    """Writes synthetic respondents into a csv data file that `read_data_from_csv` reads back into the same data"""
+    make_parent_dirs_for_file(path, "override")
+    group_codes = [code for code in respondents[0].groups if code != ALL_MATCHES_GROUP_CODE] if respondents else []
+
+    with open(path, "w", encoding="UTF-8", newline="") as file:
+        csv_writer = csv.writer(file, delimiter=delimiter)
+        csv_writer.writerow(
+            [HEADER_FULL_NAME, "EMAIL", HEADER_GENDER, HEADER_GENDERS_TO_MATCH_WITH]
+            + [f"{HEADER_GROUP_PREFIX}{CSV_DATA_PARAMETER_DELIMITER}{code}" for code in group_codes]
+            + [_get_question_heading(question_data) for question_data in questions_data]
+        )
+        for respondent in respondents:
+            responses = [respondent.responses[question_data.id] for question_data in questions_data]
+            csv_writer.writerow(
+                [respondent.full_name, respondent.email, str(respondent.gender)]
+                + [multi_delimiter.join(str(gender) for gender in respondent.match_genders)]
+                + [respondent.groups[code] for code in group_codes]
+                + [multi_delimiter.join(sorted(r)) if isinstance(r, set) else str(r) for r in responses]
+            )
+
+
+def _parse_key_values(items: list[str], value_type) -> dict[str, object]:
+    """Parses `KEY=VALUE` command line items"""
+    key_values = {}
+    for item in items:
+        key, separator, value = item.partition("=")
+        if not separator:
+            raise argparse.ArgumentTypeError(f"Expected KEY=VALUE, got '{item}'")
+        key_values[key] = value_type(value)
+    return key_values
+
+
+def add_synthetic_data_arguments(parser: argparse.ArgumentParser):
+    """Adds the arguments that describe synthetic data to a command line parser (see `make_synthetic_data_from_args`)"""
+    parser.add_argument(
+        "--questions",
+        default=SYNTHETIC_DEFAULT_QUESTION_MIX,
+        metavar="MIX",
+        help='Comma separated question headings (default: "%(default)s")',
+    )
+    parser.add_argument(
+        "--groups",
+        nargs="*",
+        default=[f"{code}={cardinality}" for code, cardinality in SYNTHETIC_DEFAULT_GROUP_CARDINALITIES.items()],
+        metavar="CODE=NUM",
+        help="Group codes and the amount of distinct values of each (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--genders",
+        nargs="+",
+        default=[f"{gender}={weight}" for gender, weight in SYNTHETIC_DEFAULT_GENDER_WEIGHTS.items()],
+        metavar="GENDER=WEIGHT",
+        help="How often each gender is chosen (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--any-gender-share",
+        type=float,
+        default=SYNTHETIC_DEFAULT_ANY_GENDER_SHARE,
+        metavar="SHARE",
+        help="Share of male and female respondents who want random genders (default: %(default)s)",
+    )
+    parser.add_argument("--noise", type=float, default=0.3, help="Probability of a response being random")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def make_synthetic_data_from_args(args, num_respondents: int) -> tuple[list[QuestionData], list[Respondent]]:
+    questions_data = parse_question_mix(args.questions)
+    respondents = make_synthetic_respondents(
+        num_respondents,
+        questions_data,
+        _parse_key_values(args.groups, int),
+        {Gender.from_string(gender): weight for gender, weight in _parse_key_values(args.genders, float).items()},
+        args.any_gender_share,
+        noise=args.noise,
+        seed=args.seed,
+    )
+    return questions_data, respondents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic csv data file")
+    parser.add_argument("path")
+    parser.add_argument("--respondents", type=int, default=1000, metavar="NUM")
+    add_synthetic_data_arguments(parser)
+    args = parser.parse_args()
+
+    questions_data, respondents = make_synthetic_data_from_args(args, args.respondents)
+    write_synthetic_csv(args.path, questions_data, respondents)
+    print(f"Wrote {len(respondents)} synthetic respondents with {len(questions_data)} questions to '{args.path}'.")
+
+
+if __name__ == "__main__":
+    main()
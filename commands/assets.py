@@ -0,0 +1,34 @@
+from utils.template_assets import find_external_resources, get_rendered_template_paths, vendor_external_resources
+
+
+def handle_assets(args):
+    match args.action.lower():
+        case "vendor":
+            vendor_assets()
+        case "check":
+            check_assets()
+        case _:
+            raise ValueError(f"Invalid action '{args.action}' in 'assets' command")
+
+
+def vendor_assets():
+    """
+    Downloads external stylesheets (and fonts they load) of templates rendered into pdf and png result files into the
+    templates, so that rendering them never waits on the network. Needs network access, run once and commit the changes
+    """
+    vendored = vendor_external_resources(get_rendered_template_paths())
+    print(f"Vendored {len(dict.fromkeys(url for _, url, _ in vendored))} stylesheets of {len(vendored)} links.")
+    check_assets()
+
+
+def check_assets():
+    """Raises an error if templates rendered into pdf and png result files still load anything from the network"""
+    template_paths = get_rendered_template_paths()
+    external_resources = find_external_resources(template_paths)
+    if external_resources:
+        for path, line, url in external_resources:
+            print(f"{path}:{line}: {url}")
+        raise ValueError(
+            f"Templates link {len(external_resources)} external resources. Run 'assets vendor' to vendor them."
+        )
+    print(f"All {len(template_paths)} template files are self-contained.")
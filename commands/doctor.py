@@ -1,2 +1,51 @@
+import tabulate
+
+from utils.template_assets import find_external_resources, get_rendered_template_paths
+import utils.sql as SQL
+
+
 def handle_doctor(args):
-    print("THIS IS THE NOT STARTED DOCTOR :))")
+    sql_connection = SQL.get_connection(args.project_id)
+    sql_cursor = sql_connection.cursor()
+
+    if not SQL.project_exists(sql_cursor, args.project_id):
+        sql_connection.close()
+        raise ValueError(f"Project with id '{args.project_id}' does not exist.")
+
+    sql_cursor.execute("PRAGMA database_list")
+    print(f"Database file: {sql_cursor.fetchone()["file"]}")
+    print(f"Database schema version: {SQL.get_schema_version(sql_cursor)} (latest: {SQL.SCHEMA_VERSION})")
+
+    # csv data file
+    file_exists, message = SQL.data_csv_file_exists(sql_cursor, args.project_id, args.verify_full)
+    print("Csv data file: OK" if file_exists else f"Csv data file: {message}")
+
+    # templates of pdf and png result files
+    external_resources = find_external_resources(get_rendered_template_paths())
+    print(
+        f"Templates: {len(external_resources)} external resources (run 'assets check' to list them)"
+        if external_resources
+        else "Templates: OK"
+    )
+
+    # indexes used by queries of a single project
+    query_plans = SQL.check_hot_query_plans(sql_cursor)
+    print(
+        tabulate.tabulate(
+            [
+                {"query": query, "plan": "\n".join(plan), "uses indexes": "OK" if uses_indexes else "FULL SCAN"}
+                for query, plan, uses_indexes in query_plans
+            ],
+            headers="keys",
+            tablefmt="grid",
+            maxcolwidths=[60, 60, None],
+        )
+    )
+    num_full_scans = sum(not uses_indexes for _, _, uses_indexes in query_plans)
+    if num_full_scans:
+        print(f"{num_full_scans} of {len(query_plans)} queries scan whole tables. Check the indexes in the database.")
+    else:
+        print(f"All {len(query_plans)} queries use indexes.")
+
+    sql_connection.commit()
+    sql_connection.close()
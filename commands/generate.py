@@ -1,17 +1,29 @@
+from matching.match_ann import match_top_k_approximate
+from matching.match_gender_pruned import count_gender_eligible_pairs
+from matching.match_incremental import get_changed_respondents
+from matching.match_top_k import match_top_k_streaming
 from program_input_handling.process_py_config_file import process_py_config_file
 from program_input_handling.read_csv_input_data import read_data_from_csv
 from results.generate_all import generate_result_files
-from utils.classes.match_table import MatchTable
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.classes.lazy_match_table import LazyMatchTable
+from utils.classes.mapped_match_table import MappedMatchTable
+from utils.classes.match_group import MatchGroup
 from utils.classes.matchmaking_config import MatchmakingConfig
 from utils.classes.result_file_type import ResultFileType
+from utils.classes.top_k_table import TopKTable
+from utils.constants import MATCH_TABLE_DEFAULT_CACHE_ROWS, RESULT_FILES_DEFAULT_PDF_BATCH_SIZE
 from utils.datetime import now_str
+from utils.profiling import count, stage
+from utils.template_assets import find_external_resources, get_rendered_template_paths
+from utils.upper_triangle import num_pairs
 import utils.sql as SQL
 import sys
 
 
 def handle_generate(args):
     project_id = args.project_id
-    sql_connection = SQL.get_connection()
+    sql_connection = SQL.get_connection(project_id)
     sql_cursor = sql_connection.cursor()
 
     # get program config and match_groups from processing config file if given
@@ -19,10 +31,13 @@ def handle_generate(args):
         "SELECT csv_path, csv_delimiter, csv_multi_delimiter FROM projects WHERE code = ?", (project_id,)
     )
     path, delimeter, multi_delimeter = sql_cursor.fetchone()[0:]
-    group_codes, _, respondents = read_data_from_csv(path, delimeter, multi_delimeter, verbose=True)
+    with stage("read csv"):
+        group_codes, question_plan, respondents = read_data_from_csv(path, delimeter, multi_delimeter, verbose=True)
+    count("respondents", len(respondents))
     try:
-        cli_config = MatchmakingConfig.from_argparse_args(args)
-        program_config, match_groups = process_py_config_file(args.config_path, cli_config, group_codes)
+        with stage("read config"):
+            cli_config = MatchmakingConfig.from_argparse_args(args)
+            program_config, match_groups = process_py_config_file(args.config_path, cli_config, group_codes)
     except Exception as e:
         print(
             "----------------------------------------------------------------\n"
@@ -36,7 +51,21 @@ def handle_generate(args):
     project_sql_id = SQL.get_project_sql_id(sql_cursor, project_id)
     user_input = input(f"Would you like to store generated files' information to the database? [Y/n]? ").lower()
     if user_input == "n":
-        generate_files(match_groups, respondents, sql_cursor, project_id, args.formats, program_config)
+        generate_files(
+            match_groups,
+            respondents,
+            question_plan,
+            sql_cursor,
+            project_id,
+            args.formats,
+            program_config,
+            args.top_k_only,
+            args.approximate_candidates,
+            args.respondents,
+            args.match_cache_rows,
+            args.workers,
+            args.pdf_batch_size,
+        )
         sql_connection.close()
         print("Result files not stored in the database.")
         return
@@ -49,10 +78,15 @@ def handle_generate(args):
     # TODO: Here result filke type mismatch between sql and other places, messy
     file_types_to_be_generated = [ResultFileType.from_string(f_type).to_sql_type_str() for f_type in args.formats]
     project_sql_id = SQL.get_project_sql_id(sql_cursor, project_id)
+    # (only the files of the respondents generated for, if generating only for some)
+    respondents_condition = (
+        " AND respondent_id IN (%s)" % ",".join("?" * len(args.respondents)) if args.respondents else ""
+    )
     sql_cursor.execute(
         "SELECT COUNT(*) AS count FROM generated_files WHERE project_id = ? AND file_type IN (%s)"
-        % ",".join("?" * len(file_types_to_be_generated)),
-        (project_sql_id, *file_types_to_be_generated),
+        % ",".join("?" * len(file_types_to_be_generated))
+        + respondents_condition,
+        (project_sql_id, *file_types_to_be_generated, *(args.respondents or [])),
     )
     num_files = sql_cursor.fetchone()["count"]
     if num_files > 0:
@@ -60,7 +94,21 @@ def handle_generate(args):
             f"There are already {num_files} generated file database rows for these file types: '{"', '".join(file_types_to_be_generated)}'. Are you sure you want to override all files of THESE types? [y/N/exit]? "
         ).lower()
         if user_input == "n":
-            generate_files(match_groups, respondents, sql_cursor, project_id, args.formats, program_config)
+            generate_files(
+                match_groups,
+                respondents,
+                question_plan,
+                sql_cursor,
+                project_id,
+                args.formats,
+                program_config,
+                args.top_k_only,
+                args.approximate_candidates,
+                args.respondents,
+                args.match_cache_rows,
+                args.workers,
+                args.pdf_batch_size,
+            )
             sql_connection.close()
             print("Result files not stored in the database.")
             return
@@ -71,50 +119,225 @@ def handle_generate(args):
 
         sql_cursor.execute(
             "DELETE FROM generated_files WHERE project_id = ? AND file_type IN (%s)"
-            % ",".join("?" * len(file_types_to_be_generated)),
-            (project_sql_id, *file_types_to_be_generated),
+            % ",".join("?" * len(file_types_to_be_generated))
+            + respondents_condition,
+            (project_sql_id, *file_types_to_be_generated, *(args.respondents or [])),
         )
         sql_connection.commit()
 
     # generate result files based on file types selected
-    filepaths = generate_files(match_groups, respondents, sql_cursor, project_id, args.formats, program_config)
-
-    # format list of tuples for batch sql execution
-    files_info = []
-    for i, (f_type, path, resp) in enumerate(filepaths):
-        _, file_hash, file_size = SQL.get_file_info(path)
-        files_info.append(
-            (
-                project_sql_id,
-                resp.id,
-                f_type.to_sql_type_str(),
-                path,
-                file_hash,
-                file_size,
-                now_str(),
+    generated_files = generate_files(
+        match_groups,
+        respondents,
+        question_plan,
+        sql_cursor,
+        project_id,
+        args.formats,
+        program_config,
+        args.top_k_only,
+        args.approximate_candidates,
+        args.respondents,
+        args.match_cache_rows,
+        args.workers,
+        args.pdf_batch_size,
+    )
+
+    # format list of tuples for batch sql execution (hashes and sizes were computed while writing the files)
+    files_info = [
+        (
+            project_sql_id,
+            generated_file.respondent.id,
+            generated_file.file_type.to_sql_type_str(),
+            generated_file.path,
+            generated_file.sha256,
+            generated_file.size_bytes,
+            now_str(),
+        )
+        for generated_file in generated_files
+    ]
+    with stage("save file info"):
+        sql_cursor.executemany(
+            "INSERT INTO generated_files (project_id, respondent_id, file_type, path, sha256, size_bytes, created_at) VALUES(?, ?, ?, ?, ?, ?, ?)",
+            files_info,
+        )
+        # (so that checking the files before mailing them does not read them either)
+        SQL.cache_file_hashes(
+            sql_cursor, {generated_file.path: generated_file.sha256 for generated_file in generated_files}
+        )
+        sql_connection.commit()
+    sql_connection.close()
+
+    print(f"Successfully saved ({len(generated_files)}) generated file data into the database.")
+
+
+def _get_num_top_matches_needed(
+    match_groups: list[MatchGroup], respondents, program_config: MatchmakingConfig
+) -> int:
+    """
+    The most results any group can show to any of the `respondents` (groups whose amount is set by a callable are asked
+    for every respondent)
+    """
+    num_top_matches = program_config.default_num_max_results_in_group
+    codes_of_groups_showing_all = []
+    for match_group in match_groups:
+        if callable(match_group.num_results_to_show):
+            nums_to_show = {match_group.get_num_results_to_show(match_groups, respondent) for respondent in respondents}
+        else:
+            nums_to_show = {match_group.num_results_to_show}
+        if None in nums_to_show:
+            codes_of_groups_showing_all.append(match_group.code)
+        num_top_matches = max([num_top_matches, *(num for num in nums_to_show if num is not None)])
+
+    for code in codes_of_groups_showing_all:
+        print(
+            f"Group '{code}' shows all matches, but only the top {num_top_matches} matches are found when using '--top-k-only'."
+        )
+    return num_top_matches
+
+
+def _load_match_table(
+    sql_cursor, project_id: str, respondents, cache_rows: int = MATCH_TABLE_DEFAULT_CACHE_ROWS
+) -> DenseMatchTable | MappedMatchTable | LazyMatchTable:
+    """
+    Loads match results of all pairs, or of the pairs scored if matched with '--prune-by-gender', from the stored score
+    matrix or from match result rows. A memory-mapped score matrix is only opened, and match result rows are read
+    lazily (at most `cache_rows` respondents' rows kept in memory): their scores are read when used
+    """
+    respondent_ids = [respondent.id for respondent in respondents]
+    score_matrix_path = SQL.get_score_matrix_path(sql_cursor, project_id)
+    if score_matrix_path:
+        match_table = MappedMatchTable(score_matrix_path)
+        if set(match_table.respondent_ids) != set(respondent_ids):
+            raise ValueError(
+                f"Memory-mapped score matrix at '{score_matrix_path}' is of different respondents ({match_table.num_respondents}) than expected ({len(respondent_ids)}). Match the respondents again."
             )
+        return match_table
+
+    if DenseMatchTable.database_blob_exists(sql_cursor, project_id):
+        # (pairs that were not scored are unset in the stored score matrix)
+        return DenseMatchTable.from_database(sql_cursor, project_id, len(respondents), respondent_ids)
+
+    sql_cursor.execute(
+        "SELECT COUNT(*) AS count FROM match_results WHERE project_id = (SELECT id FROM projects WHERE code = ?)",
+        (project_id,),
+    )
+    num_matches = sql_cursor.fetchone()["count"]
+    # (pairs that neither respondent would see are not stored if matched with '--prune-by-gender')
+    if SQL.get_project_pruned_by_gender(sql_cursor, project_id):
+        expected_num_matches = count_gender_eligible_pairs(respondents)
+    else:
+        expected_num_matches = num_pairs(len(respondents))
+    if num_matches != expected_num_matches:
+        raise ValueError(
+            f"Number of match rows ({num_matches}) in database does not match expected number for {len(respondents)} respondents."
         )
-    sql_cursor.executemany(
-        "INSERT INTO generated_files (project_id, respondent_id, file_type, path, sha256, size_bytes, created_at) VALUES(?, ?, ?, ?, ?, ?, ?)",
-        files_info,
+    return LazyMatchTable(
+        sql_cursor.connection, SQL.get_project_sql_id(sql_cursor, project_id), respondent_ids, cache_rows
     )
-    sql_connection.commit()
-    sql_connection.close()
 
-    print(f"Successfully saved ({len(filepaths)}) generated file data into the database.")
 
+def _stored_top_k_is_enough(match_groups: list[MatchGroup], k: int | None) -> bool:
+    """Whether every group shows at most `k` matches, so results can be generated from the stored top matches"""
+    return k is not None and all(
+        isinstance(group.num_results_to_show, int) and group.num_results_to_show <= k for group in match_groups
+    )
 
-def generate_files(match_groups, respondents, sql_cursor, project_id, formats: list[str], program_config):
-    try:
-        filepaths = generate_result_files(
-            match_groups,
-            respondents,
-            MatchTable.from_database(sql_cursor, project_id, len(respondents)),
-            [ResultFileType.from_string(f_type) for f_type in formats],
-            config=program_config,
-            verbose=True,
+
+def _load_top_k_table(sql_cursor, project_id: str, respondents, respondents_to_generate) -> TopKTable:
+    """Reads the stored top matches of the respondents to generate for, checking that they are up to date"""
+    match_fingerprints = SQL.get_respondent_match_fingerprints(
+        sql_cursor, SQL.get_project_sql_id(sql_cursor, project_id)
+    )
+    changed_respondents, removed_respondent_ids = get_changed_respondents(respondents, match_fingerprints)
+    if changed_respondents or any(match_fingerprints[resp_id] is not None for resp_id in removed_respondent_ids):
+        raise ValueError(
+            "Stored top matches are outdated: respondents in the csv data file changed since they were matched. Match the respondents again."
         )
-        return filepaths
+    return TopKTable.from_database(sql_cursor, project_id, respondents_to_generate or respondents)
+
+
+def generate_files(
+    match_groups,
+    respondents,
+    question_plan,
+    sql_cursor,
+    project_id,
+    formats: list[str],
+    program_config,
+    top_k_only: bool = False,
+    approximate_candidates: int | None = None,
+    respondent_ids: list[int] | None = None,
+    match_cache_rows: int = MATCH_TABLE_DEFAULT_CACHE_ROWS,
+    workers: int = 1,
+    pdf_batch_size: int = RESULT_FILES_DEFAULT_PDF_BATCH_SIZE,
+):
+    """
+    If `approximate_candidates` is given, top matches are found approximately (as if `top_k_only`, which it implies).
+    If `respondent_ids` are given, result files are generated only for those respondents. `match_cache_rows` is the
+    amount of respondents' match results kept in memory when they are read from match result rows. `workers` is the
+    amount of processes rendering and writing result files, `pdf_batch_size` the amount of pdf result files rendered by
+    a single wkhtmltopdf run
+    """
+    respondents_to_generate = None
+    if respondent_ids:
+        respondents_by_id = {respondent.id: respondent for respondent in respondents}
+        unknown_ids = [resp_id for resp_id in respondent_ids if resp_id not in respondents_by_id]
+        if unknown_ids:
+            raise ValueError(f"No respondents with ids {unknown_ids} in the csv data file.")
+        respondents_to_generate = [respondents_by_id[resp_id] for resp_id in dict.fromkeys(respondent_ids)]
+
+    try:
+        if approximate_candidates:
+            # find only the top matches straight from the csv data (in the group of all respondents among similar ones)
+            with stage("find top matches"):
+                match_table = match_top_k_approximate(
+                    respondents,
+                    question_plan,
+                    _get_num_top_matches_needed(match_groups, respondents_to_generate or respondents, program_config),
+                    approximate_candidates,
+                )
+        elif top_k_only:
+            # find only the top matches straight from the csv data, without loading match results from the database
+            with stage("find top matches"):
+                match_table = match_top_k_streaming(
+                    respondents,
+                    question_plan,
+                    _get_num_top_matches_needed(match_groups, respondents_to_generate or respondents, program_config),
+                )
+        elif _stored_top_k_is_enough(match_groups, SQL.get_project_top_k(sql_cursor, project_id)):
+            # only the top matches kept by 'match' are shown, no need to read all match results
+            with stage("load top matches"):
+                match_table = _load_top_k_table(sql_cursor, project_id, respondents, respondents_to_generate)
+        else:
+            with stage("load match results"):
+                match_table = _load_match_table(sql_cursor, project_id, respondents, match_cache_rows)
+
+        file_types = [ResultFileType.from_string(f_type) for f_type in formats]
+        if ResultFileType.PDF in file_types or ResultFileType.PNG in file_types:
+            external_resources = find_external_resources(get_rendered_template_paths())
+            if external_resources:
+                print(
+                    f"WARNING: templates link {len(external_resources)} external resources, every file waits on the "
+                    "network to render. Run 'assets vendor' once to make them self-contained."
+                )
+
+        with stage("generate result files"):
+            generated_files = generate_result_files(
+                match_groups,
+                respondents,
+                match_table,
+                file_types,
+                config=program_config,
+                verbose=True,
+                respondents_to_generate=respondents_to_generate,
+                workers=workers,
+                pdf_batch_size=pdf_batch_size,
+            )
+        if isinstance(match_table, LazyMatchTable):
+            count("match_row_cache_hits", match_table.hits)
+            count("match_row_cache_misses", match_table.misses)
+            print(f"Read match results of {match_table.misses} respondents ({match_table.hits} cache hits).")
+        return generated_files
     except Exception as e:
         print(
             "-----------------------------------------------\n"
@@ -1,10 +1,12 @@
 import sys
 import time
+from collections import defaultdict
 
 import tabulate
 from email_sending.send_email import send_result_email
 from utils.classes.email_attachment import EmailAttachment
 from utils.datetime import now_str
+from utils.profiling import stage
 import utils.sql as SQL
 import utils.filesystem as utils
 
@@ -23,6 +25,7 @@ def handle_mail(args):
                 args.attachments,
                 args.database_attachments,
                 not args.dont_halt_on_fail,
+                args.verify_full,
             )
         case "status":
             pass  # TODO: implement
@@ -41,7 +44,12 @@ def send_mail(
     attachments: list[str] | None,
     attachments_db: list[str] | None,
     halt_on_fail: bool,
+    verify_full: bool = False,
 ):
+    """
+    Files from the database are only read and hashed to check them if they changed since they were last hashed, or if
+    `verify_full`
+    """
     if recipients and recipients_from_db:
         raise ValueError("Both '--recipients' and '--recipients-from-database' can not be specified. Specify only one.")
     if not recipients and not recipients_from_db:
@@ -69,7 +77,7 @@ def send_mail(
             print("Not sending any emails.")
             return
 
-    sql_connection = SQL.get_connection()
+    sql_connection = SQL.get_connection(project_id)
     sql_cursor = sql_connection.cursor()
     project_sql_id = SQL.get_project_sql_id(sql_cursor, project_id)
 
@@ -112,6 +120,11 @@ def send_mail(
                 f"The amount of recipients ({len(recipient_emails)}) does not match the number of email html body files stored in database ({len(files_info)})."
             )
 
+        with stage("check files"):
+            checked_files_info = SQL.get_files_info(
+                [file_info["path"] for file_info in files_info], sql_cursor, verify_full
+            )
+
         html_body_paths = {}
         for file_info in files_info:
             try:
@@ -124,7 +137,7 @@ def send_mail(
 
             # check if file exists and credentials are ok
             file_path = file_info["path"]
-            file_exists, file_hash, file_size = SQL.get_file_info(file_path)
+            file_exists, file_hash, file_size = checked_files_info[file_path]
             if not file_exists:
                 raise ValueError(f"Email html body file not found in filesystem for respondent at path '{file_path}'")
             if file_hash != file_info["sha256"]:
@@ -141,6 +154,24 @@ def send_mail(
         for attachment in attachments:
             if not utils.file_exists(attachment):
                 raise ValueError(f"Attachment at path '{attachment}' does not exist.")
+    # attachments from the database of all recipients, checked all at once
+    recipients_attachments_info = defaultdict(list)
+    if attachments_db:
+        sql_cursor.execute(
+            "SELECT respondent_id, path, sha256, size_bytes FROM generated_files WHERE project_id = ? AND file_type IN (%s)"
+            % ",".join("?" * len(attachments_db)),
+            (project_sql_id, *attachments_db),
+        )
+        recipient_ids = {recipient_info["id"] for recipient_info in recipients_info}
+        for attachment_info in sql_cursor.fetchall():
+            if attachment_info["respondent_id"] in recipient_ids:
+                recipients_attachments_info[attachment_info["respondent_id"]].append(attachment_info)
+        with stage("check files"):
+            checked_attachments_info = SQL.get_files_info(
+                [info["path"] for infos in recipients_attachments_info.values() for info in infos],
+                sql_cursor,
+                verify_full,
+            )
     for recipient_info in recipients_info:
         recipient_attachments: list[EmailAttachment] = []
         if attachments:  # TODO: Figure out custom naming the email attachment from list cli
@@ -154,14 +185,9 @@ def send_mail(
             ]
 
         if attachments_db:  # TODO: Figure out custom naming the email attachment from db
-            sql_cursor.execute(
-                "SELECT path, sha256, size_bytes FROM generated_files WHERE project_id = ? AND respondent_id = ? AND file_type IN (%s)"
-                % ",".join("?" * len(attachments_db)),
-                (project_sql_id, recipient_info["id"], *attachments_db),
-            )
-            for attachment_info in sql_cursor.fetchall():
+            for attachment_info in recipients_attachments_info[recipient_info["id"]]:
                 path = attachment_info["path"]
-                file_exists, file_hash, file_size = SQL.get_file_info(path)
+                file_exists, file_hash, file_size = checked_attachments_info[path]
                 if not file_exists:
                     raise ValueError(f"Email attachment not found in filesystem for respondent at path '{path}'")
                 if file_hash != attachment_info["sha256"]:
@@ -199,7 +225,10 @@ def send_mail(
         html_body_path = html_body_paths[id]
         attachment_list = recipients_attachments[id]
 
-        response_ok, status_code, response_json = send_result_email(email, html_body_path, subject, attachment_list)
+        with stage("send email"):
+            response_ok, status_code, response_json = send_result_email(
+                email, html_body_path, subject, attachment_list
+            )
 
         sql_cursor.execute(
             "SELECT COUNT(*) AS count FROM emails WHERE project_id = ? AND respondent_id = ? AND email_type = ?",
@@ -1,19 +1,46 @@
+import os
+import shutil
+from itertools import repeat
+
 from matching.match_all import match_all_respondents
+from matching.match_gender_pruned import match_all_respondents_gender_pruned
+from matching.match_incremental import get_changed_respondents, match_changed_respondents
+from matching.match_parallel import match_all_respondents_parallel
+from matching.match_top_k import top_k_from_match_table
+from matching.match_vectorized import match_all_respondents_vectorized
 from program_input_handling.read_csv_input_data import read_data_from_csv
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.classes.lazy_match_table import LazyMatchTable
+from utils.classes.mapped_match_table import MappedMatchTable
+from utils.classes.score_statistics import ScoreStatistics
+from utils.classes.sparse_match_table import SparseMatchTable
+from utils.constants import (
+    MATCH_RESULTS_STORAGE_BLOB,
+    MATCH_RESULTS_STORAGE_MMAP,
+    MATCH_RESULTS_STORAGE_ROWS,
+    MATCHING_ENGINE_NUMPY,
+    MATCHING_ENGINE_PARALLEL,
+    MATCHING_ENGINE_PYTHON,
+    SCORE_MATRICES_DIR,
+)
+from utils.profiling import count, stage
+from utils.upper_triangle import num_pairs
 import utils.sql as SQL
 
 
 def handle_match(args):
     project_id = args.project_id
-    sql_connection = SQL.get_connection()
+    sql_connection = SQL.get_connection(args.project_id)
     sql_cursor = sql_connection.cursor()
+    SQL.set_bulk_write_pragmas(sql_cursor)
 
     if not SQL.project_exists(sql_cursor, args.project_id):
         sql_connection.close()
         raise ValueError(f"Project with id '{project_id}' does not exist.")
 
     # check if file exists with correct credentials
-    file_exists, message = SQL.data_csv_file_exists(sql_cursor, project_id)
+    with stage("check csv file"):
+        file_exists, message = SQL.data_csv_file_exists(sql_cursor, project_id, args.verify_full)
     if not file_exists:
         sql_connection.close()
         raise ValueError(message)
@@ -25,42 +52,286 @@ def handle_match(args):
     path, delimiter, multi_delimiter = sql_cursor.fetchone()[0:]
 
     # match respondents
-    _, questions_data, respondents = read_data_from_csv(path, delimiter, multi_delimiter, verbose=True)
-    match_table = match_all_respondents(respondents, questions_data)
+    with stage("read csv"):
+        _, question_plan, respondents = read_data_from_csv(path, delimiter, multi_delimiter, verbose=True)
+    count("respondents", len(respondents))
+    project_sql_id = SQL.get_project_sql_id(sql_cursor, project_id)
+    if args.incremental:
+        if (
+            args.storage != MATCH_RESULTS_STORAGE_ROWS
+            or DenseMatchTable.database_blob_exists(sql_cursor, project_id)
+            or SQL.get_score_matrix_path(sql_cursor, project_id)
+        ):
+            sql_connection.close()
+            raise ValueError(
+                "Match results stored as a score matrix can not be updated incrementally. Match all respondents instead."
+            )
+        _match_incrementally(args, sql_connection, project_sql_id, question_plan, respondents)
+        return
+
+    with stage("match"):
+        if args.prune_by_gender:
+            match_table = match_all_respondents_gender_pruned(respondents, question_plan, args.block_size)
+        elif args.engine == MATCHING_ENGINE_PYTHON:
+            match_table = match_all_respondents(respondents, question_plan)
+        elif args.engine == MATCHING_ENGINE_NUMPY:
+            match_table = match_all_respondents_vectorized(respondents, question_plan, args.block_size)
+        elif args.engine == MATCHING_ENGINE_PARALLEL:
+            match_table = match_all_respondents_parallel(respondents, question_plan, args.workers, args.tile_size)
+        else:
+            sql_connection.close()
+            raise ValueError(f"Invalid matching engine '{args.engine}'")
+    count("pairs_scored", _num_stored_pairs(match_table))
 
     # check if there are already match results (and ask on overwriting)
-    project_sql_id = SQL.get_project_sql_id(sql_cursor, project_id)
     sql_cursor.execute("SELECT COUNT(*) AS count FROM match_results WHERE project_id = ?", (project_sql_id,))
     num_matches = sql_cursor.fetchone()["count"]
-    if num_matches > 0:
+    score_matrix_exists = DenseMatchTable.database_blob_exists(sql_cursor, project_id)
+    old_score_matrix_path = SQL.get_score_matrix_path(sql_cursor, project_id)
+    if num_matches > 0 or score_matrix_exists or old_score_matrix_path:
+        if num_matches > 0:
+            existing_results = f"{num_matches} match result database rows"
+        elif score_matrix_exists:
+            existing_results = "a score matrix stored in the database"
+        else:
+            existing_results = f"a memory-mapped score matrix at '{old_score_matrix_path}'"
         user_input = input(
-            f"There are already {num_matches} match result database rows. Are you sure you want to override all of those [y/N]? "
+            f"There are already {existing_results}. Are you sure you want to override all of those [y/N]? "
         ).lower()
         if user_input != "y":
             sql_connection.close()
             print("Match results not saved.")
             return
+        # (not committed, so the old match results are replaced in the same transaction as the new ones are written)
         sql_cursor.execute("DELETE FROM match_results WHERE project_id = ?", (project_sql_id,))
-        sql_connection.commit()
+        sql_cursor.execute("DELETE FROM match_score_chunks WHERE project_id = ?", (project_sql_id,))
+        sql_cursor.execute("DELETE FROM match_score_matrices WHERE project_id = ?", (project_sql_id,))
+        SQL.set_score_matrix_path(sql_cursor, project_sql_id, None)
 
     # write match results' data
-    scores: list[float] = []
-    for i in range(len(respondents) - 1):
-        for other_resp in respondents[i + 1 :]:
-            resp = respondents[i]
-            score = match_table.get_compatibility(resp.id, other_resp.id)
-            scores.append(score)
-            sql_cursor.execute(
-                "INSERT INTO match_results (project_id, resp1_id, resp2_id, score) VALUES(?, ?, ?, ?)",
-                (project_sql_id, resp.id, other_resp.id, score),
-            )
+    with stage("write match results"):
+        if args.storage == MATCH_RESULTS_STORAGE_BLOB:
+            statistics = write_score_matrix(sql_cursor, project_sql_id, respondents, match_table)
+        elif args.storage == MATCH_RESULTS_STORAGE_MMAP:
+            score_matrix_path = os.path.join(SCORE_MATRICES_DIR, project_id)
+            statistics = write_mapped_score_matrix(score_matrix_path, respondents, match_table)
+            SQL.set_score_matrix_path(sql_cursor, project_sql_id, score_matrix_path)
+        else:
+            statistics = write_match_results(sql_cursor, project_sql_id, match_table)
+        SQL.set_project_pruned_by_gender(sql_cursor, project_sql_id, args.prune_by_gender)
+        SQL.set_respondent_match_fingerprints(sql_cursor, project_sql_id, respondents)
+        # (all match results were replaced, so respondents no longer in the csv data file have none)
+        respondent_ids = {respondent.id for respondent in respondents}
+        match_fingerprints = SQL.get_respondent_match_fingerprints(sql_cursor, project_sql_id)
+        SQL.forget_respondent_match_fingerprints(
+            sql_cursor,
+            project_sql_id,
+            [
+                resp_id
+                for resp_id, match_fingerprint in match_fingerprints.items()
+                if match_fingerprint is not None and resp_id not in respondent_ids
+            ],
+        )
+    top_k = _update_top_k(args, sql_cursor, project_id, project_sql_id)
+    if top_k:
+        with stage("write top matches"):
+            write_top_k_table(sql_cursor, project_sql_id, respondents, match_table, top_k)
     sql_connection.commit()
     sql_connection.close()
+
+    # files of the old memory-mapped score matrix are no longer linked to the project
+    if old_score_matrix_path and args.storage != MATCH_RESULTS_STORAGE_MMAP and os.path.isdir(old_score_matrix_path):
+        shutil.rmtree(old_score_matrix_path)
     print(f"Wrote {len(respondents)} respondents' match results.")
 
-    # print statistics
+    _print_score_statistics(statistics)
+
+
+def write_match_results(sql_cursor, project_sql_id: int, match_table) -> ScoreStatistics:
+    """
+    Inserts all match results of `match_table` in batches, in a single transaction (without committing), and returns
+    the statistics of the scores written. If the table is empty or the database holds a single project, the table's
+    indexes are dropped and built again after all rows are written, which is faster than updating them on every
+    insert. Indexes shared with other projects' match results are kept, as rebuilding them would take longer.
+    """
+    if not sql_cursor.connection.in_transaction:
+        sql_cursor.execute("BEGIN")
+
+    sql_cursor.execute("SELECT EXISTS (SELECT 1 FROM match_results)")
+    table_is_empty = not sql_cursor.fetchone()[0]
+    sql_cursor.execute("SELECT COUNT(*) FROM projects")
+    holds_single_project = sql_cursor.fetchone()[0] == 1
+    index_statements = []
+    if table_is_empty or holds_single_project:
+        index_statements = SQL.drop_indexes(sql_cursor, "match_results")
+
+    statistics = ScoreStatistics()
+    SQL.executemany_in_batches(
+        sql_cursor,
+        "INSERT INTO match_results (project_id, resp1_id, resp2_id, score) VALUES(?, ?, ?, ?)",
+        _iter_match_result_rows(project_sql_id, match_table, statistics),
+    )
+
+    with stage("build indexes"):
+        for index_statement in index_statements:
+            sql_cursor.execute(index_statement)
+    return statistics
+
+
+def write_score_matrix(sql_cursor, project_sql_id: int, respondents, match_table) -> ScoreStatistics:
+    """
+    Stores all match results of `match_table` as the project's score matrix (without committing) and returns the
+    statistics of the scores stored
+    """
+    if isinstance(match_table, SparseMatchTable):
+        match_table = match_table.to_dense([respondent.id for respondent in respondents])
+    match_table.to_database_blob(sql_cursor, project_sql_id)
+
+    statistics = ScoreStatistics()
+    for _, _, scores in match_table.iter_rows():
+        statistics.add_many(scores)
+    count("bytes_written", match_table.nbytes)
+    return statistics
+
+
+def write_mapped_score_matrix(path: str, respondents, match_table) -> ScoreStatistics:
+    """
+    Writes all match results of `match_table` into a memory-mapped score matrix in the directory `path` and returns
+    the statistics of the scores written
+    """
+    if isinstance(match_table, SparseMatchTable):
+        match_table = match_table.to_dense([respondent.id for respondent in respondents])
+    MappedMatchTable.write(path, match_table)
+
+    statistics = ScoreStatistics()
+    for _, _, scores in match_table.iter_rows():
+        statistics.add_many(scores)
+    count("bytes_written", match_table.nbytes)
+    return statistics
+
+
+def write_top_k_table(sql_cursor, project_sql_id: int, respondents, match_table, k: int):
+    """
+    Replaces the project's stored top `k` matches of every respondent in each group with the ones in `match_table`
+    (without committing)
+    """
+    if isinstance(match_table, SparseMatchTable):
+        match_table = match_table.to_dense([respondent.id for respondent in respondents])
+    num_rows = top_k_from_match_table(respondents, match_table, k).to_database(sql_cursor, project_sql_id, respondents)
+    count("top_matches_written", num_rows)
+    print(f"Wrote top {k} matches of {len(respondents)} respondents in each of their groups.")
+
+
+def _update_top_k(args, sql_cursor, project_id: str, project_sql_id: int) -> int | None:
+    """
+    Returns the amount of top matches of every respondent to keep in `match_top_k`, or `None` if they are not kept:
+    '--top-k' starts keeping them (or changes the amount), '--no-top-k' stops and deletes them, otherwise the project's
+    setting stays the same
+    """
+    if args.no_top_k:
+        sql_cursor.execute("DELETE FROM match_top_k WHERE project_id = ?", (project_sql_id,))
+        SQL.set_project_top_k(sql_cursor, project_sql_id, None)
+        return None
+    if args.top_k:
+        SQL.set_project_top_k(sql_cursor, project_sql_id, args.top_k)
+        return args.top_k
+    return SQL.get_project_top_k(sql_cursor, project_id)
+
+
+def _num_stored_pairs(match_table) -> int:
+    if isinstance(match_table, SparseMatchTable):
+        return match_table.num_stored_pairs
+    return num_pairs(match_table.num_respondents)
+
+
+def _iter_match_result_rows(project_sql_id: int, match_table, statistics: ScoreStatistics):
+    """
+    Yields `(project_sql_id, resp1_id, resp2_id, score)` of all pairs in `match_table` (only the scored ones if it is
+    sparse), adding every score to `statistics`
+    """
+    if isinstance(match_table, SparseMatchTable):
+        for resp1_id, resp2_id, score in match_table.iter_pairs():
+            statistics.add(score)
+            yield project_sql_id, resp1_id, resp2_id, score
+        return
+
+    for resp1_id, resp2_ids, scores in match_table.iter_rows():
+        statistics.add_many(scores)
+        yield from zip(repeat(project_sql_id), repeat(resp1_id), resp2_ids, scores)
+
+
+def _match_incrementally(args, sql_connection, project_sql_id: int, question_plan, respondents):
+    """
+    Recalculates only the match results of respondents who are new or whose data changed since their match results
+    were last calculated, upserts them and deletes match results of respondents no longer in the csv data file
+    """
+    sql_cursor = sql_connection.cursor()
+    with stage("find changed respondents"):
+        match_fingerprints = SQL.get_respondent_match_fingerprints(sql_cursor, project_sql_id)
+        changed_respondents, removed_respondent_ids = get_changed_respondents(respondents, match_fingerprints)
+    # (pairs of unchanged respondents keep their match results, which must be of the same pairs as the new ones)
+    is_matched = any(match_fingerprint is not None for match_fingerprint in match_fingerprints.values())
+    if is_matched and args.prune_by_gender != SQL.get_project_pruned_by_gender(sql_cursor, args.project_id):
+        sql_connection.close()
+        raise ValueError(
+            f"Match results were calculated {'without' if args.prune_by_gender else 'with'} '--prune-by-gender'. Match incrementally the same way, or match all respondents instead."
+        )
+    SQL.set_project_pruned_by_gender(sql_cursor, project_sql_id, args.prune_by_gender)
+    print(
+        f"{len(changed_respondents)} of {len(respondents)} respondents are new or changed, "
+        f"{len(removed_respondent_ids)} were removed since match results were last calculated."
+    )
+
+    # forget match results of removed respondents, and of changed ones (pairs they are in may no longer be scored)
+    with stage("delete outdated match results"):
+        sql_cursor.executemany(
+            "DELETE FROM match_results WHERE project_id = ? AND (resp1_id = ? OR resp2_id = ?)",
+            (
+                (project_sql_id, resp_id, resp_id)
+                for resp_id in [*removed_respondent_ids, *(resp.id for resp in changed_respondents)]
+            ),
+        )
+        SQL.forget_respondent_match_fingerprints(sql_cursor, project_sql_id, removed_respondent_ids)
+
+    # upsert match results of changed respondents with everyone
+    statistics = ScoreStatistics()
+
+    def upsert_rows():
+        changed_respondent_ids = {resp.id for resp in changed_respondents}
+        for resp1_id, resp2_id, score in match_changed_respondents(
+            respondents, question_plan, changed_respondent_ids, args.block_size, args.prune_by_gender
+        ):
+            statistics.add(score)
+            yield project_sql_id, resp1_id, resp2_id, score
+
+    # (scoring happens while rows are written, so it is a part of this stage)
+    with stage("match and write match results"):
+        SQL.executemany_in_batches(
+            sql_cursor,
+            "INSERT INTO match_results (project_id, resp1_id, resp2_id, score) VALUES(?, ?, ?, ?) "
+            "ON CONFLICT(project_id, resp1_id, resp2_id) DO UPDATE SET score = excluded.score",
+            upsert_rows(),
+        )
+        SQL.set_respondent_match_fingerprints(sql_cursor, project_sql_id, changed_respondents)
+
+    # (top matches of everyone may change, they are found again from the match results just written)
+    top_k = _update_top_k(args, sql_cursor, args.project_id, project_sql_id)
+    if top_k:
+        with stage("write top matches"):
+            match_table = LazyMatchTable(sql_connection, project_sql_id, [resp.id for resp in respondents], cache_rows=1)
+            write_top_k_table(sql_cursor, project_sql_id, respondents, match_table, top_k)
+    sql_connection.commit()
+    count("pairs_scored", statistics.count)
+    sql_connection.close()
+    print(f"Wrote {statistics.count} match results of {len(changed_respondents)} respondents.")
+
+    if statistics.count:
+        _print_score_statistics(statistics)
+
+
+def _print_score_statistics(statistics: ScoreStatistics):
     print(
-        f"Top     score: {round(max(scores), 2)}\n"
-        f"Lowest  score: {round(min(scores), 2)}\n"
-        f"Average score: {round(sum(scores)/len(scores), 2)}"
+        f"Top     score: {round(statistics.max, 2)}\n"
+        f"Lowest  score: {round(statistics.min, 2)}\n"
+        f"Average score: {round(statistics.mean, 2)}"
     )
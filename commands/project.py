@@ -1,4 +1,10 @@
+import os
+import shutil
+
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.constants import PROJECT_DATABASE_SEPARATE, PROJECT_DATABASE_SHARED
 from utils.datetime import now_str
+from utils.profiling import count, stage
 import utils.sql as SQL
 
 
@@ -6,7 +12,13 @@ def handle_project(args):
     match args.action.lower():
         case "create":
             create_project(
-                args.project_id, args.csv_path, args.name, args.description, args.delimiter, args.multi_delimiter
+                args.project_id,
+                args.csv_path,
+                args.name,
+                args.description,
+                args.delimiter,
+                args.multi_delimiter,
+                args.database,
             )
         case "delete":
             delete_project(args.project_id)
@@ -14,11 +26,25 @@ def handle_project(args):
             list_projects()
         case "reset_csv":
             reset_csv(args.project_id, args.csv_path)
+        case "migrate_scores":
+            migrate_scores(args.project_id)
         case _:
             raise ValueError(f"Invalid action '{args.action}' in 'project' command")
 
 
-def create_project(project_id: str, csv_path: str, name: str, description: str, delimiter: str, multi_delimiter: str):
+def create_project(
+    project_id: str,
+    csv_path: str,
+    name: str,
+    description: str,
+    delimiter: str,
+    multi_delimiter: str,
+    database: str = PROJECT_DATABASE_SHARED,
+):
+    """
+    If `database` is `PROJECT_DATABASE_SEPARATE`, all data of the project is stored in its own database file and only
+    the project itself in the main database (the catalog of all projects)
+    """
     sql_connection = SQL.get_connection()
     sql_cursor = sql_connection.cursor()
 
@@ -28,17 +54,51 @@ def create_project(project_id: str, csv_path: str, name: str, description: str,
         raise ValueError(f"Project with id '{project_id}' already exists.")
 
     # check if csv_path points to a valid file
-    csv_exists, csv_hash, csv_size = SQL.get_file_info(csv_path)
+    with stage("hash csv"):
+        csv_exists, csv_hash, csv_size = SQL.get_file_info(csv_path, sql_cursor)
     if not csv_exists:
         sql_connection.close()
         raise ValueError(f"Csv data file at '{csv_path}' does not exist.")
 
+    database_path = None
+    if database == PROJECT_DATABASE_SEPARATE:
+        database_path = SQL.get_default_project_database_path(project_id)
+        if os.path.exists(database_path):
+            sql_connection.close()
+            raise ValueError(f"Database file '{database_path}' of project '{project_id}' already exists.")
+    elif database != PROJECT_DATABASE_SHARED:
+        sql_connection.close()
+        raise ValueError(f"Invalid project database '{database}'")
+
     # create project in database
-    sql_cursor.execute(
-        "INSERT INTO projects (code, name, description, csv_path, csv_sha256, csv_size, csv_delimiter, csv_multi_delimiter, created_at) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (project_id, name, description, csv_path, csv_hash, csv_size, delimiter, multi_delimiter, now_str()),
-    )
-    sql_connection.commit()
+    project_row = (project_id, name, description, csv_path, csv_hash, csv_size, delimiter, multi_delimiter, now_str())
+    catalog_query = "INSERT INTO projects (code, name, description, csv_path, csv_sha256, csv_size, csv_delimiter, csv_multi_delimiter, created_at, database_path) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    if database_path:
+        # the project's own database, which also has the project (so that its data refers to it the same way), is
+        # created before the project is added to the catalog and removed if either fails, so that the catalog never
+        # lists a project without its database
+        project_connection = None
+        try:
+            project_connection = SQL.create_project_database(database_path)
+            project_connection.execute(
+                "INSERT INTO projects (code, name, description, csv_path, csv_sha256, csv_size, csv_delimiter, csv_multi_delimiter, created_at) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                project_row,
+            )
+            project_connection.commit()
+            sql_cursor.execute(catalog_query, (*project_row, database_path))
+            sql_connection.commit()
+        except Exception:
+            if project_connection is not None:
+                project_connection.close()
+            sql_connection.close()
+            SQL.remove_database_files(database_path)
+            raise
+        sql_connection.close()
+        sql_connection = project_connection
+        sql_cursor = sql_connection.cursor()
+    else:
+        sql_cursor.execute(catalog_query, (*project_row, None))
+        sql_connection.commit()
 
     # print messages
     SQL.fetch_and_print(
@@ -50,20 +110,22 @@ def create_project(project_id: str, csv_path: str, name: str, description: str,
 
     # write respondent data
     project_sql_id = SQL.get_project_sql_id(sql_cursor, project_id)
-    _, _, respondents = SQL.read_csv_data_file(sql_cursor, project_id)
-    for resp in respondents:
-        sql_cursor.execute(
-            "INSERT INTO respondents (id, project_id, name, email, gender, csv_data) VALUES(?, ?, ?, ?, ?, ?)",
-            (resp.id, project_sql_id, resp.full_name, resp.email, str(resp.gender), resp.csv_data_row),
-        )
-    sql_connection.commit()
-    print(f"Wrote {len(respondents)} respondents' data into the database.")
+    with stage("read csv"):
+        _, _, respondents = SQL.read_csv_data_file(sql_cursor, project_id)
+    count("respondents", len(respondents))
+    with stage("write respondents"):
+        changes = SQL.sync_respondents(sql_cursor, project_sql_id, respondents)
+        sql_connection.commit()
+    _print_respondent_changes(changes)
 
     sql_connection.close()
 
 
 def delete_project(project_id: str):
-    sql_connection = SQL.get_connection()
+    catalog_connection = SQL.get_connection()
+    database_path = SQL.get_project_database_path(catalog_connection.cursor(), project_id)
+    catalog_connection.close()
+    sql_connection = SQL.get_connection(project_id)
     sql_cursor = sql_connection.cursor()
 
     # check if a project already exists with this id
@@ -73,6 +135,7 @@ def delete_project(project_id: str):
 
     # get the project id stored in sql
     project_sql_id = SQL.get_project_sql_id(sql_cursor, project_id)
+    score_matrix_path = SQL.get_score_matrix_path(sql_cursor, project_id)
 
     # count everything associated with this project
     counts: dict[str, int] = {}
@@ -80,6 +143,10 @@ def delete_project(project_id: str):
     counts["respondents"] = sql_cursor.fetchone()["count"]
     sql_cursor.execute("SELECT COUNT(*) AS count FROM match_results WHERE project_id = ?", (project_sql_id,))
     counts["matches"] = sql_cursor.fetchone()["count"]
+    sql_cursor.execute("SELECT COUNT(*) AS count FROM match_score_matrices WHERE project_id = ?", (project_sql_id,))
+    counts["score_matrices"] = sql_cursor.fetchone()["count"]
+    sql_cursor.execute("SELECT COUNT(*) AS count FROM match_top_k WHERE project_id = ?", (project_sql_id,))
+    counts["top_matches"] = sql_cursor.fetchone()["count"]
     sql_cursor.execute("SELECT COUNT(*) AS count FROM generated_files WHERE project_id = ?", (project_sql_id,))
     counts["file_associations"] = sql_cursor.fetchone()["count"]
     sql_cursor.execute("SELECT COUNT(*) AS count FROM emails WHERE project_id = ?", (project_sql_id,))
@@ -101,14 +168,28 @@ def delete_project(project_id: str):
         sql_connection.close()
         return
 
-    # delete everything associated and database itself
-    sql_cursor.execute("DELETE FROM respondents WHERE project_id = ?", (project_sql_id,))
-    sql_cursor.execute("DELETE FROM match_results WHERE project_id = ?", (project_sql_id,))
-    sql_cursor.execute("DELETE FROM generated_files WHERE project_id = ?", (project_sql_id,))
-    sql_cursor.execute("DELETE FROM emails WHERE project_id = ?", (project_sql_id,))
-    sql_cursor.execute("DELETE FROM projects WHERE code = ?", (project_id,))
-    sql_connection.commit()
-    sql_connection.close()
+    if database_path:
+        # everything associated is in the project's own database, so only the file and the project in the catalog
+        sql_connection.close()
+        SQL.remove_database_files(database_path)
+        catalog_connection = SQL.get_connection()
+        catalog_connection.execute("DELETE FROM projects WHERE code = ?", (project_id,))
+        catalog_connection.commit()
+        catalog_connection.close()
+    else:
+        # delete everything associated and database itself
+        sql_cursor.execute("DELETE FROM respondents WHERE project_id = ?", (project_sql_id,))
+        sql_cursor.execute("DELETE FROM match_results WHERE project_id = ?", (project_sql_id,))
+        sql_cursor.execute("DELETE FROM match_score_chunks WHERE project_id = ?", (project_sql_id,))
+        sql_cursor.execute("DELETE FROM match_score_matrices WHERE project_id = ?", (project_sql_id,))
+        sql_cursor.execute("DELETE FROM match_top_k WHERE project_id = ?", (project_sql_id,))
+        sql_cursor.execute("DELETE FROM generated_files WHERE project_id = ?", (project_sql_id,))
+        sql_cursor.execute("DELETE FROM emails WHERE project_id = ?", (project_sql_id,))
+        sql_cursor.execute("DELETE FROM projects WHERE code = ?", (project_id,))
+        sql_connection.commit()
+        sql_connection.close()
+    if score_matrix_path and os.path.isdir(score_matrix_path):
+        shutil.rmtree(score_matrix_path)
 
     print(f"Deleted project '{project_id}' with {", ".join(counts_message_parts)}")
 
@@ -119,7 +200,7 @@ def list_projects():
 
     SQL.fetch_and_print(
         sql_cursor,
-        "SELECT code AS id, name, description, csv_path, csv_delimiter AS delimiter, csv_multi_delimiter AS multi_delimiter, created_at FROM projects",
+        "SELECT code AS id, name, description, csv_path, csv_delimiter AS delimiter, csv_multi_delimiter AS multi_delimiter, database_path AS own_database, created_at FROM projects",
         message_not_found="No projects exist.",
     )
 
@@ -127,7 +208,7 @@ def list_projects():
 
 
 def reset_csv(project_id: str, csv_path: str):
-    sql_connection = SQL.get_connection()
+    sql_connection = SQL.get_connection(project_id)
     sql_cursor = sql_connection.cursor()
 
     # check if a project already exists with this id
@@ -136,17 +217,17 @@ def reset_csv(project_id: str, csv_path: str):
         raise ValueError(f"Project with id '{project_id}' does not exist.")
 
     # check if csv_path points to a valid file
-    csv_exists, csv_hash, csv_size = SQL.get_file_info(csv_path)
+    with stage("hash csv"):
+        csv_exists, csv_hash, csv_size = SQL.get_file_info(csv_path, sql_cursor)
     if not csv_exists:
         sql_connection.close()
         raise ValueError(f"Csv data file at '{csv_path}' does not exist.")
 
-    # create project in database
+    # update project in database (committed together with its respondents)
     sql_cursor.execute(
-        "UPDATE projects SET csv_path = ?, csv_sha256 = ?, csv_size = ? WHERE id = ?",
+        "UPDATE projects SET csv_path = ?, csv_sha256 = ?, csv_size = ? WHERE code = ?",
         (csv_path, csv_hash, csv_size, project_id),
     )
-    sql_connection.commit()
 
     # print messages
     SQL.fetch_and_print(
@@ -156,16 +237,56 @@ def reset_csv(project_id: str, csv_path: str):
         message="Project csv updated!",
     )
 
-    # write respondent data
+    # write only the changes of respondent data
     project_sql_id = SQL.get_project_sql_id(sql_cursor, project_id)
-    _, _, respondents = SQL.read_csv_data_file(sql_cursor, project_id)
-    for resp in respondents:
-        print(resp)
-        sql_cursor.execute(
-            "UPDATE respondents SET email = ? WHERE id = ? AND project_id = ?",
-            (resp.email, resp.id, project_sql_id),
-        )
-    sql_connection.commit()
-    print(f"Wrote {len(respondents)} respondents' data into the database.")
+    with stage("read csv"):
+        _, _, respondents = SQL.read_csv_data_file(sql_cursor, project_id)
+    count("respondents", len(respondents))
+    with stage("sync respondents"):
+        changes = SQL.sync_respondents(sql_cursor, project_sql_id, respondents)
+        sql_connection.commit()
+    _print_respondent_changes(changes)
 
     sql_connection.close()
+    SQL.sync_catalog_project(project_id)
+
+
+def _print_respondent_changes(changes: dict[str, int]):
+    message = (
+        f"Respondents: {changes["added"]} added, {changes["updated"]} updated, {changes["removed"]} removed, "
+        f"{changes["unchanged"]} unchanged."
+    )
+    if changes["kept"]:
+        message += f" {changes["kept"]} no longer in the csv data file are kept until the respondents are matched again."
+    print(message)
+
+
+def migrate_scores(project_id: str):
+    """Moves the project's match results from one row per pair into a score matrix stored as blobs"""
+    sql_connection = SQL.get_connection(project_id)
+    sql_cursor = sql_connection.cursor()
+    project_sql_id = SQL.get_project_sql_id(sql_cursor, project_id)
+
+    if DenseMatchTable.database_blob_exists(sql_cursor, project_id):
+        sql_connection.close()
+        print(f"Match results of project '{project_id}' are already stored as a score matrix.")
+        return
+
+    sql_cursor.execute("SELECT COUNT(*) AS count FROM match_results WHERE project_id = ?", (project_sql_id,))
+    num_matches = sql_cursor.fetchone()["count"]
+    if num_matches == 0:
+        sql_connection.close()
+        raise ValueError(f"Project with id '{project_id}' has no match results to migrate.")
+
+    # respondents of the stored match results (pairs that are not stored stay unset in the score matrix)
+    with stage("read match results"):
+        match_table = DenseMatchTable.from_database(sql_cursor, project_id)
+    with stage("write score matrix"):
+        match_table.to_database_blob(sql_cursor, project_sql_id)
+        sql_cursor.execute("DELETE FROM match_results WHERE project_id = ?", (project_sql_id,))
+        sql_connection.commit()
+    sql_connection.close()
+
+    print(
+        f"Moved {num_matches} match results of {match_table.num_respondents} respondents into a score matrix of {match_table.nbytes} bytes."
+    )
@@ -10,6 +10,12 @@ CREATE TABLE projects (
     csv_delimiter TEXT NOT NULL,
     csv_multi_delimiter TEXT NOT NULL,
 
+    score_matrix_path TEXT,     -- directory of the memory-mapped score matrix, if match results are stored in one
+    database_path TEXT,         -- the project's own database file (holding all of its data), if not stored in this one
+    top_k INTEGER,              -- the amount of top matches kept in `match_top_k` of every respondent in each group
+    -- whether match results are only of the pairs scored with '--prune-by-gender'
+    pruned_by_gender INTEGER NOT NULL DEFAULT 0,
+
     created_at TEXT NOT NULL
 );
 
@@ -20,11 +26,15 @@ CREATE TABLE respondents (
     email TEXT,
     gender TEXT,
     csv_data TEXT,
+    fingerprint TEXT,           -- fingerprint of the respondent's stored data (of their csv data row)
+    match_fingerprint TEXT,     -- fingerprint of the respondent's data when their match results were last calculated
 
     PRIMARY KEY (id, project_id),
     FOREIGN KEY (project_id) REFERENCES projects(id)
 );
 
+CREATE INDEX respondents_project_email ON respondents (project_id, email);
+
 CREATE TABLE match_results (
     id INTEGER PRIMARY KEY,
     project_id INTEGER NOT NULL,
@@ -40,6 +50,51 @@ CREATE TABLE match_results (
     CHECK (resp1_id < resp2_id)
 );
 
+-- separate indexes (not table constraints), so that they can be dropped while writing all match results of a project
+-- and built once afterwards
+CREATE UNIQUE INDEX match_results_pairs ON match_results (project_id, resp1_id, resp2_id);
+CREATE INDEX match_results_project_resp2 ON match_results (project_id, resp2_id);
+
+-- alternative storage of match results: the flat upper triangle array of all scores of a project (see
+-- `utils.upper_triangle`), stored in one or more chunks of bytes, and its header
+CREATE TABLE match_score_matrices (
+    project_id INTEGER PRIMARY KEY,
+
+    dtype TEXT NOT NULL,                -- numpy type of the scores, with byte order (e.g. '<f8')
+    respondent_ids BLOB NOT NULL,       -- ids of respondents in the order of the matrix (little endian 64 bit integers)
+    num_scores INTEGER NOT NULL,
+    num_chunks INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,               -- checksum of all scores' bytes
+
+    created_at TEXT NOT NULL,
+
+    FOREIGN KEY (project_id) REFERENCES projects(id)
+);
+
+CREATE TABLE match_score_chunks (
+    project_id INTEGER NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    scores BLOB NOT NULL,
+
+    PRIMARY KEY (project_id, chunk_index),
+    FOREIGN KEY (project_id) REFERENCES match_score_matrices(project_id)
+);
+
+-- top matches (of wanted genders) of every respondent in each group they belong to, ranked by score, so that results
+-- are generated without reading all match results. Rebuilt by 'match' every time the project's scores change
+CREATE TABLE match_top_k (
+    project_id INTEGER NOT NULL,
+    respondent_id INTEGER NOT NULL,
+    group_code TEXT NOT NULL,
+    group_value TEXT NOT NULL,      -- the respondent's value in the group, which all of their matches in it share
+    rank INTEGER NOT NULL,          -- 0 for the best match
+    match_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+
+    PRIMARY KEY (project_id, respondent_id, group_code, rank),
+    FOREIGN KEY (project_id) REFERENCES projects(id)
+);
+
 CREATE TABLE generated_files (
     id INTEGER PRIMARY KEY,
     project_id INTEGER NOT NULL,
@@ -57,6 +112,8 @@ CREATE TABLE generated_files (
     UNIQUE (sha256)
 );
 
+CREATE INDEX generated_files_project_type_respondent ON generated_files (project_id, file_type, respondent_id);
+
 CREATE TABLE emails (
     id INTEGER PRIMARY KEY,
     project_id INTEGER NOT NULL,
@@ -75,3 +132,17 @@ CREATE TABLE emails (
     FOREIGN KEY (project_id) REFERENCES projects(id),
     FOREIGN KEY (respondent_id) REFERENCES respondents(id)
 );
+
+CREATE INDEX emails_project_respondent_type ON emails (project_id, respondent_id, email_type);
+
+-- sha256 of files last hashed, with the metadata they had then: a file whose size, modification time and inode are
+-- still the same is not read and hashed again
+CREATE TABLE file_fingerprints (
+    path TEXT PRIMARY KEY,      -- absolute path
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+
+    hashed_at TEXT NOT NULL
+);
@@ -13,6 +13,7 @@ from utils.constants import (
     ZEPTOMAIL_SERVICE_EMAIL,
     DEFAULT_RESULTS_EMAIL_SUBJECT,
 )
+from utils.profiling import count, stage
 
 
 def send_result_email(
@@ -52,7 +53,12 @@ def send_result_email(
     payload = json.dumps(payload_dict)
 
     # sending the email via the ZeptoMail API
-    email_response = requests.request(ZEPTOMAIL_REQUEST_METHOD, ZEPTOMAIL_SERVICE_EMAIL, data=payload, headers=headers)
+    with stage("http request"):
+        email_response = requests.request(
+            ZEPTOMAIL_REQUEST_METHOD, ZEPTOMAIL_SERVICE_EMAIL, data=payload, headers=headers
+        )
+    count("requests_sent")
+    count("request_bytes_sent", len(payload))
     return email_response.ok, email_response.status_code, email_response.json()
 
 
@@ -0,0 +1,226 @@
+import numpy as np
+
+from matching.match_top_k import encode_genders, select_top_k
+from matching.match_vectorized import EncodedQuestion, calculate_compatibility_block, encode_questions
+from matching.question_plan import QuestionPlan
+from utils.classes.question_data import QuestionType
+from utils.classes.respondent import Respondent
+from utils.classes.top_k_table import TopKTable
+from utils.constants import (
+    ALL_MATCHES_GROUP_CODE,
+    MATCHING_ANN_CANDIDATE_OVERSAMPLING,
+    MATCHING_ANN_DEFAULT_CANDIDATES,
+    MATCHING_ANN_DEFAULT_MINHASHES,
+    MATCHING_ANN_DEFAULT_TABLES,
+    MATCHING_DEFAULT_BLOCK_SIZE,
+    NO_RESPONSE_GROUP_VALUE,
+)
+
+
+def _embed_categories(values: np.ndarray, max_points: float) -> np.ndarray:
+    # one-hot, scaled so that the squared distance between different answers is `max_points`
+    one_hot = np.zeros((len(values), int(values.max(initial=-1)) + 1), dtype=np.float32)
+    one_hot[np.arange(len(values)), values] = np.sqrt(max_points / 2)
+    return one_hot
+
+
+def _embed_ratings(values: np.ndarray, max_points: float, num_options: int) -> np.ndarray:
+    # unary (rating `r` is `r - 1` ones followed by zeros), scaled so that the squared distance between two ratings is
+    # the amount of points lost for their difference
+    steps = np.arange(1, num_options, dtype=np.int64)
+    return (values[:, None] > steps[None, :]) * np.float32(np.sqrt(max_points / (num_options - 1)))
+
+
+def _embed_multiple_choices(values: np.ndarray, max_points: float, num_minhashes: int, rng) -> np.ndarray:
+    # options chosen by every respondent, one column per option (the bits of the bitmasks)
+    chosen = np.unpackbits(np.ascontiguousarray(values).view(np.uint8), axis=1, bitorder="little").astype(bool)
+    num_options = chosen.shape[1]
+
+    # MinHash: for every random permutation of the options, the lowest permuted option chosen. Two respondents have the
+    # same minhash with the probability equal to the Jaccard similarity of their answers (the real MC score)
+    permutations = np.argsort(rng.random((num_minhashes, num_options)), axis=1)
+    minhashes = np.stack(
+        [np.where(chosen, permutation[None, :], num_options).min(axis=1) for permutation in permutations], axis=1
+    )
+
+    # every minhash becomes a random sign, so the expected squared distance is `(1 - Jaccard similarity) * max_points`
+    signs = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=(num_minhashes, num_options + 1))
+    return signs[np.arange(num_minhashes)[None, :], minhashes] * np.sqrt(max_points / (2 * num_minhashes))
+
+
+def embed_respondents(
+    encoded_questions: list[EncodedQuestion], num_minhashes: int = MATCHING_ANN_DEFAULT_MINHASHES, seed: int = 0
+) -> np.ndarray:
+    """
+    Embeds every respondent's responses into a vector (shape `(n, dimensions)` of `float32`), so that the squared
+    distance between two respondents approximates the amount of points they lose when matched: one-hot vectors for YN
+    and SC questions, scaled unary ratings for RT questions and signed MinHash sketches for MC questions.
+    """
+    rng = np.random.default_rng(seed)
+    parts: list[np.ndarray] = []
+
+    for encoded_question in encoded_questions:
+        question_data = encoded_question.planned_question.question_data
+        max_points = encoded_question.planned_question.max_points
+        match question_data.question_type:
+            case QuestionType.YES_NO | QuestionType.SINGLE_CHOICE:
+                parts.append(_embed_categories(encoded_question.values, max_points))
+            case QuestionType.MULTIPLE_CHOICE:
+                parts.append(_embed_multiple_choices(encoded_question.values, max_points, num_minhashes, rng))
+            case QuestionType.RATING:
+                parts.append(_embed_ratings(encoded_question.values, max_points, question_data.num_options))
+
+    if not parts:
+        return np.zeros((len(encoded_questions[0].values) if encoded_questions else 0, 0), dtype=np.float32)
+    return np.concatenate(parts, axis=1).astype(np.float32)
+
+
+class LSHIndex:
+    """
+    Random hyperplane locality sensitive hashing index: in each of the tables, respondents whose (centered) embeddings
+    are on the same sides of all the table's random hyperplanes share a bucket.
+    """
+
+    def __init__(self, embeddings: np.ndarray, num_tables: int, num_hyperplanes: int, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        centered = embeddings - embeddings.mean(axis=0, keepdims=True)
+        bit_values = np.int64(1) << np.arange(num_hyperplanes, dtype=np.int64)
+
+        # for every table: positions ordered by bucket, start and size of each bucket, bucket of each position
+        self._tables: list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = []
+        for _ in range(num_tables):
+            hyperplanes = rng.standard_normal((embeddings.shape[1], num_hyperplanes)).astype(np.float32)
+            keys = ((centered @ hyperplanes) > 0) @ bit_values
+            order = np.argsort(keys, kind="stable")
+            _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            self._tables.append((order, starts, counts, inverse))
+
+    def get_candidates(self, position: int) -> np.ndarray:
+        """Returns the (ascending, unique) positions of all respondents sharing a bucket with `position` in any table"""
+        members = []
+        for order, starts, counts, inverse in self._tables:
+            bucket = inverse[position]
+            members.append(order[starts[bucket] : starts[bucket] + counts[bucket]])
+        return np.unique(np.concatenate(members))
+
+
+def _get_num_hyperplanes(num_respondents: int, num_tables: int, num_candidates: int) -> int:
+    # so that the buckets of all tables together hold `MATCHING_ANN_CANDIDATE_OVERSAMPLING` times more respondents than
+    # there are candidates to score
+    expected_bucket_size = max(1.0, num_candidates * MATCHING_ANN_CANDIDATE_OVERSAMPLING / num_tables)
+    return max(1, int(np.round(np.log2(max(1.0, num_respondents / expected_bucket_size)))))
+
+
+def find_top_k_all_group_approximate(
+    respondents: list[Respondent],
+    encoded_questions: list[EncodedQuestion],
+    k: int,
+    num_candidates: int = MATCHING_ANN_DEFAULT_CANDIDATES,
+    num_tables: int = MATCHING_ANN_DEFAULT_TABLES,
+    num_minhashes: int = MATCHING_ANN_DEFAULT_MINHASHES,
+    seed: int = 0,
+    dtype=np.float64,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Finds (approximately) the top `k` matches of wanted genders of every respondent among all respondents.
+    Candidates are fetched from an `LSHIndex` of the respondents' embeddings, reduced to at most `num_candidates`
+    closest ones by embedding distance, and then scored exactly (the same scores as in `match_all`) to pick the top
+    `k`. Respondents with fewer than `k` candidates of wanted genders are scored against everyone instead.
+
+    Returns:
+        list[tuple[np.ndarray, np.ndarray]]: positions and compatibilities of every respondent's top matches, ordered
+            by compatibility descending (ties by position, the same as exact top-K selecting does)
+    """
+    num_respondents = len(respondents)
+    embeddings = embed_respondents(encoded_questions, num_minhashes, seed)
+    index = LSHIndex(embeddings, num_tables, _get_num_hyperplanes(num_respondents, num_tables, num_candidates), seed)
+    genders, wanted_genders = encode_genders(respondents)
+    all_positions = np.arange(num_respondents)
+
+    top_matches: list[tuple[np.ndarray, np.ndarray]] = []
+    for position in range(num_respondents):
+        candidates = index.get_candidates(position)
+        candidates = candidates[wanted_genders[position][genders[candidates]] & (candidates != position)]
+
+        if len(candidates) < k:
+            candidates = all_positions[wanted_genders[position][genders] & (all_positions != position)]
+        elif len(candidates) > num_candidates:
+            distances = ((embeddings[candidates] - embeddings[position]) ** 2).sum(axis=1)
+            candidates = np.sort(candidates[np.argpartition(distances, num_candidates - 1)[:num_candidates]])
+
+        scores = calculate_compatibility_block(encoded_questions, np.array([position]), candidates)[0].astype(dtype)
+        top_candidate_is = select_top_k(scores, np.arange(len(candidates)), k)
+        top_matches.append((candidates[top_candidate_is], scores[top_candidate_is]))
+
+    return top_matches
+
+
+def match_top_k_approximate(
+    respondents: list[Respondent],
+    question_plan: QuestionPlan,
+    k: int,
+    num_candidates: int = MATCHING_ANN_DEFAULT_CANDIDATES,
+    num_tables: int = MATCHING_ANN_DEFAULT_TABLES,
+    num_minhashes: int = MATCHING_ANN_DEFAULT_MINHASHES,
+    block_size: int = MATCHING_DEFAULT_BLOCK_SIZE,
+    seed: int = 0,
+    dtype=np.float64,
+    verbose: bool = True,
+) -> TopKTable:
+    """
+    Same as `match_top_k.match_top_k_streaming`, but the top matches in the group of all respondents are found
+    approximately (see `find_top_k_all_group_approximate`), so no respondent is scored against everyone. The top
+    matches in every other group are found exactly, scoring only the members of the group against each other.
+    """
+    if verbose:
+        print(
+            f"Finding top {k} matches of {len(respondents)} respondents in every group "
+            f"({num_candidates} approximate candidates in group '{ALL_MATCHES_GROUP_CODE}')..."
+        )
+
+    encoded_questions = encode_questions(respondents, question_plan)
+    genders, wanted_genders = encode_genders(respondents)
+    top_k_table = TopKTable(k)
+
+    # group of all respondents
+    all_group_top_matches = find_top_k_all_group_approximate(
+        respondents, encoded_questions, k, num_candidates, num_tables, num_minhashes, seed, dtype
+    )
+    for respondent, (top_positions, top_scores) in zip(respondents, all_group_top_matches):
+        if ALL_MATCHES_GROUP_CODE not in respondent.groups:
+            continue
+        top_k_table.set_top_matches(
+            respondent.id,
+            ALL_MATCHES_GROUP_CODE,
+            [(respondents[position].id, score) for position, score in zip(top_positions.tolist(), top_scores.tolist())],
+        )
+
+    # other groups, every group value's members against each other
+    group_members: dict[tuple[str, str], list[int]] = {}
+    for position, respondent in enumerate(respondents):
+        for group_code, group_value in respondent.groups.items():
+            # TODO: Implement NO_RESPONSE
+            if group_code == ALL_MATCHES_GROUP_CODE or group_value == NO_RESPONSE_GROUP_VALUE:
+                continue
+            group_members.setdefault((group_code, group_value), []).append(position)
+
+    for (group_code, _), members in group_members.items():
+        members = np.array(members, dtype=np.int64)
+        for row_start in range(0, len(members), block_size):
+            rows = members[row_start : row_start + block_size]
+            block = calculate_compatibility_block(encoded_questions, rows, members).astype(dtype)
+            block_eligible = wanted_genders[rows][:, genders[members]] & (rows[:, None] != members[None, :])
+
+            for block_row_i, position in enumerate(rows.tolist()):
+                top_member_is = select_top_k(block[block_row_i], np.flatnonzero(block_eligible[block_row_i]), k)
+                top_k_table.set_top_matches(
+                    respondents[position].id,
+                    group_code,
+                    [(respondents[members[i]].id, float(block[block_row_i, i])) for i in top_member_is.tolist()],
+                )
+
+    if verbose:
+        print(f"Successfully found top matches of {len(respondents)} respondents!\n")
+
+    return top_k_table
@@ -0,0 +1,111 @@
+import numpy as np
+
+from matching.match_vectorized import (
+    calculate_compatibility_block,
+    encode_questions,
+    iter_upper_triangle_blocks,
+    write_block_to_upper_triangle,
+)
+from matching.question_plan import QuestionPlan
+from utils.classes.respondent import Respondent
+from utils.classes.sparse_match_table import SparseMatchTable
+from utils.constants import MATCHING_DEFAULT_BLOCK_SIZE
+from utils.upper_triangle import num_pairs
+
+
+def get_gender_buckets(respondents: list[Respondent]) -> list[list[int]]:
+    """
+    Splits respondents into buckets of the same gender and the same genders they want to be matched with.
+    Returns the positions (in `respondents`) of every bucket's respondents, buckets ordered by their first respondent.
+    """
+    buckets: dict[tuple, list[int]] = {}
+    for position, respondent in enumerate(respondents):
+        buckets.setdefault((respondent.gender, frozenset(respondent.match_genders)), []).append(position)
+    return list(buckets.values())
+
+
+def is_gender_eligible(respondent1: Respondent, respondent2: Respondent) -> bool:
+    """Whether at least one of the respondents wants to be matched with the gender of the other one (would see them)"""
+    return respondent2.gender in respondent1.match_genders or respondent1.gender in respondent2.match_genders
+
+
+def iter_gender_eligible_bucket_pairs(respondents: list[Respondent], buckets: list[list[int]]):
+    """Yields `(bucket1 index, bucket2 index)`, the first not greater than the second, of all bucket pairs to score"""
+    for bucket1_i, bucket1 in enumerate(buckets):
+        for bucket2_i in range(bucket1_i, len(buckets)):
+            bucket2 = buckets[bucket2_i]
+            if bucket1_i == bucket2_i and len(bucket1) < 2:
+                continue
+            if is_gender_eligible(respondents[bucket1[0]], respondents[bucket2[0]]):
+                yield bucket1_i, bucket2_i
+
+
+def count_gender_eligible_pairs(respondents: list[Respondent]) -> int:
+    """Returns the amount of pairs of respondents where at least one of them would see the other one in results"""
+    buckets = get_gender_buckets(respondents)
+    return sum(
+        (
+            num_pairs(len(buckets[bucket1_i]))
+            if bucket1_i == bucket2_i
+            else len(buckets[bucket1_i]) * len(buckets[bucket2_i])
+        )
+        for bucket1_i, bucket2_i in iter_gender_eligible_bucket_pairs(respondents, buckets)
+    )
+
+
+def match_all_respondents_gender_pruned(
+    respondents: list[Respondent],
+    question_plan: QuestionPlan,
+    block_size: int = MATCHING_DEFAULT_BLOCK_SIZE,
+    verbose: bool = True,
+) -> SparseMatchTable:
+    """
+    Same as `match_vectorized.match_all_respondents_vectorized`, but only scores pairs where at least one of the
+    respondents wants to be matched with the gender of the other one, as the other pairs are never shown in results.
+    Respondents are first split into gender buckets (see `get_gender_buckets`), so whole bucket pairs are either
+    scored or skipped.
+    """
+    buckets = get_gender_buckets(respondents)
+    bucket_pairs = list(iter_gender_eligible_bucket_pairs(respondents, buckets))
+
+    if verbose:
+        print(
+            f"Matching {len(respondents)} respondents in {len(buckets)} gender buckets "
+            f"(numpy engine, block size {block_size})..."
+        )
+
+    encoded_questions = encode_questions(respondents, question_plan)
+    match_table = SparseMatchTable([[respondents[position].id for position in bucket] for bucket in buckets])
+    bucket_positions = [np.array(bucket, dtype=np.int64) for bucket in buckets]
+
+    for bucket1_i, bucket2_i in bucket_pairs:
+        positions1 = bucket_positions[bucket1_i]
+        positions2 = bucket_positions[bucket2_i]
+
+        if bucket1_i == bucket2_i:
+            scores = match_table.add_within_bucket(bucket1_i).scores
+            for row_start, row_end, col_start, col_end in iter_upper_triangle_blocks(len(positions1), block_size):
+                block = calculate_compatibility_block(
+                    encoded_questions, positions1[row_start:row_end], positions1[col_start:col_end]
+                )
+                write_block_to_upper_triangle(scores, block, row_start, col_start, len(positions1))
+            continue
+
+        scores = match_table.add_between_buckets(bucket1_i, bucket2_i)
+        for row_start in range(0, len(positions1), block_size):
+            row_end = min(row_start + block_size, len(positions1))
+            for col_start in range(0, len(positions2), block_size):
+                col_end = min(col_start + block_size, len(positions2))
+                scores[row_start:row_end, col_start:col_end] = calculate_compatibility_block(
+                    encoded_questions, positions1[row_start:row_end], positions2[col_start:col_end]
+                )
+
+    if verbose:
+        num_all_pairs = num_pairs(len(respondents))
+        num_skipped_pairs = num_all_pairs - match_table.num_stored_pairs
+        print(
+            f"Successfully matched {len(respondents)}! Skipped {num_skipped_pairs} of {num_all_pairs} pairs "
+            f"({num_skipped_pairs / max(1, num_all_pairs):.1%}) that neither respondent would see.\n"
+        )
+
+    return match_table
@@ -0,0 +1,73 @@
+import numpy as np
+
+from matching.match_top_k import encode_genders
+from matching.match_vectorized import calculate_compatibility_block, encode_questions
+from matching.question_plan import QuestionPlan
+from utils.classes.respondent import Respondent
+from utils.constants import MATCHING_DEFAULT_BLOCK_SIZE
+
+
+def get_changed_respondents(
+    respondents: list[Respondent], match_fingerprints: dict[int, str | None]
+) -> tuple[list[Respondent], list[int]]:
+    """
+    Compares respondents with the fingerprints of their data from when their match results were last calculated.
+
+    Returns:
+        tuple[list[Respondent], list[int]]: respondents that are new or whose data changed, and ids of respondents
+            that have match fingerprints, but are no longer among `respondents`
+    """
+    changed_respondents = [
+        respondent for respondent in respondents if match_fingerprints.get(respondent.id) != respondent.get_fingerprint()
+    ]
+    respondent_ids = {respondent.id for respondent in respondents}
+    removed_respondent_ids = [resp_id for resp_id in match_fingerprints if resp_id not in respondent_ids]
+    return changed_respondents, removed_respondent_ids
+
+
+def match_changed_respondents(
+    respondents: list[Respondent],
+    question_plan: QuestionPlan,
+    changed_respondent_ids: set[int],
+    block_size: int = MATCHING_DEFAULT_BLOCK_SIZE,
+    prune_by_gender: bool = False,
+    dtype=np.float64,
+):
+    """
+    Scores only the pairs that involve at least one changed respondent (changed x all, instead of all x all).
+    Yields `(resp1_id, resp2_id, compatibility)` with `resp1_id < resp2_id`, each pair once. Compatibilities are rounded
+    to `dtype`, the same as the ones stored by the other engines.
+    If `prune_by_gender`, pairs where neither respondent wants to be matched with the gender of the other one are
+    skipped (the same as in `match_gender_pruned`).
+    """
+    encoded_questions = encode_questions(respondents, question_plan)
+    respondent_ids = [respondent.id for respondent in respondents]
+    changed_positions = np.array(
+        [position for position, resp_id in enumerate(respondent_ids) if resp_id in changed_respondent_ids],
+        dtype=np.int64,
+    )
+    is_changed = np.zeros(len(respondents), dtype=bool)
+    is_changed[changed_positions] = True
+    all_positions = np.arange(len(respondents))
+    if prune_by_gender:
+        genders, wanted_genders = encode_genders(respondents)
+
+    for block_start in range(0, len(changed_positions), block_size):
+        rows = changed_positions[block_start : block_start + block_size]
+        block = calculate_compatibility_block(encoded_questions, rows, slice(0, len(respondents))).astype(dtype)
+
+        for block_row_i, resp1_position in enumerate(rows.tolist()):
+            # a pair of two changed respondents is in both of their rows, so it is only taken from the row of the one
+            # positioned first
+            is_column = ~is_changed | (all_positions > resp1_position)
+            if prune_by_gender:
+                is_column &= wanted_genders[resp1_position][genders] | wanted_genders[:, genders[resp1_position]]
+            columns = np.flatnonzero(is_column)
+            columns = columns[columns != resp1_position]
+            resp1_id = respondent_ids[resp1_position]
+            for resp2_position, compatibility in zip(columns.tolist(), block[block_row_i, columns].tolist()):
+                resp2_id = respondent_ids[resp2_position]
+                if resp1_id < resp2_id:
+                    yield resp1_id, resp2_id, compatibility
+                else:
+                    yield resp2_id, resp1_id, compatibility
@@ -0,0 +1,108 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from matching.match_vectorized import (
+    EncodedQuestion,
+    calculate_compatibility_block,
+    encode_questions,
+    iter_upper_triangle_blocks,
+    write_block_to_upper_triangle,
+)
+from matching.question_plan import QuestionPlan
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.classes.respondent import Respondent
+from utils.constants import MATCHING_DEFAULT_TILE_SIZE
+from utils.upper_triangle import num_pairs
+
+
+# state of each worker process, set once by `_init_worker` so that it is not sent with every tile
+_worker_encoded_questions: list[EncodedQuestion] | None = None
+_worker_shared_memory: SharedMemory | None = None
+_worker_scores: np.ndarray | None = None
+_worker_num_respondents: int = 0
+
+
+def _init_worker(encoded_questions: list[EncodedQuestion], shared_memory_name: str, num_respondents: int, dtype):
+    global _worker_encoded_questions, _worker_shared_memory, _worker_scores, _worker_num_respondents
+
+    _worker_encoded_questions = encoded_questions
+    # the parent process owns the shared memory and unlinks it once all tiles are scored
+    _worker_shared_memory = SharedMemory(name=shared_memory_name)
+    _worker_scores = np.ndarray((num_pairs(num_respondents),), dtype=dtype, buffer=_worker_shared_memory.buf)
+    _worker_num_respondents = num_respondents
+
+
+def _score_tile(tile: tuple[int, int, int, int]) -> int:
+    """Scores a tile and writes it straight into the shared scores array. Returns the amount of pairs scored."""
+    row_start, row_end, col_start, col_end = tile
+    block = calculate_compatibility_block(
+        _worker_encoded_questions, slice(row_start, row_end), slice(col_start, col_end)
+    )
+    write_block_to_upper_triangle(_worker_scores, block, row_start, col_start, _worker_num_respondents)
+    return block.size
+
+
+def score_upper_triangle_parallel(
+    encoded_questions: list[EncodedQuestion],
+    num_respondents: int,
+    num_workers: int | None = None,
+    tile_size: int = MATCHING_DEFAULT_TILE_SIZE,
+    dtype=np.float64,
+) -> np.ndarray:
+    """
+    Scores the upper triangle of the compatibility matrix in tiles using a pool of `num_workers` processes (if `None`,
+    the amount of cpus). Workers write into a shared memory buffer, so no scores are sent back between processes.
+    Returns a copy of the buffer as a flat upper triangle array (see `utils.upper_triangle`) of type `dtype`.
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+
+    num_scores = num_pairs(num_respondents)
+    # shared memory can not be of size 0
+    shared_memory = SharedMemory(create=True, size=max(1, num_scores * np.dtype(dtype).itemsize))
+    try:
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_worker,
+            initargs=(encoded_questions, shared_memory.name, num_respondents, dtype),
+        ) as executor:
+            # consume the results so that any exception raised in a worker is raised here
+            for _ in executor.map(_score_tile, iter_upper_triangle_blocks(num_respondents, tile_size)):
+                pass
+
+        scores = np.ndarray((num_scores,), dtype=dtype, buffer=shared_memory.buf).copy()
+    finally:
+        shared_memory.close()
+        shared_memory.unlink()
+
+    return scores
+
+
+def match_all_respondents_parallel(
+    respondents: list[Respondent],
+    question_plan: QuestionPlan,
+    num_workers: int | None = None,
+    tile_size: int = MATCHING_DEFAULT_TILE_SIZE,
+    verbose: bool = True,
+) -> DenseMatchTable:
+    """
+    Same as `match_vectorized.match_all_respondents_vectorized`, but the tiles of the compatibility matrix are scored in
+    parallel by a pool of processes. The results are exactly the same as those of the serial engines.
+    """
+    if verbose:
+        print(
+            f"Matching {len(respondents)} respondents (parallel engine, {num_workers or os.cpu_count()} workers, tile size {tile_size})..."
+        )
+
+    encoded_questions = encode_questions(respondents, question_plan)
+    scores = score_upper_triangle_parallel(encoded_questions, len(respondents), num_workers, tile_size)
+
+    match_table = DenseMatchTable([respondent.id for respondent in respondents], scores)
+
+    if verbose:
+        print(f"Successfully matched {len(respondents)}!\n")
+
+    return match_table
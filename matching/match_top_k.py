@@ -0,0 +1,169 @@
+import numpy as np
+
+from matching.match_vectorized import calculate_compatibility_block, encode_questions
+from matching.question_plan import QuestionPlan
+from utils.classes.gender import Gender
+from utils.classes.respondent import Respondent
+from utils.classes.top_k_table import TopKTable
+from utils.constants import MATCHING_TOP_K_BLOCK_ELEMENTS, NO_RESPONSE_GROUP_VALUE
+
+
+def encode_genders(respondents: list[Respondent]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns `(genders, wanted_genders)`: the code of every respondent's gender (shape `(n,)`), and whether every
+    respondent wants to be matched with each gender (shape `(n, number of genders)`)
+    """
+    gender_codes = {gender: code for code, gender in enumerate(Gender)}
+    genders = np.array([gender_codes[respondent.gender] for respondent in respondents], dtype=np.int64)
+    wanted_genders = np.zeros((len(respondents), len(gender_codes)), dtype=bool)
+    for respondent_i, respondent in enumerate(respondents):
+        for gender in respondent.match_genders:
+            wanted_genders[respondent_i, gender_codes[gender]] = True
+    return genders, wanted_genders
+
+
+def _encode_group_values(respondents: list[Respondent]) -> dict[str, np.ndarray]:
+    """Returns, for every group code, the code of every respondent's value in that group (`-1` if not in the group)"""
+    group_codes = list(dict.fromkeys(code for respondent in respondents for code in respondent.groups))
+
+    encoded_group_values: dict[str, np.ndarray] = {}
+    for group_code in group_codes:
+        value_codes: dict[str, int] = {}
+        encoded_group_values[group_code] = np.array(
+            [
+                value_codes.setdefault(respondent.groups[group_code], len(value_codes))
+                if group_code in respondent.groups
+                else -1
+                for respondent in respondents
+            ],
+            dtype=np.int64,
+        )
+    return encoded_group_values
+
+
+def select_top_k(row_scores: np.ndarray, candidates: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns the positions of (at most) `k` candidates with the highest scores, ordered by score descending. Candidates
+    with equal scores are ordered by position, the same as a stable sort of all candidates would order them.
+
+    Parameters:
+        row_scores (np.ndarray): scores of all respondents
+        candidates (np.ndarray): positions (ascending) of the respondents that can be selected
+    """
+    candidate_scores = row_scores[candidates]
+    if len(candidates) > k:
+        # find the k-th highest score without sorting, keep everyone above it and fill up to k with those equal to it
+        threshold = np.partition(candidate_scores, len(candidates) - k)[len(candidates) - k]
+        above = candidate_scores > threshold
+        num_at_threshold_needed = k - np.count_nonzero(above)
+        at_threshold = np.flatnonzero(candidate_scores == threshold)[:num_at_threshold_needed]
+        above[at_threshold] = True
+        candidates = candidates[above]
+        candidate_scores = candidate_scores[above]
+
+    # order by score descending, and by position (ascending) when scores are equal
+    return candidates[np.lexsort((candidates, -candidate_scores))]
+
+
+def match_top_k_streaming(
+    respondents: list[Respondent],
+    question_plan: QuestionPlan,
+    k: int,
+    block_size: int | None = None,
+    dtype=np.float64,
+    verbose: bool = True,
+) -> TopKTable:
+    """
+    Finds the top `k` matches of every respondent in every group they belong to, without ever holding the whole
+    compatibility matrix: scores are calculated for `block_size` respondents (rows) against everyone at a time, the
+    top matches of those rows are kept and the block is thrown away.
+    Only matches of the genders the respondent wants to be matched with are kept (the same as in result generating).
+
+    Parameters:
+        block_size (int | None): amount of rows scored at once. If `None`, as many rows as fit in
+            `MATCHING_TOP_K_BLOCK_ELEMENTS` scores
+        dtype: type to which compatibilities are rounded before selecting (the same as stored in a `DenseMatchTable`,
+            so ties are resolved the same way as when generating results from the database)
+    """
+    num_respondents = len(respondents)
+    if block_size is None:
+        block_size = max(1, MATCHING_TOP_K_BLOCK_ELEMENTS // max(1, num_respondents))
+
+    if verbose:
+        print(f"Finding top {k} matches of {num_respondents} respondents in every group (block size {block_size})...")
+
+    encoded_questions = encode_questions(respondents, question_plan)
+    genders, wanted_genders = encode_genders(respondents)
+    group_values = _encode_group_values(respondents)
+    top_k_table = TopKTable(k)
+
+    for row_start in range(0, num_respondents, block_size):
+        row_end = min(row_start + block_size, num_respondents)
+        block = calculate_compatibility_block(
+            encoded_questions, slice(row_start, row_end), slice(0, num_respondents)
+        ).astype(dtype)
+        # which respondents every row wants to be matched with, by gender
+        block_eligible = wanted_genders[row_start:row_end][:, genders]
+
+        for block_row_i in range(row_end - row_start):
+            resp_i = row_start + block_row_i
+            _set_top_matches_in_groups(
+                top_k_table, respondents, resp_i, block[block_row_i], block_eligible[block_row_i], group_values
+            )
+
+    if verbose:
+        print(f"Successfully found top matches of {num_respondents} respondents!\n")
+
+    return top_k_table
+
+
+def top_k_from_match_table(respondents: list[Respondent], match_table, k: int) -> TopKTable:
+    """
+    Finds the top `k` matches of every respondent in every group they belong to from already calculated match results,
+    reading the compatibilities of one respondent at a time (`match_table` is a `DenseMatchTable`, `MappedMatchTable`
+    or `LazyMatchTable`). Only matches of wanted genders are kept and pairs without a score are never matches; ties are
+    resolved by the order of `respondents`, the same as when generating results from all match results.
+    """
+    genders, wanted_genders = encode_genders(respondents)
+    group_values = _encode_group_values(respondents)
+    # positions of the respondents (in the order of `respondents`) in the rows of the match table
+    table_positions = np.array([match_table.get_position(respondent.id) for respondent in respondents], dtype=np.int64)
+    top_k_table = TopKTable(k)
+
+    for resp_i, respondent in enumerate(respondents):
+        row_scores = match_table.get_respondent_scores(respondent.id)[table_positions]
+        row_eligible = wanted_genders[resp_i][genders] & ~np.isnan(row_scores)
+        _set_top_matches_in_groups(top_k_table, respondents, resp_i, row_scores, row_eligible, group_values)
+
+    return top_k_table
+
+
+def _set_top_matches_in_groups(
+    top_k_table: TopKTable,
+    respondents: list[Respondent],
+    resp_i: int,
+    row_scores: np.ndarray,
+    row_eligible: np.ndarray,
+    group_values: dict[str, np.ndarray],
+):
+    """
+    Selects the top matches of the respondent at position `resp_i` in every group they belong to among the eligible
+    respondents of `row_eligible` (which is modified) with the scores of `row_scores`
+    """
+    respondent = respondents[resp_i]
+    # a respondent is never their own match
+    row_eligible[resp_i] = False
+
+    for group_code, group_value in respondent.groups.items():
+        # TODO: Implement NO_RESPONSE
+        if group_value == NO_RESPONSE_GROUP_VALUE:
+            continue
+
+        values = group_values[group_code]
+        candidates = np.flatnonzero(row_eligible & (values == values[resp_i]))
+        top_positions = select_top_k(row_scores, candidates, top_k_table.k).tolist()
+        top_k_table.set_top_matches(
+            respondent.id,
+            group_code,
+            [(respondents[position].id, float(row_scores[position])) for position in top_positions],
+        )
@@ -0,0 +1,202 @@
+from typing import Callable
+
+import numpy as np
+
+from matching.question_plan import PlannedQuestion, QuestionPlan
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.classes.question_data import QuestionData, QuestionType
+from utils.classes.respondent import Respondent
+from utils.constants import MATCHING_DEFAULT_BLOCK_SIZE
+from utils.upper_triangle import row_offset
+
+
+class EncodedQuestion:
+    """
+    A single question's responses of all respondents encoded into a numpy array, so that the points of a whole block of
+    respondent pairs can be calculated at once.
+
+    Attributes:
+        planned_question (PlannedQuestion): the question as prepared in the `QuestionPlan`
+        values (np.ndarray): for YN and SC questions - category codes (shape `(n,)`), for RT questions - the ratings
+            (shape `(n,)`), for MC questions - bitmasks of chosen options (shape `(n, num_words)` of `uint64`)
+        block_scorer (Callable): function, specialized for the type of the question, that calculates the points of a
+            block of respondent pairs
+    """
+
+    def __init__(self, planned_question: PlannedQuestion, values: np.ndarray, block_scorer: Callable):
+        self.planned_question = planned_question
+        self.values = values
+        self.block_scorer = block_scorer
+
+
+def _encode_categories(responses: list) -> np.ndarray:
+    # give each distinct answer its own code, so comparing answers becomes comparing ints
+    codes: dict[str, int] = {}
+    return np.array([codes.setdefault(response, len(codes)) for response in responses], dtype=np.int32)
+
+
+def _encode_ratings(responses: list) -> np.ndarray:
+    return np.array(responses, dtype=np.int64)
+
+
+def _encode_multiple_choices(responses: list) -> np.ndarray:
+    # give each distinct option its own bit, and a response becomes the set of bits of the options chosen
+    # (if there are more than 64 distinct options, the bits are spread over several words)
+    option_bits: dict[str, int] = {}
+    for response in responses:
+        for option in response:
+            option_bits.setdefault(option, len(option_bits))
+
+    num_words = max(1, (len(option_bits) + 63) // 64)
+    bitmasks = np.zeros((len(responses), num_words), dtype=np.uint64)
+    for respondent_i, response in enumerate(responses):
+        for option in response:
+            bit = option_bits[option]
+            bitmasks[respondent_i, bit // 64] |= np.uint64(1 << (bit % 64))
+    return bitmasks
+
+
+_POPCOUNT_TABLE = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Returns the amount of set bits in `uint64` words, summed over the last axis"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    # older numpy versions do not have bitwise_count, so count bits of each byte using a lookup table
+    as_bytes = np.ascontiguousarray(words).view(np.uint8)
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.int64)
+
+
+def _calc_block_points_yn_or_sc(values: np.ndarray, rows, cols, qd: QuestionData) -> np.ndarray:
+    # same formulas as the scorers in `question_plan`, only for a whole block at once
+    return np.where(values[rows][:, None] == values[cols][None, :], qd.max_points, 0.0)
+
+
+def _calc_block_points_mc(values: np.ndarray, rows, cols, qd: QuestionData) -> np.ndarray:
+    values1 = values[rows][:, None, :]
+    values2 = values[cols][None, :, :]
+    num_of_matching_answers = _popcount(values1 & values2)
+    num_of_answers_chosen = _popcount(values1 | values2)
+    return num_of_matching_answers / num_of_answers_chosen * qd.max_points
+
+
+def _calc_block_points_rating(values: np.ndarray, rows, cols, qd: QuestionData) -> np.ndarray:
+    difference = np.abs(values[rows][:, None] - values[cols][None, :])
+    num_options = qd.num_options
+    return (num_options - difference - 1) / (num_options - 1) * qd.max_points
+
+
+def encode_questions(respondents: list[Respondent], plan: QuestionPlan) -> list[EncodedQuestion]:
+    """Encodes the responses of all respondents to every question into arrays (in the order of the `plan`)"""
+    encoded_questions: list[EncodedQuestion] = []
+
+    # responses of all respondents to each question (columns of the respondents' response vectors)
+    response_columns = list(zip(*plan.get_response_vectors(respondents))) or [() for _ in plan.questions]
+
+    for planned_question, responses in zip(plan.questions, response_columns):
+        match planned_question.question_data.question_type:
+            case QuestionType.YES_NO | QuestionType.SINGLE_CHOICE:
+                encoded_question = EncodedQuestion(
+                    planned_question, _encode_categories(responses), _calc_block_points_yn_or_sc
+                )
+            case QuestionType.MULTIPLE_CHOICE:
+                encoded_question = EncodedQuestion(
+                    planned_question, _encode_multiple_choices(responses), _calc_block_points_mc
+                )
+            case QuestionType.RATING:
+                encoded_question = EncodedQuestion(
+                    planned_question, _encode_ratings(responses), _calc_block_points_rating
+                )
+
+        encoded_questions.append(encoded_question)
+
+    return encoded_questions
+
+
+def _num_indexes(indexes) -> int:
+    # slices are always given with both start and stop
+    if isinstance(indexes, slice):
+        return indexes.stop - indexes.start
+    return len(indexes)
+
+
+def calculate_compatibility_block(encoded_questions: list[EncodedQuestion], rows, cols) -> np.ndarray:
+    """
+    Calculates the compatibilities between respondents at `rows` and respondents at `cols` (indexes of respondents,
+    either slices or index arrays). Returns a `float64` array of shape `(len(rows), len(cols))`.
+
+    The points are summed in the same order as in `match_all._match_2_respondents` (the order of the `QuestionPlan`),
+    so the results are exactly the same as those of the pure python engine.
+    """
+    points = None
+    max_points = 0.0
+    for encoded_question in encoded_questions:
+        question_data = encoded_question.planned_question.question_data
+        question_points = encoded_question.block_scorer(encoded_question.values, rows, cols, question_data)
+
+        if points is None:
+            points = 0.0 + question_points
+        else:
+            points += question_points
+        max_points += encoded_question.planned_question.max_points
+
+    # if max points is somehow 0 (or there are no questions), can not divide by 0 and thus match is also 0%
+    if points is None or max_points == 0.0:
+        return np.zeros((_num_indexes(rows), _num_indexes(cols)), dtype=np.float64)
+
+    return points / max_points * 100
+
+
+def iter_upper_triangle_blocks(num_respondents: int, block_size: int):
+    """
+    Yields `(row_start, row_end, col_start, col_end)` of all blocks that cover the upper triangle of the
+    respondent x respondent compatibility matrix
+    """
+    for row_start in range(0, num_respondents, block_size):
+        row_end = min(row_start + block_size, num_respondents)
+        for col_start in range(row_start, num_respondents, block_size):
+            col_end = min(col_start + block_size, num_respondents)
+            yield row_start, row_end, col_start, col_end
+
+
+def write_block_to_upper_triangle(
+    scores: np.ndarray, block: np.ndarray, row_start: int, col_start: int, num_respondents: int
+):
+    """Writes the pairs of a block that are above the diagonal into `scores` (a flat upper triangle array)"""
+    col_end = col_start + block.shape[1]
+    for block_row_i in range(block.shape[0]):
+        resp1_i = row_start + block_row_i
+        # only pairs above the diagonal are stored (a block on the diagonal also contains pairs below it)
+        first_col = max(col_start, resp1_i + 1)
+        if first_col >= col_end:
+            continue
+        # pairs of a single row are stored next to each other, so the whole row part is copied at once
+        start = row_offset(resp1_i, num_respondents) + (first_col - resp1_i - 1)
+        scores[start : start + col_end - first_col] = block[block_row_i, first_col - col_start :]
+
+
+def match_all_respondents_vectorized(
+    respondents: list[Respondent],
+    question_plan: QuestionPlan,
+    block_size: int = MATCHING_DEFAULT_BLOCK_SIZE,
+    verbose: bool = True,
+) -> DenseMatchTable:
+    """
+    Same as `match_all.match_all_respondents`, but the responses are encoded into numpy arrays once and the
+    compatibility matrix is calculated block by block (`block_size` x `block_size` pairs at once).
+    """
+    if verbose:
+        print(f"Matching {len(respondents)} respondents (numpy engine, block size {block_size})...")
+
+    encoded_questions = encode_questions(respondents, question_plan)
+    match_table = DenseMatchTable([respondent.id for respondent in respondents])
+
+    for row_start, row_end, col_start, col_end in iter_upper_triangle_blocks(len(respondents), block_size):
+        block = calculate_compatibility_block(encoded_questions, slice(row_start, row_end), slice(col_start, col_end))
+        write_block_to_upper_triangle(match_table.scores, block, row_start, col_start, len(respondents))
+
+    if verbose:
+        print(f"Successfully matched {len(respondents)}!\n")
+
+    return match_table
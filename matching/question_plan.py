@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, TypeAlias
+
+from utils.classes.question_data import QuestionData, QuestionType
+from utils.classes.respondent import Respondent
+
+
+_Scorer: TypeAlias = Callable[[Any, Any], float]
+
+
+def _score_yn_or_sc(max_points: float, r1, r2) -> float:
+    # if answers match, get all points, if not: 0 points
+    return max_points if r1 == r2 else 0
+
+
+def _score_mc(max_points: float, r1, r2) -> float:
+    # divide the amount of matching answers by the amount of total answers chosen
+    return len(r1 & r2) / len(r1 | r2) * max_points
+
+
+def _score_rating(max_points: float, num_options: int, r1, r2) -> float:
+    # points would be calculated by (num_options - difference) / (num_options) * max_points,
+    # but difference can only be between 0 and num_options - 1.
+    # So, to make it so respondents get 0 points when their chosen ratings differ at biggest possible
+    # value, we use difference - 1
+    return (num_options - abs(r1 - r2) - 1) / (num_options - 1) * max_points
+
+
+def _make_scorer(question_data: QuestionData) -> _Scorer:
+    """
+    Returns the scorer of the question's type bound to its parameters (a module level function, so that plans can be
+    sent to other processes)
+    """
+    match question_data.question_type:
+        case QuestionType.YES_NO | QuestionType.SINGLE_CHOICE:
+            return partial(_score_yn_or_sc, question_data.max_points)
+        case QuestionType.MULTIPLE_CHOICE:
+            return partial(_score_mc, question_data.max_points)
+        case QuestionType.RATING:
+            return partial(_score_rating, question_data.max_points, question_data.num_options)
+    raise ValueError(f"Invalid question type '{question_data.question_type}'")
+
+
+@dataclass(frozen=True)
+class PlannedQuestion:
+    """
+    Attributes:
+        position (int): index of the response to this question in a respondent's response vector
+        question_data (QuestionData): the data of the question
+        max_points (float): the maximum amount of points that can be received for this question
+        scorer (Callable[[Any, Any], float]): function, specialized for the type of the question, that calculates the
+            points (between `0` and `max_points` inclusive) that both respondents receive for their two responses
+    """
+
+    position: int
+    question_data: QuestionData
+    max_points: float
+    scorer: _Scorer
+
+
+@dataclass(frozen=True)
+class QuestionPlan:
+    """
+    All questions prepared for matching once, so that matching a pair of respondents needs no question lookups nor
+    dispatching on question types.
+
+    Attributes:
+        questions (tuple[PlannedQuestion, ...]): all questions in the order of the csv header
+        scorers (tuple[Callable[[Any, Any], float], ...]): scorers of `questions`, in the same order
+        total_max_points (float): the sum of max points of all questions (summed in the same order as they are scored)
+    """
+
+    questions: tuple[PlannedQuestion, ...]
+    scorers: tuple[_Scorer, ...]
+    total_max_points: float
+
+    def get_response_vector(self, respondent: Respondent) -> tuple:
+        """Returns the respondent's responses ordered by the positions of the questions in this plan"""
+        if len(respondent.responses) != len(self.questions):
+            raise ValueError(
+                f"Respondent (id: {respondent.id}) has responses to {len(respondent.responses)} questions, but there are {len(self.questions)} questions"
+            )
+
+        try:
+            return tuple(respondent.responses[question.question_data.id] for question in self.questions)
+        except KeyError as e:
+            raise ValueError(f"Respondent (id: {respondent.id}) does not have a response to the question with id {e}")
+
+    def get_response_vectors(self, respondents: list[Respondent]) -> list[tuple]:
+        return [self.get_response_vector(respondent) for respondent in respondents]
+
+
+def compile_question_plan(questions_data: list[QuestionData]) -> QuestionPlan:
+    """Prepares the questions read from the csv header (in the same order) for matching"""
+    questions: list[PlannedQuestion] = []
+    total_max_points = 0.0
+
+    for position, question_data in enumerate(questions_data):
+        questions.append(
+            PlannedQuestion(position, question_data, question_data.max_points, _make_scorer(question_data))
+        )
+        total_max_points += question_data.max_points
+
+    return QuestionPlan(tuple(questions), tuple(question.scorer for question in questions), total_max_points)
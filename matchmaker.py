@@ -104,13 +104,29 @@ from commands.match import handle_match
 from commands.generate import handle_generate
 from commands.mail import handle_mail
 from commands.doctor import handle_doctor
-from utils.cli import _type_positive_integer, _type_precision_integer
+from commands.assets import handle_assets
+from utils.cli import _type_pdf_batch_size, _type_positive_integer, _type_precision_integer
 from utils.constants import (
     CLI_DEFAULT_MAX_RESULTS_IN_GROUP,
     CSV_DATA_DEFAULT_DELIMITER,
     CSV_DATA_DEFAULT_MULTI_DELIMITER,
     DEFAULT_RESULTS_PRECISION,
+    MATCHING_DEFAULT_BLOCK_SIZE,
+    MATCHING_DEFAULT_TILE_SIZE,
+    MATCH_TABLE_DEFAULT_CACHE_ROWS,
+    MATCH_RESULTS_STORAGE_BLOB,
+    MATCH_RESULTS_STORAGE_MMAP,
+    MATCH_RESULTS_STORAGE_ROWS,
+    MATCHING_ENGINE_NUMPY,
+    MATCHING_ENGINE_PARALLEL,
+    MATCHING_ENGINE_PYTHON,
+    PROFILE_DEFAULT_REPORT_PATH,
+    PROJECT_DATABASE_SEPARATE,
+    PROJECT_DATABASE_SHARED,
+    PROJECT_DATABASES_DIR,
+    RESULT_FILES_DEFAULT_PDF_BATCH_SIZE,
 )
+from utils.profiling import finish_profile, print_profile_summary, start_profile
 
 
 def main():
@@ -145,6 +161,21 @@ def main():
         epilog="""If you wish to know how to format the csv data file, what headings are required and how to correctly specify them, please refer to this project's README.md\nAll information besides on how to use this program is specified in this project's README.md file.\n\nThis is Weekintas""",
     )
 
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=PROFILE_DEFAULT_REPORT_PATH,
+        default=None,
+        metavar="REPORT_PATH",
+        help=f'Time the stages of the command and count what was done, and write a JSON run report to REPORT_PATH (default: "{PROFILE_DEFAULT_REPORT_PATH}")',
+    )
+    parser.add_argument(
+        "--profile-pstats",
+        default=None,
+        metavar="PSTATS_PATH",
+        help="Also profile all function calls with cProfile and dump the stats to PSTATS_PATH (implies '--profile'). Calls in worker processes are not profiled, only their stages and counters",
+    )
+
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     # ---- project ----
@@ -168,6 +199,12 @@ def main():
         default=CSV_DATA_DEFAULT_MULTI_DELIMITER,
         help='Delimiter character for the CSV file (default: "%(default)s") which separates multiple options in a single cell',
     )
+    project_create.add_argument(
+        "--database",
+        choices=(PROJECT_DATABASE_SHARED, PROJECT_DATABASE_SEPARATE),
+        default=PROJECT_DATABASE_SHARED,
+        help=f'Where to store the data of the project: "{PROJECT_DATABASE_SHARED}" - in the main database with all other projects, "{PROJECT_DATABASE_SEPARATE}" - in its own database file in "{PROJECT_DATABASES_DIR}" (deleting the project removes the file, and commands on other projects never wait for it). Default: "%(default)s"',
+    )
 
     project_delete = project_sub.add_parser("delete")
     project_delete.add_argument("project_id", type=project_id)
@@ -178,9 +215,75 @@ def main():
     project_create.add_argument("project_id", type=project_id)
     project_create.add_argument("csv_path")
 
+    project_migrate_scores = project_sub.add_parser("migrate_scores")
+    project_migrate_scores.add_argument("project_id", type=project_id)
+
     # ---- match ----
     match_parser = subparsers.add_parser("match")
     match_parser.add_argument("project_id", type=project_id)
+    match_parser.add_argument(
+        "--engine",
+        choices=(MATCHING_ENGINE_PYTHON, MATCHING_ENGINE_NUMPY, MATCHING_ENGINE_PARALLEL),
+        default=MATCHING_ENGINE_PYTHON,
+        metavar="ENGINE",
+        help='Matching engine to use: "python" (scores pairs one by one), "numpy" (scores blocks of pairs at once) or "parallel" (scores tiles of pairs in a pool of processes) (default: "%(default)s")',
+    )
+    match_parser.add_argument(
+        "--block-size",
+        type=_type_positive_integer,
+        default=MATCHING_DEFAULT_BLOCK_SIZE,
+        metavar="NUM",
+        help="Amount of respondents in one side of a block scored at once by the numpy engine (default: %(default)s)",
+    )
+    match_parser.add_argument(
+        "--workers",
+        type=_type_positive_integer,
+        default=None,
+        metavar="NUM",
+        help="Amount of worker processes used by the parallel engine (default: amount of cpus)",
+    )
+    match_parser.add_argument(
+        "--tile-size",
+        type=_type_positive_integer,
+        default=MATCHING_DEFAULT_TILE_SIZE,
+        metavar="NUM",
+        help="Amount of respondents in one side of a tile scored at once by a worker of the parallel engine (default: %(default)s)",
+    )
+    match_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only calculate match results of respondents who are new or whose data changed since the last match (scored with the numpy engine), keeping all other match results",
+    )
+    match_parser.add_argument(
+        "--prune-by-gender",
+        action="store_true",
+        help="Only calculate match results of pairs where at least one respondent wants to be matched with the gender of the other one (scored with the numpy engine), as other pairs are never shown in results",
+    )
+    match_parser.add_argument(
+        "--storage",
+        choices=(MATCH_RESULTS_STORAGE_ROWS, MATCH_RESULTS_STORAGE_BLOB, MATCH_RESULTS_STORAGE_MMAP),
+        default=MATCH_RESULTS_STORAGE_ROWS,
+        metavar="STORAGE",
+        help='How match results are stored: "rows" (one database row per pair), "blob" (all scores as a single binary score matrix in the database, loaded with one read) or "mmap" (a memory-mapped score matrix file next to the database, of which only the respondents used are read) (default: "%(default)s")',
+    )
+    match_parser.add_argument(
+        "--verify-full",
+        action="store_true",
+        help="Read and hash the csv data file again even if its size, modification time and inode did not change since it were last hashed",
+    )
+    match_top_k_group = match_parser.add_mutually_exclusive_group()
+    match_top_k_group.add_argument(
+        "--top-k",
+        type=_type_positive_integer,
+        default=None,
+        metavar="NUM",
+        help="Also keep a table of the top NUM matches of every respondent in each of their groups, which 'generate' reads instead of all match results when no group shows more matches. Once set, the table is rebuilt every time respondents are matched",
+    )
+    match_top_k_group.add_argument(
+        "--no-top-k",
+        action="store_true",
+        help="Stop keeping the table of top matches of every respondent (see '--top-k') and delete it",
+    )
 
     # ---- generate ----
     generate_parser = subparsers.add_parser("generate")
@@ -244,6 +347,47 @@ def main():
         metavar="MODE",
         help='What to do if an output file exists: "override", "ask", or "skip" (default: "%(default)s")',
     )
+    generate_parser.add_argument(
+        "--top-k-only",
+        action="store_true",
+        help="Find only the top matches of every respondent in each group straight from the csv data file (block by block, never holding all match results), instead of loading match results from the database",
+    )
+    generate_parser.add_argument(
+        "--approximate-candidates",
+        type=_type_positive_integer,
+        default=None,
+        metavar="NUM",
+        help="Find the top matches among all respondents approximately (implies '--top-k-only'): only NUM candidates of similar answers are scored for each respondent (see 'python -m benchmarks.ann_recall' for the accuracy)",
+    )
+    generate_parser.add_argument(
+        "--respondents",
+        type=int,
+        nargs="+",
+        default=None,
+        metavar="ID",
+        help="Generate result files only for respondents with these ids (by default, for all respondents)",
+    )
+    generate_parser.add_argument(
+        "--match-cache-rows",
+        type=_type_positive_integer,
+        default=MATCH_TABLE_DEFAULT_CACHE_ROWS,
+        metavar="NUM",
+        help="When match results are stored as rows, they are read one respondent at a time: the most respondents' match results kept in memory at once (default: %(default)s)",
+    )
+    generate_parser.add_argument(
+        "--workers",
+        type=_type_positive_integer,
+        default=1,
+        metavar="NUM",
+        help="Amount of worker processes rendering and writing result files, e.g. to run many wkhtmltopdf conversions at once (default: %(default)s)",
+    )
+    generate_parser.add_argument(
+        "--pdf-batch-size",
+        type=_type_pdf_batch_size,
+        default=RESULT_FILES_DEFAULT_PDF_BATCH_SIZE,
+        metavar="NUM",
+        help="Amount of pdf result files rendered by a single wkhtmltopdf run, which is then split into a file of each respondent (requires pypdf). Starting wkhtmltopdf costs more than rendering a page, see 'python -m benchmarks.pdf_batch' (default: %(default)s)",
+    )
 
     # ---- mail ----
     mail_parser = subparsers.add_parser("mail")
@@ -302,6 +446,11 @@ def main():
         action="store_true",
         help="Whether to continue sending emails to all other recipients after one fails being sent.",
     )
+    mail_send.add_argument(
+        "--verify-full",
+        action="store_true",
+        help="Read and hash all email body and attachment files from the database again even if their size, modification time and inode did not change since they were last hashed",
+    )
 
     mail_status = mail_sub.add_parser("status")
     mail_status.add_argument("project_id", type=project_id)
@@ -309,10 +458,42 @@ def main():
     # ---- doctor ----
     doctor_parser = subparsers.add_parser("doctor")
     doctor_parser.add_argument("project_id", type=project_id)
+    doctor_parser.add_argument(
+        "--verify-full",
+        action="store_true",
+        help="Read and hash the csv data file again even if its size, modification time and inode did not change since it were last hashed",
+    )
+
+    # ---- assets ----
+    assets_parser = subparsers.add_parser(
+        "assets", help="Vendor and check external resources (e.g. fonts) of templates of pdf and png result files"
+    )
+    assets_sub = assets_parser.add_subparsers(dest="action", required=True)
+    assets_sub.add_parser(
+        "vendor",
+        help="Download linked stylesheets and the fonts they load into the templates (needs network access, run once)",
+    )
+    assets_sub.add_parser(
+        "check", help="Fail if templates still link external resources, which rendering would wait on the network for"
+    )
 
     args = parser.parse_args()
+    if args.profile_pstats and not args.profile:
+        args.profile = PROFILE_DEFAULT_REPORT_PATH
+
+    if not args.profile:
+        _execute_command(args)
+        return
+
+    start_profile(" ".join(filter(None, (args.command, getattr(args, "action", None)))), args.profile_pstats)
+    try:
+        _execute_command(args)
+    finally:
+        profile = finish_profile(args.profile)
+        print_profile_summary(profile, args.profile)
+
 
-    # ---- execute ----
+def _execute_command(args):
     if args.command == "project":
         handle_project(args)
     elif args.command == "match":
@@ -323,6 +504,8 @@ def main():
         handle_mail(args)
     elif args.command == "doctor":
         handle_doctor(args)
+    elif args.command == "assets":
+        handle_assets(args)
 
 
 if __name__ == "__main__":
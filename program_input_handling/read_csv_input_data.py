@@ -1,6 +1,7 @@
 import csv
 from dataclasses import dataclass
 
+from matching.question_plan import QuestionPlan, compile_question_plan
 from utils.classes.gender import Gender
 from utils.classes.question_data import QuestionData, QuestionType
 from utils.classes.respondent import Respondent
@@ -167,10 +168,11 @@ def _get_respondent_from_row(row: list[str], row_i: int, h_indexes: _HeaderIndex
 
 def read_data_from_csv(
     file_name: str, delimiter: str, multi_delimiter: str, verbose: bool = True
-) -> tuple[list[str], list[QuestionData], list[Respondent]]:
+) -> tuple[list[str], QuestionPlan, list[Respondent]]:
     """
-    Returns a tuple with two items:
-        `list[QuestionData]`: a list with all questions' data
+    Returns a tuple with three items:
+        `list[str]`: codes of all groups
+        `QuestionPlan`: all questions, prepared for matching once as soon as the header is read
         `dict[int, Respondent]`: a dictionary with all respondent ids and respondents themselves (not a `list[Respondent]`, because program often looks up respondents by their id and it is way more simple and faster to have this as a dictionary rather than a list)
     """
     if verbose:
@@ -180,7 +182,6 @@ def read_data_from_csv(
     if not file_exists(file_name):
         raise FileNotFoundError(f"The csv input file {file_name} does not exist")
 
-    questions_data: list[QuestionData] = []
     all_respondents: list[Respondent] = []
 
     with open(file_name, "r", encoding="UTF-8", newline="") as file:
@@ -189,7 +190,7 @@ def read_data_from_csv(
         header = next(csv_reader)
         h_indexes = _process_respondent_csv_data_header(header)  # indexes where particular data is in the header
         group_codes = list(h_indexes.match_groups.values())
-        questions_data = list(h_indexes.question_data_columns.values())
+        question_plan = compile_question_plan(list(h_indexes.question_data_columns.values()))
         # process each respondent and use row index as the respondent's id
         for row_i, row in enumerate(csv_reader):
             respondent = _get_respondent_from_row(row, row_i, h_indexes, multi_delimiter, delimiter.join(row))
@@ -200,6 +201,7 @@ def read_data_from_csv(
         respondent.groups[ALL_MATCHES_GROUP_CODE] = ALL_MATCHES_GROUP_CODE
 
     if verbose:
-        print(f"Successfully read data of {len(questions_data)} questions and {len(all_respondents)} respondents!\n")
+        num_questions = len(question_plan.questions)
+        print(f"Successfully read data of {num_questions} questions and {len(all_respondents)} respondents!\n")
 
-    return group_codes, questions_data, all_respondents
+    return group_codes, question_plan, all_respondents
@@ -0,0 +1,14 @@
+from dataclasses import dataclass
+
+from utils.classes.respondent import Respondent
+from utils.classes.result_file_type import ResultFileType
+
+
+@dataclass(frozen=True)
+class GeneratedResultFile:
+    file_type: ResultFileType
+    path: str
+    respondent: Respondent
+    # of the content written, computed while writing (the file is not read back)
+    sha256: str
+    size_bytes: int
@@ -1,95 +1,208 @@
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import replace
+from functools import partial
+from itertools import chain
+
+import numpy as np
 
 from utils.classes.match_group import MatchGroup
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.classes.lazy_match_table import LazyMatchTable
+from utils.classes.mapped_match_table import MappedMatchTable
 from utils.classes.match_table import MatchTable
 from utils.classes.matchmaking_config import MatchmakingConfig
 from utils.classes.respondent import Respondent
+from utils.classes.respondent_index import RespondentIndex
 from utils.classes.result_file_type import ResultFileType
+from utils.classes.top_k_table import TopKTable
+from utils.constants import NO_RESPONSE_GROUP_VALUE, RESULT_FILES_WORKER_CHUNK_SIZE
+from utils.filesystem import make_parent_dirs_for_files
+from utils.profiling import is_profiling, merge_worker_profile, run_in_worker
+from results.class_generated_result_file import GeneratedResultFile
 from results.class_match_group_results import MatchGroupResults, MatchResult
-from results.generate_result_file import generate_result_file
+from results.generate_result_file import generate_pdf_result_files, generate_result_file
 from results.result_filepath import get_respondent_result_file_path
 
 
 def generate_result_files(
     match_groups_data: list[MatchGroup],
     all_respondents: list[Respondent],
-    match_table: MatchTable,
+    match_table: MatchTable | DenseMatchTable | MappedMatchTable | LazyMatchTable | TopKTable,
     file_types: list[ResultFileType],
     config: MatchmakingConfig,
     verbose: bool = True,
-) -> list[tuple[ResultFileType, str, Respondent]]:
+    respondents_to_generate: list[Respondent] | None = None,
+    workers: int = 1,
+    pdf_batch_size: int = 1,
+) -> list[GeneratedResultFile]:
     """
     Parameters:
+        match_table (MatchTable | DenseMatchTable | MappedMatchTable | LazyMatchTable | TopKTable): compatibilities
+            between all respondents, or only the precomputed top matches of every respondent in each of their groups
         file_type (str): either `ResultFileType.PDF` or `ResultFileType.EMAIL`, or both in a list
         file_exists_behaviour (str): what to do when file already exists: `"override"`, `"ask"` or `"skip"`
         verbose (bool): should print messages when generating
+        respondents_to_generate (list[Respondent] | None): respondents to generate result files for (their matches are
+            still looked for among all respondents). If `None`, all respondents
+        workers (int): amount of processes rendering and writing result files. Match groups of respondents are still
+            assembled in this process (config callables of match groups can not be sent to other processes)
+        pdf_batch_size (int): amount of pdf result files rendered by a single wkhtmltopdf run (see
+            `generate_pdf_result_files`). If 1, every pdf result file is rendered on its own
     """
     # count how many of each file type we generated for printing if verbose
     # (defaultdict so no need to check if f_type exists as key when incrementing)
     generated_file_counts: dict[str, int] = defaultdict(int)
-    generated_file_paths: list[tuple[ResultFileType, str, Respondent]] = []
-
-    for respondent in all_respondents:
-        match_groups = get_respondent_match_groups_for_template(
-            respondent, all_respondents, match_table, match_groups_data
+    generated_files: list[GeneratedResultFile] = []
+    respondents_by_id = {respondent.id: respondent for respondent in all_respondents}
+    respondent_index = RespondentIndex(all_respondents, match_groups_data)
+    if respondents_to_generate is None:
+        respondents_to_generate = all_respondents
+
+    # decide what to do with files that already exist before generating any (asking is only possible in this process)
+    # and make their directories once
+    filepaths = {
+        (respondent.id, f_type): get_respondent_result_file_path(
+            respondent,
+            config.result_output_dir,
+            f_type.get_result_file_extension(),
+            config.separate_result_files_by_groups,
         )
-        top_match = get_top_match(match_groups)
-
-        for f_type in file_types:
-            filepath = get_respondent_result_file_path(
-                respondent,
-                config.result_output_dir,
-                f_type.get_result_file_extension(),
-                config.separate_result_files_by_groups,
+        for respondent in respondents_to_generate
+        for f_type in file_types
+    }
+    filepaths_to_create = set(
+        make_parent_dirs_for_files(list(filepaths.values()), config.on_result_file_exists_behaviour)
+    )
+
+    def iter_result_file_jobs():
+        for respondent in respondents_to_generate:
+            respondent_filepaths = [
+                (f_type, filepaths[(respondent.id, f_type)])
+                for f_type in file_types
+                if filepaths[(respondent.id, f_type)] in filepaths_to_create
+            ]
+            if not respondent_filepaths:
+                continue
+
+            match_groups = get_respondent_match_groups_for_template(
+                respondent, all_respondents, match_table, match_groups_data, respondents_by_id, respondent_index
             )
-
-            filepath = generate_result_file(
-                respondent,
-                match_groups,
-                top_match,
-                filepath,
-                f_type,
-                config,
-                print_generating_message=True,
-                print_generated_message=False,
-            )
-            # if file was successfully generated, add it to the count for display
-            if filepath:
-                generated_file_counts[f_type] += 1
-                generated_file_paths.append((f_type, filepath, respondent))
+            top_match = get_top_match(match_groups)
+            for f_type, filepath in respondent_filepaths:
+                yield respondent, match_groups, top_match, filepath, f_type, config
+
+    def iter_result_file_batches():
+        # pdf result files are put into batches of `pdf_batch_size`, all other files are batches of their own
+        pdf_jobs = []
+        for job in iter_result_file_jobs():
+            if pdf_batch_size > 1 and job[4] == ResultFileType.PDF:
+                pdf_jobs.append(job)
+                if len(pdf_jobs) == pdf_batch_size:
+                    yield pdf_jobs
+                    pdf_jobs = []
+            else:
+                yield [job]
+        if pdf_jobs:
+            yield pdf_jobs
+
+    def iter_generated_files():
+        if workers == 1:
+            yield from chain.from_iterable(map(_generate_result_file_batch, iter_result_file_batches()))
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # (stages and counters of the workers are collected in profiles of their own and merged into this one)
+            for generated_batch, worker_profile in executor.map(
+                partial(run_in_worker, is_profiling(), _generate_result_file_batch),
+                iter_result_file_batches(),
+                chunksize=RESULT_FILES_WORKER_CHUNK_SIZE,
+            ):
+                merge_worker_profile(worker_profile)
+                yield from generated_batch
+
+    for generated_file in iter_generated_files():
+        # if file was successfully generated, add it to the count for display
+        if generated_file:
+            generated_file_counts[generated_file.file_type] += 1
+            generated_files.append(generated_file)
 
     if verbose:
         file_type_strings = [f"{f_count} {f_type}" for f_type, f_count in generated_file_counts.items()]
-        print(f"Generated {', '.join(file_type_strings)} result files for {len(all_respondents)} respondents!")
+        print(f"Generated {', '.join(file_type_strings)} result files for {len(respondents_to_generate)} respondents!")
+
+    return generated_files
 
-    return generated_file_paths
+
+def _generate_result_file_batch(jobs: list[tuple]) -> list[GeneratedResultFile | None]:
+    """
+    Generates result files of `(respondent, match groups, top match, filepath, file type, config)`, more than one only
+    if they are pdf files rendered at once (in a worker process too, so it is a function of the module)
+    """
+    if len(jobs) > 1:
+        return generate_pdf_result_files(jobs)
+
+    respondent, match_groups, top_match, filepath, f_type, config = jobs[0]
+    return [
+        generate_result_file(
+            respondent,
+            match_groups,
+            top_match,
+            filepath,
+            f_type,
+            config,
+            print_generating_message=True,
+            print_generated_message=False,
+            resolve_existing_file=False,
+        )
+    ]
 
 
 def get_respondent_match_groups_for_template(
     respondent: Respondent,
     all_respondents: list[Respondent],
-    match_table: MatchTable,
+    match_table: MatchTable | DenseMatchTable | MappedMatchTable | LazyMatchTable | TopKTable,
     match_groups_data: list[MatchGroup],
+    respondents_by_id: dict[int, Respondent] | None = None,
+    respondent_index: RespondentIndex | None = None,
 ) -> list[MatchGroupResults]:
-    matches_of_wanted_genders = _get_matches_of_wanted_gender(respondent, all_respondents)
-    matches_in_match_groups = _get_matches_in_match_groups(respondent, matches_of_wanted_genders)
+    """
+    `respondents_by_id` and `respondent_index` (of `all_respondents` and `match_groups_data`) are built if not given,
+    pass them when getting match groups of many respondents
+    """
+    if respondent_index is None:
+        respondent_index = RespondentIndex(all_respondents, match_groups_data)
+
+    # (the respondent's row of scores, read when the first group is selected from)
+    row_scores: dict[int, np.ndarray] = {}
+    can_select_from_rows = isinstance(match_table, (DenseMatchTable, MappedMatchTable, LazyMatchTable))
+    if isinstance(match_table, TopKTable):
+        # top matches (of wanted genders) in every group are already known, no need to look through all respondents
+        if respondents_by_id is None:
+            respondents_by_id = {r.id: r for r in all_respondents}
+        matches_in_match_groups = _get_top_k_matches_in_match_groups(respondent, match_table, respondents_by_id)
+    else:
+        # only members of the respondent's groups with wanted genders, from the index
+        matches_in_match_groups = respondent_index.get_matches_in_groups(respondent)
 
     unordered_match_groups_for_template: list[tuple[MatchGroup, MatchGroupResults]] = []
 
     for group_code, matches_in_group in matches_in_match_groups.items():
         # get match group for which to generate
-        match_group = next((group for group in match_groups_data if group.code == group_code), None)
-        if not match_group:
-            raise ValueError(f"Match group with code {group_code} does not exist")
+        match_group = respondent_index.get_match_group(group_code)
 
         # if match group is invisible, skip it, since takes no effect in result generating
         if not match_group.get_is_visible(match_groups_data, respondent):
             continue
 
         match_group_title = match_group.get_title(match_groups_data, respondent)
+        select_top_matches = None
+        if can_select_from_rows:
+            select_top_matches = partial(
+                _select_top_matches, respondent, group_code, match_table, respondent_index, row_scores
+            )
         match_group_results = _get_match_group_results(
-            respondent, match_table, match_groups_data, matches_in_group, match_group
+            respondent, match_table, match_groups_data, matches_in_group, match_group, select_top_matches
         )
 
         # if has no results in it and should not be displayed when empty, do not append to the list of match groups
@@ -126,45 +239,55 @@ def get_top_match(ordered_match_groups_for_template: list[MatchGroupResults]):
     return top_match
 
 
-def _get_matches_of_wanted_gender(respondent: Respondent, matches: list[Respondent]) -> list[Respondent]:
-    return [match for match in matches if match.gender in respondent.match_genders and match.id != respondent.id]
-
-
-def _get_matches_in_match_groups(respondent: Respondent, matches: list[Respondent]) -> dict[str, list[Respondent]]:
-    """Returns the dict, where keys are codes of groups, values lists of matches in said groups"""
+def _get_top_k_matches_in_match_groups(
+    respondent: Respondent, top_k_table: TopKTable, respondents_by_id: dict[int, Respondent]
+) -> dict[str, list[Respondent]]:
+    """Same as `RespondentIndex.get_matches_in_groups`, but only with top matches of each group from `top_k_table`"""
     matches_in_groups: dict[str, list[Respondent]] = {}
 
     for group_code, value in respondent.groups.items():
         # TODO: Implement NO_RESPONSE
-        if value == "NO_RESPONSE":
+        if value == NO_RESPONSE_GROUP_VALUE:
             continue
 
-        matches_in_groups[group_code] = []
-        for match in matches:
-            if match.groups.get(group_code) == value:
-                matches_in_groups[group_code].append(match)
+        matches_in_groups[group_code] = [
+            respondents_by_id[match_id] for match_id, _ in top_k_table.get_top_matches(respondent.id, group_code)
+        ]
 
     return matches_in_groups
 
 
-def _get_match_group_results(respondent, match_table, match_groups_data, matches_in_group, match_group):
+def _get_match_group_results(
+    respondent, match_table, match_groups_data, matches_in_group, match_group, select_top_matches=None
+):
+    """
+    If `select_top_matches` is given, it is called with the amount of results to show and returns the top matches
+    (or `None` if it cannot select them), instead of scoring and sorting all matches in the group
+    """
+    # get only X amount of top matches, as dictated by match_group
+    #     Note: if num_max_matches_in_group is 'None', it just retrieves all matches from the list
+    num_max_matches_in_group = match_group.get_num_results_to_show(match_groups_data, respondent)
+    top_matches = None
+    if select_top_matches is not None and num_max_matches_in_group is not None:
+        top_matches = select_top_matches(num_max_matches_in_group)
+    if top_matches is None:
+        # order the matches by compatibility descending
+        top_matches = sorted(
+            ((match, match_table.get_compatibility(respondent.id, match.id)) for match in matches_in_group),
+            key=lambda scored_match: scored_match[1],
+            reverse=True,
+        )[:num_max_matches_in_group]
+
+    # (names and descriptions, which may be formatted by callables, only of the matches shown)
     match_group_results = [
         MatchResult(
             match_group.get_match_fullname(match_groups_data, respondent, match),
             match_group.get_match_description(match_groups_data, respondent, match),
-            match_table.get_compatibility(respondent.id, match.id),
+            compatibility,
         )
-        for match in matches_in_group
+        for match, compatibility in top_matches
     ]
 
-    # order the results by compatibility descending
-    match_group_results.sort(key=lambda result: result.compatibility, reverse=True)
-
-    # get only X amount of top matches, as dictated by match_group
-    #     Note: if num_max_matches_in_group is 'None', it just retrieves all matches from the list
-    num_max_matches_in_group = match_group.get_num_results_to_show(match_groups_data, respondent)
-    match_group_results = match_group_results[:num_max_matches_in_group]
-
     # round each compatibility score as dictated by precision param of match_group
     precision = match_group.get_result_precision(match_groups_data, respondent)
     if precision is not None:
@@ -173,3 +296,54 @@ def _get_match_group_results(respondent, match_table, match_groups_data, matches
         ]
 
     return match_group_results
+
+
+def _select_top_matches(
+    respondent: Respondent,
+    group_code: str,
+    match_table: DenseMatchTable | MappedMatchTable | LazyMatchTable,
+    respondent_index: RespondentIndex,
+    row_scores: dict[int, np.ndarray],
+    num_matches: int,
+) -> list[tuple[Respondent, float]] | None:
+    """
+    Selects the `num_matches` matches with the highest compatibilities in the respondent's group straight from the
+    respondent's row of scores (masked by the members of the group with wanted genders), without sorting all of them.
+    Returns `(match, compatibility)` ordered the same as sorting all matches would, or `None` if all matches are shown
+    anyway or some of their compatibilities are missing (so they are scored one by one, raising an error like before)
+
+    :param row_scores: the respondent's row of scores by their id, read into it if it is not there yet
+    """
+    positions = respondent_index.get_group_member_positions(
+        group_code, respondent.groups[group_code], respondent.match_genders
+    )
+    positions = positions[positions != respondent_index.get_position(respondent.id)]
+    if num_matches < 0 or num_matches >= len(positions):
+        return None
+
+    if respondent.id not in row_scores:
+        row_scores[respondent.id] = match_table.get_respondent_scores(respondent.id)
+    scores = row_scores[respondent.id][respondent_index.get_match_table_positions(match_table)[positions]]
+    if np.isnan(scores).any():
+        return None
+
+    top_positions = _get_top_positions(scores, num_matches)
+    return [
+        (respondent_index.respondents[position], compatibility)
+        for position, compatibility in zip(positions[top_positions].tolist(), scores[top_positions].tolist())
+    ]
+
+
+def _get_top_positions(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns positions of the `k` highest scores ordered by score descending, ties by position (the same as the first
+    `k` of a stable sort), with a partial selection instead of sorting all scores
+    """
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+
+    kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+    higher_positions = np.flatnonzero(scores > kth_score)
+    tied_positions = np.flatnonzero(scores == kth_score)[: k - len(higher_positions)]
+    top_positions = np.concatenate((higher_positions, tied_positions))
+    return top_positions[np.lexsort((top_positions, -scores[top_positions]))]
@@ -1,57 +1,122 @@
+import hashlib
+import io
+import os
+import tempfile
+from itertools import pairwise
+from xml.etree import ElementTree
+
 import pdfkit
 import imgkit
 
 from utils.classes.matchmaking_config import MatchmakingConfig
 from utils.classes.respondent import Respondent
 from utils.classes.result_file_type import ResultFileType
+from results.class_generated_result_file import GeneratedResultFile
 from results.class_match_group_results import MatchGroupResults, MatchResult
 from results.generate_html_content import get_result_file_html_content
 from utils.filesystem import make_parent_dirs_for_file
+from utils.profiling import count, stage
 
 
-def _generate_html_result_file(result_file_path: str, file_html_content: str) -> bool:
-    """Returns bool whether file generation succeeded"""
+def _write_result_file(result_file_path: str, file_content: bytes, file_kind: str) -> bytes | None:
+    """Returns the content written, `None` if writing failed"""
     try:
-        with open(result_file_path, "w", encoding="UTF-8") as html_file:
-            html_file.write(file_html_content)
+        with open(result_file_path, "wb") as result_file:
+            result_file.write(file_content)
     except OSError as e:
-        print(f"Failed to generate html results file '{result_file_path}': {e}")
-        return False
+        print(f"Failed to generate {file_kind} results file '{result_file_path}': {e}")
+        return None
+
+    return file_content
+
 
-    return True
+def _generate_html_result_file(result_file_path: str, file_html_content: str) -> bytes | None:
+    """Returns the content of the file generated, `None` if file generation failed"""
+    return _write_result_file(result_file_path, file_html_content.encode("UTF-8"), "html")
 
 
+# (local file access lets the vendored fonts of templates be read from their `file://` urls, see `inline_asset`)
 _PDFKIT_OPTIONS = {
     "encoding": "UTF-8",
     "margin-top": "1cm",
     "margin-right": "1cm",
     "margin-bottom": "0cm",
     "margin-left": "1cm",
+    "enable-local-file-access": None,
 }
 
-_IMGKIT_OPTIONS = {"quality": 80, "width": 1024, "log-level": "error"}
+_IMGKIT_OPTIONS = {"quality": 80, "width": 1024, "log-level": "error", "enable-local-file-access": None}
 
 
-def _generate_pdf_result_file(result_file_path: str, file_html_content: str) -> bool:
-    """Returns bool whether file generation succeeded"""
+def _generate_pdf_result_file(result_file_path: str, file_html_content: str) -> bytes | None:
+    """Returns the content of the file generated, `None` if file generation failed"""
     try:
-        pdfkit.from_string(file_html_content, result_file_path, options=_PDFKIT_OPTIONS)
+        # (rendered into memory, so that the content is at hand for hashing without reading the file back)
+        pdf_content = pdfkit.from_string(file_html_content, False, options=_PDFKIT_OPTIONS)
     except Exception as e:
         print(f"Failed to generate pdf results file '{result_file_path}': {e}")
-        return False
+        return None
+
+    return _write_result_file(result_file_path, pdf_content, "pdf")
 
-    return True
 
+def _get_document_start_pages(outline_path: str, num_documents: int, num_pages: int) -> list[int]:
+    """
+    Returns the (0 based) page each of the documents rendered into one pdf starts at, from the outline that
+    wkhtmltopdf dumped: it has a top level item (with the document's headings as children) for every document, at the
+    page the document starts at
+    """
+    pages = [int(item.get("page")) for item in ElementTree.parse(outline_path).getroot()]
+    if len(pages) != num_documents:
+        raise ValueError(f"Outline of the pdf has {len(pages)} documents instead of {num_documents}")
 
-def _generate_png_result_file(result_file_path: str, file_html_content: str) -> bool:
-    """Returns bool whether file generation succeeded"""
+    start_pages = [page - pages[0] for page in pages]
+    if any(next_page <= page for page, next_page in pairwise(start_pages)) or start_pages[-1] >= num_pages:
+        raise ValueError(f"Outline of the pdf has invalid pages {pages} of documents in {num_pages} pages")
+    return start_pages
+
+
+def _render_pdf_documents(html_contents: list[str]) -> list[bytes]:
+    """
+    Renders html documents with a single wkhtmltopdf run (every document starts on a new page) and splits the pdf back
+    into a pdf of each document. Returns their contents
+    """
+    # (only needed to split pdfs rendered at once)
+    from pypdf import PdfReader, PdfWriter
+
+    with tempfile.TemporaryDirectory() as directory:
+        html_paths = []
+        for document_i, html_content in enumerate(html_contents):
+            html_path = os.path.join(directory, f"{document_i}.html")
+            with open(html_path, "w", encoding="UTF-8") as html_file:
+                html_file.write(html_content)
+            html_paths.append(html_path)
+        outline_path = os.path.join(directory, "outline.xml")
+
+        pdf_content = pdfkit.from_file(html_paths, False, options={**_PDFKIT_OPTIONS, "dump-outline": outline_path})
+        reader = PdfReader(io.BytesIO(pdf_content))
+        start_pages = _get_document_start_pages(outline_path, len(html_contents), len(reader.pages))
+
+    document_contents = []
+    for start_page, end_page in zip(start_pages, [*start_pages[1:], len(reader.pages)]):
+        writer = PdfWriter()
+        for page in reader.pages[start_page:end_page]:
+            writer.add_page(page)
+        document_content = io.BytesIO()
+        writer.write(document_content)
+        document_contents.append(document_content.getvalue())
+    return document_contents
+
+
+def _generate_png_result_file(result_file_path: str, file_html_content: str) -> bytes | None:
+    """Returns the content of the file generated, `None` if file generation failed"""
     try:
-        imgkit.from_string(file_html_content, result_file_path, options=_IMGKIT_OPTIONS)
+        png_content = imgkit.from_string(file_html_content, False, options=_IMGKIT_OPTIONS)
     except Exception as e:
         print(f"Failed to generate png results file '{result_file_path}': {e}")
-        return False
+        return None
 
-    return True
+    return _write_result_file(result_file_path, png_content, "png")
 
 
 def generate_result_file(
@@ -63,15 +128,18 @@ def generate_result_file(
     config: MatchmakingConfig,
     print_generating_message: bool = True,
     print_generated_message: bool = True,
-) -> str | None:
+    resolve_existing_file: bool = True,
+) -> GeneratedResultFile | None:
     """
     Parameters:
         top_match (tuple[str, Any]): `top_match[0]` - the name of the top match, `top_match[1]` - compatibility with said match
         file_type (str | None): either 'html' or 'pdf'. If `None`, then determines file type by extension of the
             `result_file_path`
         file_exists_behaviour (str): what to do when file already exists: `"override"`, `"ask"` or `"skip"`
+        resolve_existing_file (bool): whether to make the file's directory and decide what to do if it already exists.
+            If `False`, that was already done (see `make_parent_dirs_for_files`) and the file is written
     Returns:
-        str | None: filepath of the file generated, if not generated - `None`
+        GeneratedResultFile | None: the file generated, with the hash and size of its content, if not generated - `None`
     """
 
     if print_generating_message:
@@ -80,29 +148,94 @@ def generate_result_file(
         )
 
     # get html content of file
-    result_file_html_content = get_result_file_html_content(
-        file_type, respondent, match_groups, top_match, config, file_type.get_result_file_path()
-    )
+    with stage("render template"):
+        result_file_html_content = get_result_file_html_content(
+            file_type, respondent, match_groups, top_match, config, file_type.get_result_file_path()
+        )
 
     # generate file path and if file already exists, then ask what to do
-    should_create_file = make_parent_dirs_for_file(result_file_path, config.on_result_file_exists_behaviour)
-    if not should_create_file:
-        return None
+    if resolve_existing_file:
+        should_create_file = make_parent_dirs_for_file(result_file_path, config.on_result_file_exists_behaviour)
+        if not should_create_file:
+            return None
 
     # generate file based on its type
     result_file_extension = file_type.get_result_file_extension().lower()
     if result_file_extension == "html":
-        was_file_generated = _generate_html_result_file(result_file_path, result_file_html_content)
+        with stage("write html"):
+            file_content = _generate_html_result_file(result_file_path, result_file_html_content)
     elif result_file_extension == "pdf":
-        was_file_generated = _generate_pdf_result_file(result_file_path, result_file_html_content)
+        with stage("wkhtmltopdf"):
+            file_content = _generate_pdf_result_file(result_file_path, result_file_html_content)
     elif result_file_extension == "png":
-        was_file_generated = _generate_png_result_file(result_file_path, result_file_html_content)
+        with stage("wkhtmltoimage"):
+            file_content = _generate_png_result_file(result_file_path, result_file_html_content)
     else:
         raise ValueError(f"Invalid file_type result file extension: {result_file_extension}")
+    if file_content is None:
+        return None
+    count("files_rendered")
 
-    if print_generated_message and was_file_generated:
+    if print_generated_message:
         print(
             f"Generated  {file_type}{"   " if file_type == ResultFileType.PDF else " "}results file: {result_file_path}"
         )
 
-    return result_file_path if was_file_generated else None
+    return GeneratedResultFile(
+        file_type, result_file_path, respondent, hashlib.sha256(file_content).hexdigest(), len(file_content)
+    )
+
+
+def generate_pdf_result_files(
+    jobs: list[tuple[Respondent, list[MatchGroupResults], MatchResult, str, ResultFileType, MatchmakingConfig]],
+) -> list[GeneratedResultFile | None]:
+    """
+    Generates pdf result files of many respondents at once: their html is rendered by a single wkhtmltopdf run (starting
+    it costs more than rendering a page) and the pdf is split into a file of each respondent by the pages they start at.
+    If wkhtmltopdf fails or the pages can not be told from its outline, every file is generated on its own instead. What to do with files that already exist must be
+    decided before (see `make_parent_dirs_for_files`)
+
+    Parameters:
+        jobs: arguments of `generate_result_file` of each file, `(respondent, match groups, top match, result file path,
+            file type, config)`
+    Returns:
+        list[GeneratedResultFile | None]: the file generated of each job, `None` if it was not generated
+    """
+    for _, _, _, result_file_path, file_type, _ in jobs:
+        print(f"Generating {file_type}   results file: {result_file_path}")
+
+    with stage("render template"):
+        html_contents = [
+            get_result_file_html_content(
+                file_type, respondent, match_groups, top_match, config, file_type.get_result_file_path()
+            )
+            for respondent, match_groups, top_match, _, file_type, config in jobs
+        ]
+
+    try:
+        with stage("wkhtmltopdf"):
+            pdf_contents = _render_pdf_documents(html_contents)
+    # (wkhtmltopdf failed, or its outline does not tell where the documents start)
+    except (OSError, ValueError) as e:
+        print(f"Failed to generate {len(jobs)} pdf results files at once ({e}). Generating them one by one...")
+        return [
+            generate_result_file(
+                *job, print_generating_message=False, print_generated_message=False, resolve_existing_file=False
+            )
+            for job in jobs
+        ]
+
+    generated_files: list[GeneratedResultFile | None] = []
+    for (respondent, _, _, result_file_path, file_type, _), pdf_content in zip(jobs, pdf_contents):
+        with stage("write pdf"):
+            file_content = _write_result_file(result_file_path, pdf_content, "pdf")
+        if file_content is None:
+            generated_files.append(None)
+            continue
+        count("files_rendered")
+        generated_files.append(
+            GeneratedResultFile(
+                file_type, result_file_path, respondent, hashlib.sha256(file_content).hexdigest(), len(file_content)
+            )
+        )
+    return generated_files
@@ -0,0 +1,37 @@
+import builtins
+import shutil
+import sys
+
+import pytest
+
+import commands.match
+import matchmaker
+import utils.sql as SQL
+
+EXAMPLE_CSV_PATH = "_examples/input_csv/groups.csv"
+
+
+@pytest.fixture
+def run_matchmaker(tmp_path, monkeypatch):
+    """
+    Runs `matchmaker.py` with the given arguments (answering its questions with `answer`) against databases and score
+    matrices in a temporary directory
+    """
+    monkeypatch.setattr(SQL, "DATABASE_PATH", str(tmp_path / "database.db"))
+    monkeypatch.setattr(SQL, "PROJECT_DATABASES_DIR", str(tmp_path / "projects"))
+    monkeypatch.setattr(commands.match, "SCORE_MATRICES_DIR", str(tmp_path / "score_matrices"))
+
+    def run(*args: str, answer: str = "y"):
+        monkeypatch.setattr(sys, "argv", ["matchmaker.py", *args])
+        monkeypatch.setattr(builtins, "input", lambda *_: answer)
+        matchmaker.main()
+
+    return run
+
+
+@pytest.fixture
+def csv_path(tmp_path) -> str:
+    """A copy of an example csv data file, which tests can change"""
+    path = tmp_path / "data.csv"
+    shutil.copy(EXAMPLE_CSV_PATH, path)
+    return str(path)
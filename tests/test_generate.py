@@ -0,0 +1,326 @@
+import hashlib
+import io
+import os
+import re
+import sys
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+import commands.generate
+import results.generate_result_file
+import utils.sql as SQL
+from benchmarks.synthetic_data import make_synthetic_questions, make_synthetic_respondents
+from commands.generate import _get_num_top_matches_needed
+from matching.match_vectorized import match_all_respondents_vectorized
+from matching.question_plan import compile_question_plan
+from results.generate_all import _select_top_matches, generate_result_files
+from results.generate_result_file import _get_document_start_pages, _render_pdf_documents, generate_pdf_result_files
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.classes.lazy_match_table import LazyMatchTable
+from utils.classes.match_group import MatchGroup
+from utils.classes.matchmaking_config import MatchmakingConfig
+from utils.classes.respondent_index import RespondentIndex
+from utils.classes.result_file_type import ResultFileType
+from utils.constants import NO_RESPONSE_GROUP_VALUE
+from utils.profiling import finish_profile, start_profile
+
+
+def _make_config(default_num_max_results_in_group: int) -> MatchmakingConfig:
+    return MatchmakingConfig(",", ";", 2, default_num_max_results_in_group, "results", False, "override")
+
+
+def test_top_matches_needed_by_callable_groups_are_found_for_every_respondent():
+    respondents = make_synthetic_respondents(10, make_synthetic_questions("YN"), seed=0)
+    match_groups = [
+        MatchGroup("ALL", num_results_to_show=3),
+        MatchGroup("CLASS", num_results_to_show=lambda groups, respondent: 2 + respondent.id),
+    ]
+    assert _get_num_top_matches_needed(match_groups, respondents, _make_config(5)) == 2 + max(
+        respondent.id for respondent in respondents
+    )
+    assert _get_num_top_matches_needed(match_groups, respondents[:2], _make_config(5)) == 5
+
+
+def test_top_matches_needed_by_groups_showing_all_are_the_most_of_the_others(capsys):
+    respondents = make_synthetic_respondents(3, make_synthetic_questions("YN"), seed=0)
+    match_groups = [
+        MatchGroup("ALL", num_results_to_show=8),
+        MatchGroup("CLASS", num_results_to_show=lambda groups, respondent: None),
+    ]
+    assert _get_num_top_matches_needed(match_groups, respondents, _make_config(5)) == 8
+    assert "Group 'CLASS' shows all matches" in capsys.readouterr().out
+
+
+def test_approximate_candidates_imply_top_k_only(run_matchmaker, csv_path, tmp_path, monkeypatch, capsys):
+    calls = []
+    match_top_k_approximate = commands.generate.match_top_k_approximate
+
+    def record_match_top_k_approximate(*args, **kwargs):
+        calls.append(args)
+        return match_top_k_approximate(*args, **kwargs)
+
+    monkeypatch.setattr(commands.generate, "match_top_k_approximate", record_match_top_k_approximate)
+    run_matchmaker("project", "create", "g1", csv_path)
+    capsys.readouterr()
+    # (not matched, so results can only be generated from the csv data)
+    run_matchmaker(
+        "generate", "g1", "EMAIL", "--approximate-candidates", "5", "--output-dir", str(tmp_path / "out"), answer="n"
+    )
+    assert len(calls) == 1
+    assert "Generated 14 email result files" in capsys.readouterr().out
+
+
+def test_pdf_batches_require_pypdf(run_matchmaker, monkeypatch, capsys):
+    # (as if pypdf was not installed)
+    monkeypatch.setitem(sys.modules, "pypdf", None)
+    with pytest.raises(SystemExit) as exit_info:
+        run_matchmaker("generate", "g1", "PDF", "--pdf-batch-size", "4")
+    assert exit_info.value.code == 2
+    assert "requires pypdf" in capsys.readouterr().err
+
+
+def test_documents_of_a_pdf_start_at_the_pages_of_their_outline_items(tmp_path):
+    # (as dumped by wkhtmltopdf's '--dump-outline', every document an item with its headings as children)
+    outline_path = tmp_path / "outline.xml"
+    outline_path.write_text(
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<outline xmlns="http://wkhtmltopdf.org/outline">'
+        '<item title="" page="1" link="" backLink=""><item title="Heading" page="1" link="" backLink=""/></item>'
+        '<item title="" page="3" link="" backLink=""/>'
+        '<item title="" page="4" link="" backLink=""/>'
+        "</outline>"
+    )
+    assert _get_document_start_pages(str(outline_path), 3, 5) == [0, 2, 3]
+    with pytest.raises(ValueError, match="instead of 2"):
+        _get_document_start_pages(str(outline_path), 2, 5)
+    with pytest.raises(ValueError, match="invalid pages"):
+        _get_document_start_pages(str(outline_path), 3, 3)
+
+
+def test_lazy_match_table_keeps_the_least_recently_used_rows(run_matchmaker, csv_path):
+    run_matchmaker("project", "create", "g1", csv_path)
+    run_matchmaker("match", "g1")
+    connection = SQL.get_connection("g1")
+    cursor = connection.cursor()
+    dense_match_table = DenseMatchTable.from_database(cursor, "g1")
+    respondent_ids = dense_match_table.respondent_ids
+    match_table = LazyMatchTable(connection, SQL.get_project_sql_id(cursor, "g1"), respondent_ids, cache_rows=2)
+
+    # (respondent looked up, and whether their row is then read from the database)
+    for resp_id, is_read in [(0, True), (1, True), (0, False), (2, True), (0, False), (1, True), (2, True), (1, False)]:
+        num_misses = match_table.misses
+        assert np.array_equal(
+            match_table.get_respondent_scores(resp_id), dense_match_table.get_respondent_scores(resp_id), equal_nan=True
+        )
+        assert match_table.misses - num_misses == is_read
+    assert (match_table.hits, match_table.misses) == (3, 5)
+
+    assert match_table.get_compatibility(3, 4) == dense_match_table.get_compatibility(3, 4)
+    assert match_table.get_respondent_compatibilities(3) == dense_match_table.get_respondent_compatibilities(3)
+    assert (match_table.hits, match_table.misses) == (4, 6)
+    connection.close()
+
+
+
+def _find_matches_in_group(respondents: list, respondent, group_code: str) -> list:
+    """Finds the respondent's matches in the group by looking through all respondents"""
+    return [
+        match
+        for match in respondents
+        if match is not respondent
+        and match.gender in respondent.match_genders
+        and match.groups.get(group_code) == respondent.groups[group_code]
+    ]
+
+
+@pytest.fixture
+def tied_respondents():
+    # (only a few different scores, so that most top matches are ties)
+    questions_data = make_synthetic_questions("YN,SC|3")
+    return questions_data, make_synthetic_respondents(50, questions_data, seed=8)
+
+
+def test_index_finds_the_matches_in_groups_of_looking_through_all_respondents(tied_respondents):
+    _, respondents = tied_respondents
+    respondent_index = RespondentIndex(respondents, [])
+    for respondent in respondents:
+        matches_in_groups = respondent_index.get_matches_in_groups(respondent)
+        assert list(matches_in_groups) == [
+            code for code, value in respondent.groups.items() if value != NO_RESPONSE_GROUP_VALUE
+        ]
+        for group_code, matches_in_group in matches_in_groups.items():
+            assert list(matches_in_group) == _find_matches_in_group(respondents, respondent, group_code)
+
+
+def test_top_matches_selected_from_rows_are_the_first_of_a_stable_sort(tied_respondents):
+    questions_data, respondents = tied_respondents
+    # (positions in the match table differ from the positions in `respondents`)
+    match_table = match_all_respondents_vectorized(
+        respondents[::-1], compile_question_plan(questions_data), verbose=False
+    )
+    respondent_index = RespondentIndex(respondents, [])
+
+    num_selected = 0
+    for respondent in respondents:
+        row_scores = {}
+        for group_code in respondent_index.get_matches_in_groups(respondent):
+            matches = _find_matches_in_group(respondents, respondent, group_code)
+            # (how matches were ordered before they were selected from rows)
+            sorted_matches = sorted(
+                ((match, match_table.get_compatibility(respondent.id, match.id)) for match in matches),
+                key=lambda scored_match: scored_match[1],
+                reverse=True,
+            )
+            for num_matches in [0, 1, 3, len(matches) - 1, len(matches), len(matches) + 1]:
+                top_matches = _select_top_matches(
+                    respondent, group_code, match_table, respondent_index, row_scores, num_matches
+                )
+                if num_matches >= len(matches):
+                    assert top_matches is None
+                elif num_matches >= 0:
+                    assert top_matches == sorted_matches[:num_matches]
+                    num_selected += 1
+    assert num_selected > len(respondents)
+
+
+def _generate_email_result_files(respondents: list, output_dir: str, workers: int) -> list[tuple]:
+    """Returns `(path relative to output_dir, respondent id, sha256, size)` of every result file generated"""
+    questions_data = make_synthetic_questions()
+    match_table = match_all_respondents_vectorized(respondents, compile_question_plan(questions_data), verbose=False)
+    match_groups = [MatchGroup(group_code, num_results_to_show=5) for group_code in respondents[0].groups]
+    config = replace(_make_config(5), result_output_dir=output_dir)
+    generated_files = generate_result_files(
+        match_groups, respondents, match_table, [ResultFileType.EMAIL], config, verbose=False, workers=workers
+    )
+    for generated_file in generated_files:
+        with open(generated_file.path, "rb") as f:
+            assert hashlib.sha256(f.read()).hexdigest() == generated_file.sha256
+    return [
+        (os.path.relpath(f.path, output_dir), f.respondent.id, f.sha256, f.size_bytes) for f in generated_files
+    ]
+
+
+def test_parallel_generation_gives_the_files_of_serial_generation(tmp_path):
+    respondents = make_synthetic_respondents(20, make_synthetic_questions(), seed=4)
+    serial_files = _generate_email_result_files(respondents, str(tmp_path / "serial"), workers=1)
+    assert len(serial_files) == len(respondents)
+    assert _generate_email_result_files(respondents, str(tmp_path / "parallel"), workers=3) == serial_files
+
+
+def test_stages_of_workers_are_merged_into_the_profile(tmp_path):
+    respondents = make_synthetic_respondents(20, make_synthetic_questions(), seed=4)
+    start_profile("generate")
+    try:
+        _generate_email_result_files(respondents, str(tmp_path / "out"), workers=3)
+    finally:
+        profile = finish_profile(str(tmp_path / "run_report.json"))
+    assert profile.counters["files_rendered"] == len(respondents)
+    assert profile.stages["render template"]["calls"] == len(respondents)
+    assert profile.stages["write html"]["calls"] == len(respondents)
+
+
+def _make_pdf(page_widths: list[int]) -> bytes:
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for page_width in page_widths:
+        writer.add_blank_page(width=page_width, height=200)
+    content = io.BytesIO()
+    writer.write(content)
+    return content.getvalue()
+
+
+def _fake_wkhtmltopdf(html_paths: list[str], output_path, options: dict) -> bytes:
+    """
+    Renders every html document (of `<p data-pages="N">`) into N pages and dumps the outline of the documents, the same
+    way wkhtmltopdf does. Pages are told apart by their width: 100 + 10 * document + page in the document
+    """
+    page_widths = []
+    outline_items = []
+    for document_i, html_path in enumerate(html_paths):
+        with open(html_path, encoding="UTF-8") as f:
+            num_pages = int(re.search(r'data-pages="(\d+)"', f.read()).group(1))
+        outline_items.append(
+            f'<item title="" page="{len(page_widths) + 1}" link="" backLink="">'
+            f'<item title="Heading" page="{len(page_widths) + 1}" link="" backLink=""/></item>'
+        )
+        page_widths.extend(100 + 10 * document_i + page_i for page_i in range(num_pages))
+    with open(options["dump-outline"], "w", encoding="UTF-8") as f:
+        f.write(
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<outline xmlns="http://wkhtmltopdf.org/outline">{"".join(outline_items)}</outline>'
+        )
+    return _make_pdf(page_widths)
+
+
+def _get_page_widths(pdf_content: bytes) -> list[int]:
+    from pypdf import PdfReader
+
+    return [int(page.mediabox.width) for page in PdfReader(io.BytesIO(pdf_content)).pages]
+
+
+def _make_pdf_jobs(tmp_path, pages_of_documents: list[int], monkeypatch) -> list[tuple]:
+    """Jobs of pdf result files whose html documents have `pages_of_documents` pages"""
+    respondents = make_synthetic_respondents(len(pages_of_documents), make_synthetic_questions("YN"), seed=0)
+    num_pages = {respondent.id: pages for respondent, pages in zip(respondents, pages_of_documents)}
+    monkeypatch.setattr(
+        results.generate_result_file,
+        "get_result_file_html_content",
+        lambda file_type, respondent, *_: f'<p data-pages="{num_pages[respondent.id]}">{respondent.id}</p>',
+    )
+    config = _make_config(5)
+    return [
+        (respondent, [], None, str(tmp_path / f"{respondent.id}.pdf"), ResultFileType.PDF, config)
+        for respondent in respondents
+    ]
+
+
+def test_pdf_rendered_at_once_is_split_into_the_documents(monkeypatch):
+    pytest.importorskip("pypdf")
+    monkeypatch.setattr(results.generate_result_file.pdfkit, "from_file", _fake_wkhtmltopdf)
+    document_contents = _render_pdf_documents([f'<p data-pages="{pages}"></p>' for pages in [2, 1, 3]])
+    assert [_get_page_widths(content) for content in document_contents] == [[100, 101], [110], [120, 121, 122]]
+
+
+def test_pdf_result_files_rendered_at_once_are_a_file_of_each_respondent(tmp_path, monkeypatch):
+    pytest.importorskip("pypdf")
+    monkeypatch.setattr(results.generate_result_file.pdfkit, "from_file", _fake_wkhtmltopdf)
+    jobs = _make_pdf_jobs(tmp_path, [1, 3, 2], monkeypatch)
+
+    generated_files = generate_pdf_result_files(jobs)
+    assert [generated_file.path for generated_file in generated_files] == [job[3] for job in jobs]
+    page_widths = []
+    for generated_file in generated_files:
+        with open(generated_file.path, "rb") as f:
+            content = f.read()
+        assert (hashlib.sha256(content).hexdigest(), len(content)) == (generated_file.sha256, generated_file.size_bytes)
+        page_widths.append(_get_page_widths(content))
+    assert page_widths == [[100], [110, 111, 112], [120, 121]]
+
+
+def test_pdf_result_files_are_rendered_one_by_one_only_if_wkhtmltopdf_fails(tmp_path, monkeypatch, capsys):
+    pytest.importorskip("pypdf")
+
+    def fail(*_, **__):
+        raise OSError("wkhtmltopdf reported an error")
+
+    monkeypatch.setattr(results.generate_result_file.pdfkit, "from_file", fail)
+    monkeypatch.setattr(
+        results.generate_result_file.pdfkit,
+        "from_string",
+        lambda html_content, output_path, options: _make_pdf([100]),
+    )
+    jobs = _make_pdf_jobs(tmp_path, [1, 2], monkeypatch)
+    generated_files = generate_pdf_result_files(jobs)
+    assert [generated_file.path for generated_file in generated_files] == [job[3] for job in jobs]
+    assert all(os.path.getsize(job[3]) == len(_make_pdf([100])) for job in jobs)
+    assert "Generating them one by one" in capsys.readouterr().out
+
+    def fail_unexpectedly(*_, **__):
+        raise RuntimeError("bug")
+
+    monkeypatch.setattr(results.generate_result_file.pdfkit, "from_file", fail_unexpectedly)
+    with pytest.raises(RuntimeError, match="bug"):
+        generate_pdf_result_files(jobs)
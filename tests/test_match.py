@@ -0,0 +1,280 @@
+import shutil
+
+import numpy as np
+import pytest
+
+import utils.sql as SQL
+from benchmarks.synthetic_data import make_synthetic_questions, make_synthetic_respondents
+from matching.match_top_k import match_top_k_streaming, top_k_from_match_table
+from matching.match_vectorized import match_all_respondents_vectorized
+from matching.question_plan import compile_question_plan
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.classes.mapped_match_table import MappedMatchTable
+from utils.constants import NO_RESPONSE_GROUP_VALUE
+
+
+def _remove_last_rows(csv_path: str, num_rows: int):
+    with open(csv_path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    with open(csv_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines[:-num_rows]) + "\n")
+
+
+def _change_rows(csv_path: str, changed_rows: dict[int, tuple[str, str]], added_rows: list[str]):
+    """Replaces `old` with `new` in the rows of `changed_rows` (by position after the header) and adds `added_rows`"""
+    with open(csv_path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    for row_i, (old, new) in changed_rows.items():
+        assert old in lines[row_i + 1]
+        lines[row_i + 1] = lines[row_i + 1].replace(old, new, 1)
+    with open(csv_path, "w", encoding="utf-8") as f:
+        f.write("\n".join([*lines, *added_rows]) + "\n")
+
+
+def _get_match_results(project_id: str) -> dict[tuple[int, int], float]:
+    connection = SQL.get_connection(project_id)
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT resp1_id, resp2_id, score FROM match_results WHERE project_id = ?",
+        (SQL.get_project_sql_id(cursor, project_id),),
+    )
+    match_results = {(resp1_id, resp2_id): score for resp1_id, resp2_id, score in cursor.fetchall()}
+    connection.close()
+    return match_results
+
+
+def _sort_top_matches(respondents: list, match_table, k: int) -> list:
+    """
+    Returns `(respondent id, group code, top matches)` of every respondent and group, the top matches found by a stable
+    sort of all matches of wanted genders in the group (ties ordered by the order of `respondents`)
+    """
+    all_top_matches = []
+    for respondent in respondents:
+        for group_code, group_value in respondent.groups.items():
+            if group_value == NO_RESPONSE_GROUP_VALUE:
+                continue
+            matches = [
+                (other.id, match_table.get_compatibility(respondent.id, other.id))
+                for other in respondents
+                if other is not respondent
+                and other.gender in respondent.match_genders
+                and other.groups.get(group_code) == group_value
+            ]
+            all_top_matches.append((respondent.id, group_code, sorted(matches, key=lambda match: -match[1])[:k]))
+    return all_top_matches
+
+
+def _get_match_fingerprints(project_id: str) -> dict:
+    connection = SQL.get_connection(project_id)
+    cursor = connection.cursor()
+    match_fingerprints = SQL.get_respondent_match_fingerprints(cursor, SQL.get_project_sql_id(cursor, project_id))
+    connection.close()
+    return match_fingerprints
+
+
+def test_full_match_forgets_removed_respondents(run_matchmaker, csv_path, tmp_path, capsys):
+    run_matchmaker("project", "create", "g1", csv_path)
+    run_matchmaker("match", "g1", "--top-k", "50")
+    num_respondents = len(_get_match_fingerprints("g1"))
+
+    _remove_last_rows(csv_path, 2)
+    run_matchmaker("project", "reset_csv", "g1", csv_path)
+    run_matchmaker("match", "g1", "--top-k", "50")
+    match_fingerprints = _get_match_fingerprints("g1")
+    assert [resp_id for resp_id, fingerprint in match_fingerprints.items() if fingerprint is None] == [
+        num_respondents - 2,
+        num_respondents - 1,
+    ]
+
+    # generated from the stored top matches, which are up to date
+    capsys.readouterr()
+    run_matchmaker("generate", "g1", "EMAIL", "--output-dir", str(tmp_path / "out"), "--on-file-exists", "override")
+    assert "Successfully saved" in capsys.readouterr().out
+
+    # the removed respondents are deleted by the next sync
+    run_matchmaker("project", "reset_csv", "g1", csv_path)
+    assert len(_get_match_fingerprints("g1")) == num_respondents - 2
+
+
+def test_match_keeps_indexes_shared_with_other_projects(run_matchmaker, csv_path, tmp_path, monkeypatch):
+    small_csv_path = str(tmp_path / "small.csv")
+    shutil.copy(csv_path, small_csv_path)
+    _remove_last_rows(small_csv_path, 5)
+    dropped_indexes_of = []
+    drop_indexes = SQL.drop_indexes
+
+    def record_drop_indexes(cursor, table_name: str) -> list[str]:
+        dropped_indexes_of.append(table_name)
+        return drop_indexes(cursor, table_name)
+
+    monkeypatch.setattr(SQL, "drop_indexes", record_drop_indexes)
+    run_matchmaker("project", "create", "g1", small_csv_path)
+    run_matchmaker("match", "g1")
+    run_matchmaker("match", "g1")
+    assert dropped_indexes_of == ["match_results", "match_results"]
+
+    # (more match results than the table holds)
+    run_matchmaker("project", "create", "g2", csv_path)
+    run_matchmaker("match", "g2")
+    assert dropped_indexes_of == ["match_results", "match_results"]
+
+
+def test_generate_reads_gender_pruning_of_the_project(run_matchmaker, csv_path, tmp_path, capsys):
+    run_matchmaker("project", "create", "g1", csv_path)
+    for match_args, pruned_by_gender in [(["--prune-by-gender"], True), ([], False)]:
+        run_matchmaker("match", "g1", *match_args)
+        connection = SQL.get_connection("g1")
+        assert SQL.get_project_pruned_by_gender(connection.cursor(), "g1") == pruned_by_gender
+        connection.close()
+
+        capsys.readouterr()
+        run_matchmaker("generate", "g1", "EMAIL", "--output-dir", str(tmp_path / "out"), "--on-file-exists", "override")
+        assert "Successfully saved" in capsys.readouterr().out
+
+
+def test_incremental_match_keeps_gender_pruning(run_matchmaker, csv_path):
+    run_matchmaker("project", "create", "g1", csv_path)
+    run_matchmaker("match", "g1", "--prune-by-gender")
+    with pytest.raises(ValueError, match="with '--prune-by-gender'"):
+        run_matchmaker("match", "g1", "--incremental")
+    run_matchmaker("match", "g1", "--incremental", "--prune-by-gender")
+
+
+def test_top_k_and_no_top_k_can_not_be_specified_together(run_matchmaker, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        run_matchmaker("match", "g1", "--top-k", "3", "--no-top-k")
+    assert exit_info.value.code == 2
+    assert "not allowed with argument" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_dense_match_table_round_trips_through_the_database(run_matchmaker, csv_path, dtype):
+    run_matchmaker("project", "create", "g1", csv_path)
+    match_table = DenseMatchTable([7, 3, 12, 5, 9], dtype=dtype)
+    for resp1_id, resp2_id, compatibility in [(7, 3, 12.345678901), (12, 3, 0.0), (5, 9, 100.0), (9, 7, 1 / 3)]:
+        match_table.set_compatibility(resp1_id, resp2_id, compatibility)
+
+    connection = SQL.get_connection("g1")
+    cursor = connection.cursor()
+    # (split into chunks of 3 scores, the last one shorter)
+    match_table.to_database_blob(cursor, SQL.get_project_sql_id(cursor, "g1"), chunk_bytes=3 * np.dtype(dtype).itemsize)
+    loaded_match_table = DenseMatchTable.from_database_blob(cursor, "g1")
+    connection.close()
+
+    assert loaded_match_table.respondent_ids == [7, 3, 12, 5, 9]
+    assert loaded_match_table.scores.dtype == dtype
+    assert np.array_equal(loaded_match_table.scores, match_table.scores, equal_nan=True)
+    assert list(loaded_match_table.iter_pairs()) == list(match_table.iter_pairs())
+
+
+def test_dense_match_table_pairs_are_unset_until_set():
+    match_table = DenseMatchTable([7, 3, 12])
+    assert np.isnan(match_table.scores).all()
+    match_table.set_compatibility(12, 7, 40.0)
+    match_table.set_compatibility(3, 12, 0.0)
+
+    assert match_table.get_compatibility(7, 12) == match_table.get_compatibility(12, 7) == 40.0
+    assert match_table.get_compatibility(12, 3) == 0.0
+    for resp1_id, resp2_id in [(7, 3), (3, 7), (3, 3)]:
+        with pytest.raises(ValueError, match="No compatibility"):
+            match_table.get_compatibility(resp1_id, resp2_id)
+    assert list(match_table.iter_pairs()) == [(7, 12, 40.0), (3, 12, 0.0)]
+    assert match_table.get_respondent_compatibilities(3) == {12: 0.0}
+    assert match_table.get_respondent_compatibilities(12) == {7: 40.0, 3: 0.0}
+    assert np.array_equal(match_table.get_respondent_scores(7), [np.nan, np.nan, 40.0], equal_nan=True)
+
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+@pytest.mark.parametrize("block_size", [1, 7, None])
+def test_streaming_top_k_is_the_top_k_of_the_full_match_table(k, block_size):
+    # (only a few different scores, so that most top matches are ties)
+    questions_data = make_synthetic_questions("YN,SC|3")
+    respondents = make_synthetic_respondents(60, questions_data, seed=5)
+    plan = compile_question_plan(questions_data)
+    match_table = match_all_respondents_vectorized(respondents, plan, verbose=False)
+    full_top_k_table = top_k_from_match_table(respondents, match_table, k)
+    streamed_top_k_table = match_top_k_streaming(respondents, plan, k, block_size=block_size, verbose=False)
+
+    # (some top matches are cut off among matches with the same score, which must be kept the same way)
+    assert any(
+        len(top_matches) > k and top_matches[k - 1][1] == top_matches[k][1]
+        for _, _, top_matches in top_k_from_match_table(respondents, match_table, k + 1).iter_top_matches()
+    )
+    assert list(full_top_k_table.iter_top_matches()) == _sort_top_matches(respondents, match_table, k)
+    assert list(streamed_top_k_table.iter_top_matches()) == list(full_top_k_table.iter_top_matches())
+
+
+@pytest.mark.parametrize("match_args", [[], ["--prune-by-gender"]], ids=["all", "pruned-by-gender"])
+def test_incremental_match_gives_the_match_results_of_a_full_match(
+    run_matchmaker, csv_path, tmp_path, capsys, match_args
+):
+    run_matchmaker("project", "create", "g1", csv_path)
+    run_matchmaker("match", "g1", *match_args)
+    # (changes and how many respondents are then new or changed and removed)
+    changes = [
+        # removed respondents
+        (lambda: _remove_last_rows(csv_path, 3), "0 of 11 respondents are new or changed, 3 were removed"),
+        # changed respondents
+        (
+            lambda: _change_rows(csv_path, {1: ("Nope", "Yep"), 4: ("FEMALE", "MALE")}, []),
+            "2 of 11 respondents are new or changed, 0 were removed",
+        ),
+        # new respondents
+        (
+            lambda: _change_rows(
+                csv_path,
+                {},
+                [
+                    'Mia Clark, 10A, 10, FEMALE, MALE, Nope, Group Study, Night, "Homework;Note taking", 3',
+                    'Leo King, 11B, 11, MALE, "MALE;FEMALE", Yep, Mixed Approach, Morning, Science projects, 8',
+                ],
+            ),
+            "2 of 13 respondents are new or changed, 0 were removed",
+        ),
+    ]
+    for change_i, (change, expected_changes_message) in enumerate(changes):
+        change()
+        run_matchmaker("project", "reset_csv", "g1", csv_path)
+        capsys.readouterr()
+        run_matchmaker("match", "g1", "--incremental", *match_args)
+        assert expected_changes_message in capsys.readouterr().out
+
+        full_csv_path = str(tmp_path / f"full_{change_i}.csv")
+        shutil.copy(csv_path, full_csv_path)
+        run_matchmaker("project", "create", f"full{change_i}", full_csv_path)
+        run_matchmaker("match", f"full{change_i}", *match_args)
+        assert _get_match_results("g1") == _get_match_results(f"full{change_i}")
+
+
+def test_mapped_match_table_gives_the_compatibilities_of_the_dense_one(tmp_path):
+    questions_data = make_synthetic_questions()
+    respondents = make_synthetic_respondents(30, questions_data, seed=2)
+    plan = compile_question_plan(questions_data)
+    dense_match_table = match_all_respondents_vectorized(respondents, plan, verbose=False)
+    # (an unset pair)
+    dense_match_table.set_compatibility(4, 9, np.nan)
+
+    MappedMatchTable.write(str(tmp_path / "scores"), dense_match_table)
+    match_table = MappedMatchTable(str(tmp_path / "scores"))
+    assert match_table.respondent_ids == dense_match_table.respondent_ids
+    for respondent1 in respondents:
+        for respondent2 in respondents:
+            if respondent1 is respondent2 or {respondent1.id, respondent2.id} == {4, 9}:
+                with pytest.raises(ValueError, match="No compatibility"):
+                    match_table.get_compatibility(respondent1.id, respondent2.id)
+            else:
+                assert match_table.get_compatibility(respondent1.id, respondent2.id) == (
+                    dense_match_table.get_compatibility(respondent1.id, respondent2.id)
+                )
+        assert np.array_equal(
+            match_table.get_respondent_scores(respondent1.id),
+            dense_match_table.get_respondent_scores(respondent1.id),
+            equal_nan=True,
+        )
+        assert match_table.get_respondent_compatibilities(respondent1.id) == (
+            dense_match_table.get_respondent_compatibilities(respondent1.id)
+        )
+
+    # (only the upper triangle is stored)
+    scores_file_size = (tmp_path / "scores" / "scores.npy").stat().st_size
+    assert dense_match_table.nbytes < scores_file_size < dense_match_table.nbytes + 1024
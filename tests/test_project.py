@@ -0,0 +1,59 @@
+import pytest
+
+import utils.sql as SQL
+
+
+def test_respondent_fingerprints_are_match_fingerprints(run_matchmaker, csv_path, capsys):
+    run_matchmaker("project", "create", "g1", csv_path)
+    run_matchmaker("match", "g1")
+    capsys.readouterr()
+    run_matchmaker("project", "reset_csv", "g1", csv_path)
+    assert "0 added, 0 updated, 0 removed" in capsys.readouterr().out
+
+    connection = SQL.get_connection("g1")
+    rows = connection.execute("SELECT fingerprint, match_fingerprint FROM respondents").fetchall()
+    connection.close()
+    assert rows and all(row["fingerprint"] == row["match_fingerprint"] for row in rows)
+
+
+def test_project_with_a_separate_database_is_created_matched_and_deleted(run_matchmaker, csv_path, tmp_path, capsys):
+    run_matchmaker("project", "create", "g1", csv_path, "--database", "separate")
+    database_path = tmp_path / "projects" / "g1.db"
+    assert database_path.is_file()
+
+    run_matchmaker("match", "g1")
+    connection = SQL.get_connection("g1")
+    assert connection.execute("SELECT COUNT(*) FROM match_results").fetchone()[0] == 91
+    connection.close()
+    # (the main database only has the project in its catalog)
+    connection = SQL.get_connection()
+    assert SQL.get_project_database_path(connection.cursor(), "g1") == str(database_path)
+    assert connection.execute("SELECT COUNT(*) FROM respondents").fetchone()[0] == 0
+    assert connection.execute("SELECT COUNT(*) FROM match_results").fetchone()[0] == 0
+    connection.close()
+
+    run_matchmaker("project", "delete", "g1")
+    assert not database_path.exists()
+    capsys.readouterr()
+    run_matchmaker("project", "list")
+    assert "No projects exist." in capsys.readouterr().out
+
+
+def test_project_is_not_created_if_its_database_can_not_be_created(run_matchmaker, csv_path, tmp_path, monkeypatch):
+    create_project_database = SQL.create_project_database
+
+    def create_project_database_and_fail(path: str):
+        create_project_database(path).close()
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(SQL, "create_project_database", create_project_database_and_fail)
+    with pytest.raises(OSError, match="No space left"):
+        run_matchmaker("project", "create", "g1", csv_path, "--database", "separate")
+    assert not (tmp_path / "projects" / "g1.db").exists()
+    connection = SQL.get_connection()
+    assert not SQL.project_exists(connection.cursor(), "g1")
+    connection.close()
+
+    monkeypatch.setattr(SQL, "create_project_database", create_project_database)
+    run_matchmaker("project", "create", "g1", csv_path, "--database", "separate")
+    assert (tmp_path / "projects" / "g1.db").is_file()
@@ -0,0 +1,113 @@
+import pickle
+from functools import partial
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic_data import make_synthetic_questions, make_synthetic_respondents
+from matching.match_all import match_all_respondents
+from matching.match_parallel import match_all_respondents_parallel
+from matching.match_vectorized import encode_questions, match_all_respondents_vectorized
+from matching.question_plan import compile_question_plan
+from utils.classes.question_data import QuestionData, QuestionType
+
+
+# the formulas of matching before question plans, which the plans must score the same as
+def _calc_points_yn_or_sc(r1, r2, qd: QuestionData):
+    return qd.max_points if r1 == r2 else 0
+
+
+def _calc_points_mc(r1, r2, qd: QuestionData):
+    return len(r1 & r2) / len(r1 | r2) * qd.max_points
+
+
+def _calc_points_rating(r1, r2, qd: QuestionData):
+    return (qd.num_options - abs(r1 - r2) - 1) / (qd.num_options - 1) * qd.max_points
+
+
+def _calculate_points_for_response(response1, response2, question_data: QuestionData) -> float:
+    match question_data.question_type:
+        case QuestionType.YES_NO | QuestionType.SINGLE_CHOICE:
+            return _calc_points_yn_or_sc(response1, response2, question_data)
+        case QuestionType.MULTIPLE_CHOICE:
+            return _calc_points_mc(response1, response2, question_data)
+        case QuestionType.RATING:
+            return _calc_points_rating(response1, response2, question_data)
+
+
+def _match_2_respondents(respondent1, respondent2, questions_data: list[QuestionData]) -> float:
+    points = 0.0
+    max_points = 0.0
+    for question_id, response1 in respondent1.responses.items():
+        question_data = next(q_data for q_data in questions_data if q_data.id == question_id)
+        points += _calculate_points_for_response(response1, respondent2.responses[question_id], question_data)
+        max_points += question_data.max_points
+    return points / max_points * 100 if max_points else 0
+
+
+@pytest.fixture
+def questions_and_respondents():
+    questions_data = make_synthetic_questions("YN,SC|3,SC|5,MC|6,MC|12,RT|5,RT|10")
+    return questions_data, make_synthetic_respondents(40, questions_data, seed=3)
+
+
+def test_scorers_give_the_points_of_the_previous_formulas(questions_and_respondents):
+    questions_data, respondents = questions_and_respondents
+    plan = compile_question_plan(questions_data)
+    assert plan.total_max_points == sum(question_data.max_points for question_data in questions_data)
+
+    for respondent1 in respondents:
+        for respondent2 in respondents:
+            for planned_question in plan.questions:
+                question_data = planned_question.question_data
+                response1 = respondent1.responses[question_data.id]
+                response2 = respondent2.responses[question_data.id]
+                assert planned_question.scorer(response1, response2) == _calculate_points_for_response(
+                    response1, response2, question_data
+                )
+
+
+@pytest.mark.parametrize(
+    "match_all",
+    [
+        match_all_respondents,
+        match_all_respondents_vectorized,
+        partial(match_all_respondents_parallel, num_workers=2, tile_size=16),
+    ],
+    ids=["python", "numpy", "parallel"],
+)
+def test_engines_give_the_compatibilities_of_the_previous_formulas(match_all, questions_and_respondents):
+    questions_data, respondents = questions_and_respondents
+    match_table = match_all(respondents, compile_question_plan(questions_data), verbose=False)
+
+    # (stored unrounded, so that near ties are ranked the same as by the previous formulas)
+    for i, respondent1 in enumerate(respondents):
+        for respondent2 in respondents[i + 1 :]:
+            assert match_table.get_compatibility(respondent1.id, respondent2.id) == pytest.approx(
+                _match_2_respondents(respondent1, respondent2, questions_data), rel=1e-12
+            )
+
+
+def test_plans_can_be_sent_to_other_processes(questions_and_respondents):
+    questions_data, respondents = questions_and_respondents
+    plan = compile_question_plan(questions_data)
+    # (what the parallel engine sends to its workers, which fails for local functions with the 'spawn' start method)
+    pickle.dumps(encode_questions(respondents, plan))
+
+    unpickled_plan = pickle.loads(pickle.dumps(plan))
+    response_vectors = plan.get_response_vectors(respondents[:2])
+    assert [scorer(*responses) for scorer, *responses in zip(unpickled_plan.scorers, *response_vectors)] == [
+        scorer(*responses) for scorer, *responses in zip(plan.scorers, *response_vectors)
+    ]
+
+
+def test_engines_give_exactly_the_same_scores(questions_and_respondents):
+    questions_data, respondents = questions_and_respondents
+    plan = compile_question_plan(questions_data)
+    python_scores = match_all_respondents(respondents, plan, verbose=False).scores
+    numpy_scores = match_all_respondents_vectorized(respondents, plan, block_size=7, verbose=False).scores
+    parallel_match_table = match_all_respondents_parallel(respondents, plan, num_workers=2, tile_size=16, verbose=False)
+
+    assert not np.isnan(python_scores).any()
+    assert np.array_equal(numpy_scores, python_scores)
+    assert np.array_equal(parallel_match_table.scores, python_scores)
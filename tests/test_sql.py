@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+import utils.sql as SQL
+
+SCHEMA_V0_PATH = "tests/data/shema_v0.sql"
+"""The schema of databases made before schema versions (version 0), which migrations start from"""
+
+
+def _get_schema(connection) -> dict[str, tuple[list, list]]:
+    """Returns columns and indexes (with their columns and uniqueness) of every table, ignoring their order"""
+    schema = {}
+    table_names = [
+        row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")
+    ]
+    for table_name in table_names:
+        columns = sorted(tuple(column)[1:] for column in connection.execute(f'PRAGMA table_info("{table_name}")'))
+        indexes = sorted(
+            (
+                bool(index[2]),
+                [column[2] for column in connection.execute(f'PRAGMA index_info("{index[1]}")')],
+            )
+            for index in connection.execute(f'PRAGMA index_list("{table_name}")')
+        )
+        schema[table_name] = (columns, indexes)
+    return schema
+
+
+def _connect_migrated(schema_path: str | None = None):
+    """Connects to an in-memory database created from the schema at `schema_path` (empty if `None`) and migrated"""
+    connection = sqlite3.connect(":memory:")
+    if schema_path:
+        with open(schema_path, encoding="UTF-8") as schema_file:
+            connection.executescript(schema_file.read())
+    SQL.migrate(connection)
+    return connection
+
+
+def test_migrations_bring_version_0_to_the_latest_schema():
+    migrated = sqlite3.connect(":memory:")
+    with open(SCHEMA_V0_PATH, encoding="UTF-8") as schema_file:
+        migrated.executescript(schema_file.read())
+    assert SQL.migrate(migrated) == [version for version, _ in SQL.MIGRATIONS]
+
+    created = sqlite3.connect(":memory:")
+    assert SQL.migrate(created) == []
+
+    assert SQL.get_schema_version(migrated.cursor()) == SQL.get_schema_version(created.cursor()) == SQL.SCHEMA_VERSION
+    assert _get_schema(migrated) == _get_schema(created)
+
+
+@pytest.mark.parametrize("schema_path", [None, SCHEMA_V0_PATH], ids=["created", "migrated from version 0"])
+@pytest.mark.parametrize("query", SQL.HOT_QUERIES)
+def test_hot_queries_use_indexes(schema_path, query):
+    connection = _connect_migrated(schema_path)
+    plan = SQL.explain_query_plan(connection.cursor(), query)
+    assert plan and not [step for step in plan if step.startswith("SCAN")]
+
+
+@pytest.mark.parametrize("schema_path", [None, SCHEMA_V0_PATH], ids=["created", "migrated from version 0"])
+def test_migrated_databases_use_write_ahead_logging(schema_path, tmp_path):
+    connection = sqlite3.connect(tmp_path / "database.db")
+    if schema_path:
+        with open(schema_path, encoding="UTF-8") as schema_file:
+            connection.executescript(schema_file.read())
+    SQL.migrate(connection)
+    connection.close()
+
+    connection = sqlite3.connect(tmp_path / "database.db")
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    SQL.set_bulk_write_pragmas(connection.cursor())
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
@@ -0,0 +1,70 @@
+import os
+import re
+import urllib.parse
+import urllib.request
+
+import utils.template_assets
+from utils.template_assets import (
+    find_external_resources,
+    get_rendered_template_paths,
+    inline_asset,
+    vendor_external_resources,
+)
+
+_INLINE_ASSET_RE = re.compile(r"""inline_asset\("([^"]+)"\)""")
+_URL_RE = re.compile(r"""url\("([^"]+)"\)""")
+
+
+def _get_file_path(file_url: str) -> str:
+    assert file_url.startswith("file://")
+    return urllib.request.url2pathname(urllib.parse.urlsplit(file_url).path)
+
+
+def test_rendered_templates_load_nothing_from_the_network():
+    assert find_external_resources(get_rendered_template_paths()) == []
+
+
+def test_fonts_of_rendered_templates_are_read_from_local_files():
+    num_assets = 0
+    for path in get_rendered_template_paths():
+        with open(path, encoding="utf-8") as f:
+            for relative_path in _INLINE_ASSET_RE.findall(f.read()):
+                css = inline_asset(relative_path)
+                font_urls = _URL_RE.findall(css)
+                assert font_urls
+                assert all(os.path.isfile(_get_file_path(font_url)) for font_url in font_urls)
+                # (what is included into every rendered document)
+                assert len(css) < 10_000
+                num_assets += 1
+    assert num_assets > 0
+
+
+def test_vendored_stylesheets_load_fonts_from_files_next_to_them(tmp_path, monkeypatch):
+    template_path = tmp_path / "results.html"
+    template_path.write_text(
+        "<head>\n"
+        '    <link rel="preconnect" href="https://fonts.example.com">\n'
+        '    <link href="https://fonts.example.com/css?family=Poppins" rel="stylesheet">\n'
+        "</head>\n"
+    )
+    downloads = {
+        "https://fonts.example.com/css?family=Poppins": b"@font-face { src: url(/poppins.ttf) format('truetype'); }",
+        "https://fonts.example.com/poppins.ttf": b"\x00\x01\x00\x00 font",
+    }
+    monkeypatch.setattr(utils.template_assets, "TEMPLATES_DIR", str(tmp_path))
+    monkeypatch.setattr(utils.template_assets, "_download", lambda url: (downloads[url], url))
+
+    vendored = vendor_external_resources([str(template_path)], verbose=False)
+    assert [(path, url) for path, url, _ in vendored] == [
+        (str(template_path), "https://fonts.example.com/css?family=Poppins")
+    ]
+    assert find_external_resources([str(template_path)]) == []
+    assert "preconnect" not in template_path.read_text()
+
+    relative_path = vendored[0][2]
+    assert find_external_resources([str(tmp_path / relative_path)]) == []
+    inline_asset.cache_clear()
+    (font_url,) = _URL_RE.findall(inline_asset(relative_path))
+    inline_asset.cache_clear()
+    with open(_get_file_path(font_url), "rb") as f:
+        assert f.read() == downloads["https://fonts.example.com/poppins.ttf"]
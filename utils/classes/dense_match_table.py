@@ -0,0 +1,261 @@
+import hashlib
+
+import numpy as np
+
+from utils.constants import SQLITE_SCORE_MATRIX_CHUNK_BYTES
+from utils.datetime import now_str
+from utils.upper_triangle import num_pairs, pair_index, row_offset
+
+
+class DenseMatchTable:
+    """
+    Stores compatibilities between respondents in a single contiguous array holding only the upper triangle of the
+    respondent x respondent matrix (see `utils.upper_triangle`), indexed by the respondents' positions.
+    Has the same public methods as `MatchTable`, but uses 8 bytes per pair (instead of 100+) and looks up any
+    compatibility in O(1).
+    Pairs that have not been set are stored as `NaN`.
+    """
+
+    def __init__(self, respondent_ids: list[int], scores: np.ndarray | None = None, dtype=np.float64):
+        """
+        :param respondent_ids: ids of all respondents, in the order of their positions in the matrix
+        :type respondent_ids: list[int]
+        :param scores: flat upper triangle array of compatibilities to use (not copied). If `None`, all pairs are unset
+        :type scores: np.ndarray | None
+        :param dtype: type of the compatibilities stored, used only if `scores` is `None`
+        """
+        self.respondent_ids = list(respondent_ids)
+        self._positions = {resp_id: position for position, resp_id in enumerate(self.respondent_ids)}
+        if len(self._positions) != len(self.respondent_ids):
+            raise ValueError("Respondent ids given to 'DenseMatchTable' are not unique")
+
+        expected_num_scores = num_pairs(len(self.respondent_ids))
+        if scores is None:
+            scores = np.full(expected_num_scores, np.nan, dtype=dtype)
+        elif scores.shape != (expected_num_scores,):
+            raise ValueError(
+                f"'DenseMatchTable' scores array has shape {scores.shape}, expected ({expected_num_scores},) for {len(self.respondent_ids)} respondents"
+            )
+        self._scores = scores
+
+    @property
+    def num_respondents(self) -> int:
+        return len(self.respondent_ids)
+
+    @property
+    def scores(self) -> np.ndarray:
+        """The flat upper triangle array of all compatibilities"""
+        return self._scores
+
+    @property
+    def nbytes(self) -> int:
+        return self._scores.nbytes
+
+    def get_position(self, resp_id: int) -> int:
+        try:
+            return self._positions[resp_id]
+        except KeyError:
+            raise ValueError(f"No respondent with id '{resp_id}' in 'MatchTable'")
+
+    def set_compatibility(self, resp1_id: int, resp2_id: int, compatibility: float):
+        index = pair_index(self.get_position(resp1_id), self.get_position(resp2_id), self.num_respondents)
+        self._scores[index] = compatibility
+
+    def get_compatibility(self, resp1_id: int, resp2_id: int):
+        position1 = self.get_position(resp1_id)
+        position2 = self.get_position(resp2_id)
+        if position1 != position2:
+            compatibility = float(self._scores[pair_index(position1, position2, self.num_respondents)])
+            if compatibility == compatibility:  # NaN (unset) is not equal to itself
+                return compatibility
+
+        raise ValueError(f"No compatibility in 'MatchTable' between respondents with ids '{resp1_id}' and '{resp2_id}'")
+
+    def get_row_view(self, resp_id: int) -> np.ndarray:
+        """
+        Returns a view (not a copy) of the compatibilities with all respondents positioned after this respondent, i.e.
+        with `self.respondent_ids[position + 1:]`
+        """
+        position = self.get_position(resp_id)
+        start = row_offset(position, self.num_respondents)
+        return self._scores[start : start + self.num_respondents - position - 1]
+
+    def get_respondent_scores(self, resp_id: int) -> np.ndarray:
+        """
+        Returns compatibilities with all respondents as an array in the order of `self.respondent_ids` (the
+        compatibility with the respondent themself is `NaN`)
+        """
+        position = self.get_position(resp_id)
+        n = self.num_respondents
+
+        # compatibilities with respondents positioned before this one are in their rows (one in each),
+        # while the ones with respondents after are the row of this respondent
+        earlier_positions = np.arange(position, dtype=np.int64)
+        earlier_indexes = earlier_positions * (2 * n - earlier_positions - 1) // 2 + (position - earlier_positions - 1)
+
+        row_scores = np.empty(n, dtype=self._scores.dtype)
+        row_scores[:position] = self._scores[earlier_indexes]
+        row_scores[position] = np.nan
+        row_scores[position + 1 :] = self.get_row_view(resp_id)
+        return row_scores
+
+    def get_respondent_compatibilities(self, resp_id: int):
+        row_scores = self.get_respondent_scores(resp_id).tolist()
+        return {
+            other_id: compatibility
+            for other_id, compatibility in zip(self.respondent_ids, row_scores)
+            if other_id != resp_id and compatibility == compatibility  # NaN (unset) is not equal to itself
+        }
+
+    def iter_rows(self):
+        """
+        Yields `(resp1_id, resp2_ids, compatibilities)` of every respondent, where `resp2_ids` and `compatibilities`
+        are lists of the set pairs with the respondents positioned after them
+        """
+        for position in range(self.num_respondents - 1):
+            resp1_id = self.respondent_ids[position]
+            row_scores = self.get_row_view(resp1_id)
+            resp2_ids = self.respondent_ids[position + 1 :]
+            is_unset = np.isnan(row_scores)
+            if is_unset.any():
+                is_set = ~is_unset
+                resp2_ids = [resp2_id for resp2_id, is_pair_set in zip(resp2_ids, is_set.tolist()) if is_pair_set]
+                row_scores = row_scores[is_set]
+            yield resp1_id, resp2_ids, row_scores.tolist()
+
+    def iter_pairs(self):
+        """Yields `(resp1_id, resp2_id, compatibility)` of every set pair, with `resp1` positioned before `resp2`"""
+        for resp1_id, resp2_ids, compatibilities in self.iter_rows():
+            for resp2_id, compatibility in zip(resp2_ids, compatibilities):
+                yield resp1_id, resp2_id, compatibility
+
+    def to_database_blob(self, cursor, project_sql_id: int, chunk_bytes: int = SQLITE_SCORE_MATRIX_CHUNK_BYTES):
+        """
+        Stores the scores of the table as the project's score matrix (replacing the previous one, without committing):
+        the raw bytes of the flat upper triangle array split into chunks of at most `chunk_bytes`, and a header with
+        their type, the order of respondents and a checksum
+        """
+        scores = np.ascontiguousarray(self._scores, dtype=self._scores.dtype.newbyteorder("<"))
+        scores_bytes = memoryview(scores).cast("B")
+        chunk_bytes -= chunk_bytes % scores.itemsize  # (a score is never split between chunks)
+        chunks = [scores_bytes[start : start + chunk_bytes] for start in range(0, len(scores_bytes), chunk_bytes)]
+
+        cursor.execute("DELETE FROM match_score_chunks WHERE project_id = ?", (project_sql_id,))
+        cursor.execute("DELETE FROM match_score_matrices WHERE project_id = ?", (project_sql_id,))
+        cursor.execute(
+            "INSERT INTO match_score_matrices (project_id, dtype, respondent_ids, num_scores, num_chunks, sha256, created_at) VALUES(?, ?, ?, ?, ?, ?, ?)",
+            (
+                project_sql_id,
+                scores.dtype.str,
+                np.array(self.respondent_ids, dtype="<i8").tobytes(),
+                len(scores),
+                len(chunks),
+                hashlib.sha256(scores_bytes).hexdigest(),
+                now_str(),
+            ),
+        )
+        cursor.executemany(
+            "INSERT INTO match_score_chunks (project_id, chunk_index, scores) VALUES(?, ?, ?)",
+            ((project_sql_id, chunk_i, chunk) for chunk_i, chunk in enumerate(chunks)),
+        )
+
+    @staticmethod
+    def database_blob_exists(cursor, project_id: str) -> bool:
+        cursor.execute(
+            "SELECT COUNT(*) FROM match_score_matrices WHERE project_id = (SELECT id FROM projects WHERE code = ?)",
+            (project_id,),
+        )
+        return cursor.fetchone()[0] != 0
+
+    @classmethod
+    def from_database_blob(cls, cursor, project_id: str):
+        """
+        Loads the project's score matrix (stored with `to_database_blob`) by reading all its chunks with a single query
+        straight into the scores array. Raises a `ValueError` if it does not exist or its checksum does not match
+        """
+        cursor.execute(
+            "SELECT dtype, respondent_ids, num_scores, num_chunks, sha256 FROM match_score_matrices WHERE project_id = (SELECT id FROM projects WHERE code = ?)",
+            (project_id,),
+        )
+        header = cursor.fetchone()
+        if header is None:
+            raise ValueError(f"Project with id '{project_id}' has no score matrix stored in the database.")
+        dtype, respondent_ids_bytes, num_scores, num_chunks, expected_hash = header[0:]
+
+        scores = np.empty(num_scores, dtype=np.dtype(dtype))
+        scores_bytes = memoryview(scores).cast("B")
+        cursor.execute(
+            "SELECT scores FROM match_score_chunks WHERE project_id = (SELECT id FROM projects WHERE code = ?) ORDER BY chunk_index",
+            (project_id,),
+        )
+        num_bytes_read = 0
+        num_chunks_read = 0
+        for row in cursor:
+            chunk = row[0]
+            if num_bytes_read + len(chunk) > len(scores_bytes):
+                raise ValueError(f"Score matrix of project '{project_id}' has more scores than its header says.")
+            scores_bytes[num_bytes_read : num_bytes_read + len(chunk)] = chunk
+            num_bytes_read += len(chunk)
+            num_chunks_read += 1
+
+        if num_chunks_read != num_chunks or num_bytes_read != len(scores_bytes):
+            raise ValueError(
+                f"Score matrix of project '{project_id}' is incomplete: read {num_chunks_read} of {num_chunks} chunks ({num_bytes_read} of {len(scores_bytes)} bytes)."
+            )
+        if hashlib.sha256(scores_bytes).hexdigest() != expected_hash:
+            raise ValueError(f"Score matrix of project '{project_id}' has a different checksum than expected.")
+
+        respondent_ids = np.frombuffer(respondent_ids_bytes, dtype="<i8").tolist()
+        return cls(respondent_ids, scores.astype(scores.dtype.newbyteorder("="), copy=False))
+
+    @classmethod
+    def from_database(
+        cls, cursor, project_id: str, num_respondents: int | None = None, respondent_ids: list[int] | None = None
+    ):
+        """
+        If the project's match results are stored as a score matrix (see `to_database_blob`), it is loaded instead of
+        match result rows; its respondents must then be the same as `respondent_ids` (in any order), if specified.
+        If `respondent_ids` is not specified, the ids of the project's respondents stored in the database are used.
+        If `num_respondents` is specified, will check if all match results are in the database. If not, will raise a `ValueError`
+        """
+        if cls.database_blob_exists(cursor, project_id):
+            table = cls.from_database_blob(cursor, project_id)
+            if respondent_ids is not None and set(respondent_ids) != set(table.respondent_ids):
+                raise ValueError(
+                    f"Score matrix in database is of different respondents ({table.num_respondents}) than expected ({len(respondent_ids)}). Match the respondents again."
+                )
+            if num_respondents and num_respondents != table.num_respondents:
+                raise ValueError(
+                    f"Score matrix in database is of {table.num_respondents} respondents, expected {num_respondents}."
+                )
+            return table
+
+        if respondent_ids is None:
+            cursor.execute(
+                "SELECT id FROM respondents WHERE project_id = (SELECT id FROM projects WHERE code = ?) ORDER BY id",
+                (project_id,),
+            )
+            respondent_ids = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(
+            "SELECT resp1_id, resp2_id, score FROM match_results WHERE project_id = (SELECT id FROM projects WHERE code = ?)",
+            (project_id,),
+        )
+
+        table = cls(respondent_ids)
+
+        num_matches = 0
+        for row in cursor:
+            table.set_compatibility(row[0], row[1], row[2])
+            num_matches += 1
+
+        if not num_respondents:
+            return table
+
+        expected_num_matches = num_respondents * (num_respondents - 1) // 2
+        if num_matches != expected_num_matches:
+            raise ValueError(
+                f"Number of match rows ({num_matches}) in database does not match expected number for {num_respondents} respondents."
+            )
+
+        return table
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.constants import MATCH_TABLE_DEFAULT_CACHE_ROWS, SQLITE_FETCH_MANY_SIZE
+from utils.profiling import count
+
+
+class LazyMatchTable:
+    """
+    Reads compatibilities between respondents from the project's match result rows in the database only when they are
+    looked up: the first time a respondent's compatibility is asked for, their whole row (compatibilities with all
+    other respondents) is read with a single query and kept in a least recently used cache of at most `cache_rows` rows.
+    Memory used is bounded by the size of the cache (a row is an array of `dtype` scores in the order of
+    `respondent_ids`) rather than the size of the project.
+    Has the same public methods as `MatchTable`. Pairs that are not stored are `NaN` in rows.
+    """
+
+    _ROW_QUERY = (
+        "SELECT resp2_id, score FROM match_results WHERE project_id = ? AND resp1_id = ? "
+        "UNION ALL "
+        "SELECT resp1_id, score FROM match_results WHERE project_id = ? AND resp2_id = ?"
+    )
+
+    def __init__(
+        self,
+        connection,
+        project_sql_id: int,
+        respondent_ids: list[int],
+        cache_rows: int = MATCH_TABLE_DEFAULT_CACHE_ROWS,
+        dtype=np.float64,
+    ):
+        """
+        :param connection: connection to the database of the project (a cursor of its own is used, reading plain tuples)
+        :param respondent_ids: ids of all respondents of the project's match results
+        :param cache_rows: the maximum amount of respondents' rows kept in memory
+        """
+        if cache_rows < 1:
+            raise ValueError(f"'LazyMatchTable' must cache at least 1 row, not {cache_rows}")
+
+        self.project_sql_id = project_sql_id
+        self.respondent_ids = list(respondent_ids)
+        self._positions = {resp_id: position for position, resp_id in enumerate(self.respondent_ids)}
+        self.cache_rows = cache_rows
+        self.dtype = dtype
+        self.hits = 0
+        self.misses = 0
+        self._cursor = connection.cursor()
+        self._cursor.row_factory = None
+        self._cursor.arraysize = SQLITE_FETCH_MANY_SIZE
+        self._rows: OrderedDict[int, np.ndarray] = OrderedDict()
+
+    @property
+    def num_respondents(self) -> int:
+        return len(self.respondent_ids)
+
+    def get_position(self, resp_id: int) -> int:
+        try:
+            return self._positions[resp_id]
+        except KeyError:
+            raise ValueError(f"No respondent with id '{resp_id}' in 'MatchTable'")
+
+    def get_respondent_scores(self, resp_id: int) -> np.ndarray:
+        """
+        Returns compatibilities with all respondents as an array in the order of `self.respondent_ids` (the
+        compatibility with the respondent themself is `NaN`). The array is the cached row, it must not be modified
+        """
+        self.get_position(resp_id)
+        row = self._rows.get(resp_id)
+        if row is not None:
+            self.hits += 1
+            self._rows.move_to_end(resp_id)
+            return row
+
+        self.misses += 1
+        row = np.full(self.num_respondents, np.nan, dtype=self.dtype)
+        self._cursor.execute(self._ROW_QUERY, (self.project_sql_id, resp_id, self.project_sql_id, resp_id))
+        num_rows_read = 0
+        while batch := self._cursor.fetchmany():
+            other_ids, scores = zip(*batch)
+            row[[self.get_position(other_id) for other_id in other_ids]] = scores
+            num_rows_read += len(batch)
+        count("match_rows_read", num_rows_read)
+
+        self._rows[resp_id] = row
+        if len(self._rows) > self.cache_rows:
+            self._rows.popitem(last=False)
+        return row
+
+    def get_respondent_compatibilities(self, resp_id: int):
+        row_scores = self.get_respondent_scores(resp_id).tolist()
+        return {
+            other_id: compatibility
+            for other_id, compatibility in zip(self.respondent_ids, row_scores)
+            if other_id != resp_id and compatibility == compatibility  # NaN (unset) is not equal to itself
+        }
+
+    def get_compatibility(self, resp1_id: int, resp2_id: int):
+        # (the row of `resp1_id` is read, since results are generated for one respondent at a time)
+        position2 = self.get_position(resp2_id)
+        if resp1_id != resp2_id:
+            compatibility = float(self.get_respondent_scores(resp1_id)[position2])
+            if compatibility == compatibility:  # NaN (unset) is not equal to itself
+                return compatibility
+
+        raise ValueError(f"No compatibility in 'MatchTable' between respondents with ids '{resp1_id}' and '{resp2_id}'")
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+
+from utils.classes.dense_match_table import DenseMatchTable
+from utils.upper_triangle import num_pairs
+
+_SCORES_FILENAME = "scores.npy"
+_RESPONDENT_IDS_FILENAME = "respondent_ids.npy"
+
+
+class MappedMatchTable:
+    """
+    Stores compatibilities between respondents in a directory on disk: the flat upper triangle array of the
+    respondent x respondent matrix (the same as `DenseMatchTable` holds, see `utils.upper_triangle`) in a `.npy` file
+    that is memory-mapped, and the ids of respondents in the order of the matrix's rows.
+    The files are opened lazily on first use, and only the scores of respondents that are looked up are read from disk.
+    Has the same public methods as `MatchTable`. Pairs that have not been set are stored as `NaN`.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: directory the table was written into with `MappedMatchTable.write`
+        :type path: str
+        """
+        self.path = path
+        # a dense table of the memory-mapped scores, which looks them up
+        self._table: DenseMatchTable | None = None
+
+    @classmethod
+    def write(cls, path: str, match_table: DenseMatchTable) -> "MappedMatchTable":
+        """Writes the compatibilities of `match_table` into the directory `path` and returns the table"""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, _RESPONDENT_IDS_FILENAME), np.array(match_table.respondent_ids, dtype=np.int64))
+
+        scores = np.lib.format.open_memmap(
+            os.path.join(path, _SCORES_FILENAME),
+            mode="w+",
+            dtype=match_table.scores.dtype,
+            shape=match_table.scores.shape,
+        )
+        scores[:] = match_table.scores
+        scores.flush()
+        del scores
+
+        return cls(path)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, _SCORES_FILENAME)) and os.path.isfile(
+            os.path.join(path, _RESPONDENT_IDS_FILENAME)
+        )
+
+    def _open(self) -> DenseMatchTable:
+        if self._table is not None:
+            return self._table
+        if not MappedMatchTable.exists(self.path):
+            raise ValueError(f"No match table written at '{self.path}'")
+
+        respondent_ids = np.load(os.path.join(self.path, _RESPONDENT_IDS_FILENAME)).tolist()
+        scores = np.load(os.path.join(self.path, _SCORES_FILENAME), mmap_mode="r")
+        if scores.shape != (num_pairs(len(respondent_ids)),):
+            raise ValueError(
+                f"Match table at '{self.path}' has scores of shape {scores.shape}, expected ({num_pairs(len(respondent_ids))},) for {len(respondent_ids)} respondents. Match the respondents again."
+            )
+        self._table = DenseMatchTable(respondent_ids, scores)
+        return self._table
+
+    @property
+    def respondent_ids(self) -> list[int]:
+        return self._open().respondent_ids
+
+    @property
+    def num_respondents(self) -> int:
+        return self._open().num_respondents
+
+    def get_position(self, resp_id: int) -> int:
+        return self._open().get_position(resp_id)
+
+    def get_compatibility(self, resp1_id: int, resp2_id: int):
+        return self._open().get_compatibility(resp1_id, resp2_id)
+
+    def get_respondent_scores(self, resp_id: int) -> np.ndarray:
+        """
+        Returns (a copy of) compatibilities with all respondents as an array in the order of `self.respondent_ids`
+        (the compatibility with the respondent themself is `NaN`): the respondent's row of the upper triangle and a
+        score from the row of every respondent positioned before them
+        """
+        return self._open().get_respondent_scores(resp_id)
+
+    def get_respondent_compatibilities(self, resp_id: int):
+        return self._open().get_respondent_compatibilities(resp_id)
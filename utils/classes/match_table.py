@@ -1,3 +1,6 @@
+from utils.classes.dense_match_table import DenseMatchTable
+
+
 class MatchTable:
     """Stores compatibilities between respondents using a symmetric 2d dictionary."""
 
@@ -20,16 +23,28 @@ class MatchTable:
         return {id: compatibility for id, compatibility in self._table[resp_id].items() if id != resp_id}
 
     def get_compatibility(self, resp1_id: int, resp2_id: int):
-        resp1_compatibilities = self.get_respondent_compatibilities(resp1_id)
-        compatibility = resp1_compatibilities.get(resp2_id, None)
-        if compatibility:
+        # look up the compatibility directly (without copying the respondent's compatibilities)
+        compatibility = self._table.get(resp1_id, {}).get(resp2_id, None) if resp1_id != resp2_id else None
+        if compatibility is not None:
             return compatibility
 
         raise ValueError(f"No compatibility in 'MatchTable' between respondents with ids '{resp1_id}' and '{resp2_id}'")
 
     @classmethod
     def from_database(cls, cursor, project_id: str, num_respondents: int | None = None):
-        """If `num_respondents` is specified, will check if all match results are in the database. If not, will raise a `ValueError`"""
+        """
+        If the project's match results are stored as a score matrix, it is loaded (with a single read) instead of match
+        result rows.
+        If `num_respondents` is specified, will check if all match results are in the database. If not, will raise a `ValueError`
+        """
+        if DenseMatchTable.database_blob_exists(cursor, project_id):
+            table = cls()
+            for resp1_id, resp2_id, compatibility in DenseMatchTable.from_database(
+                cursor, project_id, num_respondents
+            ).iter_pairs():
+                table.set_compatibility(resp1_id, resp2_id, compatibility)
+            return table
+
         cursor.execute(
             "SELECT * FROM match_results WHERE project_id = (SELECT id FROM projects WHERE code = ?)", (project_id,)
         )
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+import hashlib
 
 from utils.classes.gender import Gender
 
@@ -25,3 +26,7 @@ class Respondent:
         if not isinstance(other, Respondent):
             return NotImplemented
         return self.id == other.id
+
+    def get_fingerprint(self) -> str:
+        """Returns a fingerprint (hash) of the respondent's csv data row, which changes whenever any of their data does"""
+        return hashlib.sha256((self.csv_data_row or "").encode("UTF-8")).hexdigest()
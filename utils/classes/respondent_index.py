@@ -0,0 +1,111 @@
+from heapq import merge
+from typing import Iterator
+
+import numpy as np
+
+from utils.classes.gender import Gender
+from utils.classes.match_group import MatchGroup
+from utils.classes.respondent import Respondent
+from utils.constants import NO_RESPONSE_GROUP_VALUE
+
+
+class RespondentIndex:
+    """
+    Inverted index of respondents, built once per result generation run: members of every group value by their gender
+    and match groups by their codes. Finding a respondent's matches in their groups then only goes through the members
+    of those groups with the genders the respondent wants, instead of through all respondents once per group.
+    Members are always in the order of `respondents`.
+    """
+
+    def __init__(self, respondents: list[Respondent], match_groups: list[MatchGroup]):
+        self.respondents = respondents
+        self._positions = {respondent.id: position for position, respondent in enumerate(respondents)}
+        # key: (group code, group value), value: members of the group
+        self._members: dict[tuple[str, str], list[Respondent]] = {}
+        # key: (group code, group value), value: dict of gender -> members of the group with that gender
+        self._members_by_gender: dict[tuple[str, str], dict[Gender, list[Respondent]]] = {}
+        for respondent in respondents:
+            for group_code, value in respondent.groups.items():
+                if value == NO_RESPONSE_GROUP_VALUE:
+                    continue
+                self._members.setdefault((group_code, value), []).append(respondent)
+                self._members_by_gender.setdefault((group_code, value), {}).setdefault(
+                    respondent.gender, []
+                ).append(respondent)
+
+        # key: (group code, group value, wanted genders), value: positions of the group's members with those genders
+        self._member_positions: dict[tuple[str, str, frozenset[Gender]], np.ndarray] = {}
+        # the last match table positions were looked up in and positions of all respondents in it
+        self._match_table_positions: tuple[object, np.ndarray] | None = None
+
+        # (the first group with a code, the same as looking through the list)
+        self._match_groups: dict[str, MatchGroup] = {}
+        for match_group in match_groups:
+            self._match_groups.setdefault(match_group.code, match_group)
+
+    def get_match_group(self, group_code: str) -> MatchGroup:
+        try:
+            return self._match_groups[group_code]
+        except KeyError:
+            raise ValueError(f"Match group with code {group_code} does not exist")
+
+    def get_group_members(self, group_code: str, value: str, genders: list[Gender] | None = None) -> list[Respondent]:
+        """Returns members of the group with `value` (only the ones of `genders`, if given)"""
+        if genders is None:
+            return self._members.get((group_code, value), [])
+
+        members_by_gender = self._members_by_gender.get((group_code, value), {})
+        wanted_members = [members_by_gender[gender] for gender in set(genders) if gender in members_by_gender]
+        if len(wanted_members) == len(members_by_gender):
+            return self._members.get((group_code, value), [])
+        if len(wanted_members) == 1:
+            return wanted_members[0]
+        return list(merge(*wanted_members, key=lambda member: self._positions[member.id]))
+
+    def get_position(self, resp_id: int) -> int:
+        """Returns the position of the respondent in `respondents`"""
+        return self._positions[resp_id]
+
+    def get_group_member_positions(self, group_code: str, value: str, genders: list[Gender]) -> np.ndarray:
+        """
+        Same as `get_group_members`, but positions of the members in `respondents` (in ascending order). Found once for
+        every group value and wanted genders, since many respondents want the same genders
+        """
+        key = (group_code, value, frozenset(genders))
+        positions = self._member_positions.get(key)
+        if positions is None:
+            members = self.get_group_members(group_code, value, genders)
+            positions = np.fromiter(
+                (self._positions[member.id] for member in members), dtype=np.int64, count=len(members)
+            )
+            self._member_positions[key] = positions
+        return positions
+
+    def get_match_table_positions(self, match_table) -> np.ndarray:
+        """Returns positions of `respondents` in `match_table` (looked up once for the last table asked about)"""
+        if self._match_table_positions is None or self._match_table_positions[0] is not match_table:
+            positions = np.fromiter(
+                (match_table.get_position(respondent.id) for respondent in self.respondents),
+                dtype=np.int64,
+                count=len(self.respondents),
+            )
+            self._match_table_positions = (match_table, positions)
+        return self._match_table_positions[1]
+
+    def iter_matches_in_group(self, respondent: Respondent, group_code: str) -> Iterator[Respondent]:
+        """Yields members of the respondent's group with the genders they want to be matched with (except themself)"""
+        value = respondent.groups[group_code]
+        for member in self.get_group_members(group_code, value, respondent.match_genders):
+            if member.id != respondent.id:
+                yield member
+
+    def get_matches_in_groups(self, respondent: Respondent) -> dict[str, Iterator[Respondent]]:
+        """
+        Returns the dict, where keys are codes of the respondent's groups, values their matches in said groups (read
+        only while iterating, so finding them costs nothing until they are scored)
+        """
+        return {
+            group_code: self.iter_matches_in_group(respondent, group_code)
+            for group_code, value in respondent.groups.items()
+            if value != NO_RESPONSE_GROUP_VALUE
+        }
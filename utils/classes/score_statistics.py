@@ -0,0 +1,31 @@
+class ScoreStatistics:
+    """Keeps the amount, lowest, highest and average of scores as they are added, without storing the scores."""
+
+    def __init__(self):
+        self.count = 0
+        self.min: float | None = None
+        self.max: float | None = None
+        self.total = 0.0
+
+    def add(self, score: float):
+        self.count += 1
+        self.total += score
+        if self.min is None or score < self.min:
+            self.min = score
+        if self.max is None or score > self.max:
+            self.max = score
+
+    def add_many(self, scores: list[float]):
+        if not scores:
+            return
+        self.count += len(scores)
+        self.total += sum(scores)
+        lowest, highest = min(scores), max(scores)
+        if self.min is None or lowest < self.min:
+            self.min = lowest
+        if self.max is None or highest > self.max:
+            self.max = highest
+
+    @property
+    def mean(self) -> float | None:
+        return self.total / self.count if self.count else None
@@ -0,0 +1,172 @@
+import numpy as np
+
+from utils.classes.dense_match_table import DenseMatchTable
+
+
+class SparseMatchTable:
+    """
+    Stores compatibilities only between respondents of bucket pairs that were scored (e.g. gender buckets whose
+    respondents would ever see each other in results). Respondents are split into buckets; the pairs within a bucket
+    are stored in a `DenseMatchTable` and the pairs between two buckets in a `len(bucket1)` x `len(bucket2)` array.
+    Has the same public methods as `MatchTable`, but uses 8 bytes per stored pair and looks up any compatibility in
+    O(1).
+    Pairs that are not stored (or have not been set) have no compatibility.
+    """
+
+    def __init__(self, buckets: list[list[int]], dtype=np.float64):
+        """
+        :param buckets: respondent ids of every bucket (each respondent must be in exactly one bucket)
+        :type buckets: list[list[int]]
+        :param dtype: type of the compatibilities stored
+        """
+        self.buckets = [list(bucket) for bucket in buckets]
+        self.dtype = dtype
+        # key: respondent id, value: (index of the bucket, position of the respondent in the bucket)
+        self._locations: dict[int, tuple[int, int]] = {}
+        for bucket_i, bucket in enumerate(self.buckets):
+            for position, resp_id in enumerate(bucket):
+                if resp_id in self._locations:
+                    raise ValueError(f"Respondent with id '{resp_id}' is in more than one bucket of 'SparseMatchTable'")
+                self._locations[resp_id] = (bucket_i, position)
+
+        # key: bucket index
+        self._within_buckets: dict[int, DenseMatchTable] = {}
+        # key: (bucket index, bucket index), the first one lower than the second one
+        self._between_buckets: dict[tuple[int, int], np.ndarray] = {}
+
+    @property
+    def num_respondents(self) -> int:
+        return len(self._locations)
+
+    @property
+    def num_stored_pairs(self) -> int:
+        """Amount of pairs that have room for a compatibility (whether set or not)"""
+        return sum(len(table.scores) for table in self._within_buckets.values()) + sum(
+            block.size for block in self._between_buckets.values()
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(table.nbytes for table in self._within_buckets.values()) + sum(
+            block.nbytes for block in self._between_buckets.values()
+        )
+
+    def get_location(self, resp_id: int) -> tuple[int, int]:
+        """Returns `(index of the bucket, position of the respondent in the bucket)`"""
+        try:
+            return self._locations[resp_id]
+        except KeyError:
+            raise ValueError(f"No respondent with id '{resp_id}' in 'MatchTable'")
+
+    def add_within_bucket(self, bucket_i: int) -> DenseMatchTable:
+        """Makes room for the pairs within a bucket and returns the table they are stored in"""
+        if bucket_i not in self._within_buckets:
+            self._within_buckets[bucket_i] = DenseMatchTable(self.buckets[bucket_i], dtype=self.dtype)
+        return self._within_buckets[bucket_i]
+
+    def add_between_buckets(self, bucket1_i: int, bucket2_i: int) -> np.ndarray:
+        """
+        Makes room for the pairs between two different buckets and returns the array (or its transposed view) they are
+        stored in, with rows of respondents of `bucket1_i` and columns of respondents of `bucket2_i`
+        """
+        if bucket1_i == bucket2_i:
+            raise ValueError(f"Pairs within bucket {bucket1_i} must be added using 'add_within_bucket'")
+
+        key = (min(bucket1_i, bucket2_i), max(bucket1_i, bucket2_i))
+        if key not in self._between_buckets:
+            self._between_buckets[key] = np.full(
+                (len(self.buckets[key[0]]), len(self.buckets[key[1]])), np.nan, dtype=self.dtype
+            )
+        block = self._between_buckets[key]
+        return block if key[0] == bucket1_i else block.T
+
+    def set_compatibility(self, resp1_id: int, resp2_id: int, compatibility: float):
+        bucket1_i, position1 = self.get_location(resp1_id)
+        bucket2_i, position2 = self.get_location(resp2_id)
+        if bucket1_i == bucket2_i and bucket1_i in self._within_buckets:
+            self._within_buckets[bucket1_i].set_compatibility(resp1_id, resp2_id, compatibility)
+        elif (min(bucket1_i, bucket2_i), max(bucket1_i, bucket2_i)) in self._between_buckets:
+            self.add_between_buckets(bucket1_i, bucket2_i)[position1, position2] = compatibility
+        else:
+            raise ValueError(
+                f"Pair of respondents with ids '{resp1_id}' and '{resp2_id}' is not stored in 'SparseMatchTable'"
+            )
+
+    def get_compatibility(self, resp1_id: int, resp2_id: int):
+        bucket1_i, position1 = self.get_location(resp1_id)
+        bucket2_i, position2 = self.get_location(resp2_id)
+        if bucket1_i == bucket2_i:
+            if bucket1_i in self._within_buckets:
+                return self._within_buckets[bucket1_i].get_compatibility(resp1_id, resp2_id)
+        else:
+            if bucket1_i > bucket2_i:
+                bucket1_i, position1, bucket2_i, position2 = bucket2_i, position2, bucket1_i, position1
+            block = self._between_buckets.get((bucket1_i, bucket2_i), None)
+            if block is not None:
+                compatibility = float(block[position1, position2])
+                if compatibility == compatibility:  # NaN (unset) is not equal to itself
+                    return compatibility
+
+        raise ValueError(f"No compatibility in 'MatchTable' between respondents with ids '{resp1_id}' and '{resp2_id}'")
+
+    def get_respondent_compatibilities(self, resp_id: int):
+        bucket_i, position = self.get_location(resp_id)
+        compatibilities: dict[int, float] = {}
+
+        if bucket_i in self._within_buckets:
+            compatibilities.update(self._within_buckets[bucket_i].get_respondent_compatibilities(resp_id))
+
+        for (bucket1_i, bucket2_i), block in self._between_buckets.items():
+            if bucket1_i == bucket_i:
+                other_bucket, row_scores = self.buckets[bucket2_i], block[position, :].tolist()
+            elif bucket2_i == bucket_i:
+                other_bucket, row_scores = self.buckets[bucket1_i], block[:, position].tolist()
+            else:
+                continue
+            compatibilities.update(
+                (other_id, compatibility)
+                for other_id, compatibility in zip(other_bucket, row_scores)
+                if compatibility == compatibility  # NaN (unset) is not equal to itself
+            )
+
+        return compatibilities
+
+    def to_dense(self, respondent_ids: list[int]) -> DenseMatchTable:
+        """
+        Returns a `DenseMatchTable` of all respondents in the order of `respondent_ids`, with the stored pairs set (and
+        the pairs that are not stored unset)
+        """
+        dense_table = DenseMatchTable(respondent_ids, dtype=self.dtype)
+        n = dense_table.num_respondents
+        bucket_positions = [
+            np.array([dense_table.get_position(resp_id) for resp_id in bucket], dtype=np.int64) for bucket in self.buckets
+        ]
+
+        def copy_row(position: int, other_positions: np.ndarray, row_scores: np.ndarray):
+            # (`utils.upper_triangle.pair_index` of every pair, the order of the pair's positions does not matter)
+            low, high = np.minimum(position, other_positions), np.maximum(position, other_positions)
+            dense_table.scores[low * (2 * n - low - 1) // 2 + (high - low - 1)] = row_scores
+
+        for bucket_i, table in self._within_buckets.items():
+            positions = bucket_positions[bucket_i]
+            for bucket_position, resp_id in enumerate(table.respondent_ids[:-1]):
+                copy_row(positions[bucket_position], positions[bucket_position + 1 :], table.get_row_view(resp_id))
+
+        for (bucket1_i, bucket2_i), block in self._between_buckets.items():
+            for position, row_scores in zip(bucket_positions[bucket1_i].tolist(), block):
+                copy_row(position, bucket_positions[bucket2_i], row_scores)
+
+        return dense_table
+
+    def iter_pairs(self):
+        """Yields `(resp1_id, resp2_id, compatibility)` of every set pair, with `resp1_id` lower than `resp2_id`"""
+        for table in self._within_buckets.values():
+            for resp1_id, resp2_id, compatibility in table.iter_pairs():
+                yield min(resp1_id, resp2_id), max(resp1_id, resp2_id), compatibility
+
+        for (bucket1_i, bucket2_i), block in self._between_buckets.items():
+            bucket2 = self.buckets[bucket2_i]
+            for resp1_id, row_scores in zip(self.buckets[bucket1_i], block.tolist()):
+                for resp2_id, compatibility in zip(bucket2, row_scores):
+                    if compatibility == compatibility:  # NaN (unset) is not equal to itself
+                        yield min(resp1_id, resp2_id), max(resp1_id, resp2_id), compatibility
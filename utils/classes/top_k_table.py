@@ -0,0 +1,99 @@
+from utils.constants import NO_RESPONSE_GROUP_VALUE
+
+
+class TopKTable:
+    """
+    Stores only the top `k` matches of every respondent in each group they belong to (including the group of all
+    respondents), instead of compatibilities between all pairs of respondents like `MatchTable` does.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        # key: (respondent id, group code), value: list of (match id, compatibility) ordered by compatibility descending
+        self._top_matches: dict[tuple[int, str], list[tuple[int, float]]] = {}
+        # key: respondent id, value: dict of match id -> compatibility for all matches in any of the respondent's groups
+        self._compatibilities: dict[int, dict[int, float]] = {}
+
+    def set_top_matches(self, resp_id: int, group_code: str, top_matches: list[tuple[int, float]]):
+        """`top_matches` must be ordered by compatibility descending and have at most `k` items"""
+        if len(top_matches) > self.k:
+            raise ValueError(f"More than {self.k} top matches given for respondent with id '{resp_id}'")
+
+        self._top_matches[(resp_id, group_code)] = top_matches
+        self._compatibilities.setdefault(resp_id, {}).update(top_matches)
+
+    def has_group(self, resp_id: int, group_code: str) -> bool:
+        return (resp_id, group_code) in self._top_matches
+
+    def get_top_matches(self, resp_id: int, group_code: str) -> list[tuple[int, float]]:
+        try:
+            return self._top_matches[(resp_id, group_code)]
+        except KeyError:
+            raise ValueError(f"No top matches in 'TopKTable' for respondent with id '{resp_id}' in group '{group_code}'")
+
+    def iter_top_matches(self):
+        """Yields `(respondent id, group code, top matches)` of every respondent and group"""
+        for (resp_id, group_code), top_matches in self._top_matches.items():
+            yield resp_id, group_code, top_matches
+
+    def get_compatibility(self, resp1_id: int, resp2_id: int):
+        compatibility = self._compatibilities.get(resp1_id, {}).get(resp2_id, None)
+        if compatibility is not None:
+            return compatibility
+
+        raise ValueError(
+            f"No compatibility in 'TopKTable' between respondents with ids '{resp1_id}' and '{resp2_id}' (not a top match)"
+        )
+
+    def to_database(self, cursor, project_sql_id: int, respondents) -> int:
+        """
+        Replaces the project's top matches stored in `match_top_k` with the ones of this table (without committing).
+        Returns the amount of rows written
+
+        :param respondents: respondents of the table (for their values in groups)
+        """
+        groups_by_id = {respondent.id: respondent.groups for respondent in respondents}
+        cursor.execute("DELETE FROM match_top_k WHERE project_id = ?", (project_sql_id,))
+        rows = [
+            (project_sql_id, resp_id, group_code, groups_by_id[resp_id][group_code], rank, match_id, compatibility)
+            for resp_id, group_code, top_matches in self.iter_top_matches()
+            for rank, (match_id, compatibility) in enumerate(top_matches)
+        ]
+        cursor.executemany(
+            "INSERT INTO match_top_k (project_id, respondent_id, group_code, group_value, rank, match_id, score) VALUES(?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        return len(rows)
+
+    @classmethod
+    def from_database(cls, cursor, project_id: str, respondents) -> "TopKTable":
+        """
+        Reads the stored top matches of `respondents` (only theirs, a row lookup each) in every group they belong to.
+        A group without any stored top matches of a respondent has no matches in it
+
+        :param respondents: respondents whose top matches to read (not necessarily all respondents of the project)
+        """
+        cursor.execute("SELECT id, top_k FROM projects WHERE code = ?", (project_id,))
+        row = cursor.fetchone()
+        if row is None or row[1] is None:
+            raise ValueError(f"Project with id '{project_id}' does not keep top matches. Match with '--top-k' first.")
+        project_sql_id, k = row[0], row[1]
+
+        table = cls(k)
+        for respondent in respondents:
+            top_matches_in_groups: dict[str, list[tuple[int, float]]] = {
+                group_code: [] for group_code, value in respondent.groups.items() if value != NO_RESPONSE_GROUP_VALUE
+            }
+            cursor.execute(
+                "SELECT group_code, match_id, score FROM match_top_k WHERE project_id = ? AND respondent_id = ? ORDER BY group_code, rank",
+                (project_sql_id, respondent.id),
+            )
+            for group_code, match_id, compatibility in cursor.fetchall():
+                if group_code not in top_matches_in_groups:
+                    raise ValueError(
+                        f"Stored top matches of respondent with id '{respondent.id}' are in group '{group_code}' they do not belong to. Match the respondents again."
+                    )
+                top_matches_in_groups[group_code].append((match_id, compatibility))
+            for group_code, top_matches in top_matches_in_groups.items():
+                table.set_top_matches(respondent.id, group_code, top_matches)
+        return table
@@ -1,4 +1,5 @@
 import argparse
+import importlib.util
 import sys
 
 from utils.constants import (
@@ -31,6 +32,14 @@ def _type_positive_integer(value):
     return integer_value
 
 
+def _type_pdf_batch_size(value):
+    integer_value = _type_positive_integer(value)
+    # (pdfs rendered at once are split into a file of each respondent by pypdf, which is not needed otherwise)
+    if integer_value > 1 and importlib.util.find_spec("pypdf") is None:
+        raise argparse.ArgumentTypeError("more than 1 requires pypdf to be installed (pip install pypdf)")
+    return integer_value
+
+
 class _CustomArgumentParser(argparse.ArgumentParser):
     def error(self, message):
         sys.stderr.write(f"Error: {message}\n")
@@ -1,4 +1,22 @@
 DATABASE_PATH = "data/database.db"
+SCHEMA_PATH = "data/shema.sql"
+"""The latest schema of the database, used to create it when it is empty (older databases are migrated instead)"""
+PROJECT_DATABASES_DIR = "data/projects"
+"""The directory (next to the database) databases of projects that have their own are created in, one file per project"""
+SCORE_MATRICES_DIR = "data/score_matrices"
+"""The directory (next to the database) memory-mapped score matrices of projects are written into, one per project"""
+SQLITE_BULK_WRITE_BATCH_SIZE: int = 50_000
+"""The amount of rows inserted with a single `executemany` when writing many rows (e.g. all match results) at once"""
+SQLITE_BULK_WRITE_CACHE_SIZE_KIB: int = 64 * 1024
+"""The size of SQLite's page cache (in KiB) when writing many rows at once"""
+FILE_HASH_MAX_WORKERS: int = 8
+"""The most threads files are hashed in at once when many files need to be checked"""
+SQLITE_FETCH_MANY_SIZE: int = 4096
+"""The amount of rows fetched at once when reading many rows of a query"""
+MATCH_TABLE_DEFAULT_CACHE_ROWS: int = 1024
+"""The amount of respondents' rows of compatibilities kept in memory when match results are read lazily while generating"""
+SQLITE_SCORE_MATRIX_CHUNK_BYTES: int = 2**28
+"""The maximum size of one blob a score matrix is stored in (SQLite does not allow blobs larger than about 1 GB)"""
 
 
 ###############################
@@ -33,12 +51,45 @@ PARAM_INDEX_NUM_OPTIONS: int = 0
 ####################################
 
 ALL_MATCHES_GROUP_CODE = "__ALL__"
+NO_RESPONSE_GROUP_VALUE = "NO_RESPONSE"
+
+
+##########################
+#   MATCHING CONSTANTS   #
+##########################
+
+MATCHING_ENGINE_PYTHON = "python"
+MATCHING_ENGINE_NUMPY = "numpy"
+MATCHING_ENGINE_PARALLEL = "parallel"
+PROJECT_DATABASE_SHARED = "shared"
+PROJECT_DATABASE_SEPARATE = "separate"
+MATCH_RESULTS_STORAGE_ROWS = "rows"
+MATCH_RESULTS_STORAGE_BLOB = "blob"
+MATCH_RESULTS_STORAGE_MMAP = "mmap"
+MATCHING_DEFAULT_BLOCK_SIZE: int = 512
+"""The amount of respondents in one side of a block of the compatibility matrix that the numpy engine scores at once"""
+MATCHING_DEFAULT_TILE_SIZE: int = 256
+"""The amount of respondents in one side of a tile of the compatibility matrix that a worker of the parallel engine
+scores at once (smaller than the block size, so that the work is spread more evenly between workers)"""
+MATCHING_TOP_K_BLOCK_ELEMENTS: int = 2**22
+"""The maximum amount of scores (rows x all respondents) held at once when finding only the top matches"""
+MATCHING_ANN_DEFAULT_CANDIDATES: int = 300
+"""The maximum amount of candidates scored exactly per respondent when finding top matches approximately"""
+MATCHING_ANN_DEFAULT_TABLES: int = 16
+"""The amount of locality sensitive hashing tables candidates are fetched from when finding top matches approximately"""
+MATCHING_ANN_CANDIDATE_OVERSAMPLING: int = 4
+"""How many times more candidates than are scored exactly are fetched from the hashing tables (the ones closest by
+embedding distance are scored)"""
+MATCHING_ANN_DEFAULT_MINHASHES: int = 16
+"""The amount of MinHash values a multiple choice question's answer is embedded into"""
 
 
 #####################
 #   CLI CONSTANTS   #
 #####################
 
+PROFILE_DEFAULT_REPORT_PATH: str = "out/profile/run_report.json"
+
 CLI_DEFAULT_MAX_RESULTS_IN_GROUP: int = 5
 DEFAULT_RESULTS_PRECISION: int = 0
 
@@ -51,6 +102,20 @@ ALL_PARTICIPANTS_GROUP_TITLE = "Tarp visų dalyvių"
 PDF_RESULTS_TEMPLATE_RELATIVE_PATH = "pdf_results/valentine/valentine_pink_pdf.html"
 EMAIL_TEMPLATE_RELATIVE_PATH = "email/valentine/valentine_pink_email.html"
 PNG_RESULTS_TEMPLATE_RELATIVE_PATH = "png_results/valentine/valentine_pink_png.html"
+TEMPLATES_DIR = "templates"
+"""The directory jinja templates are loaded from"""
+TEMPLATE_ASSETS_RELATIVE_DIR = "assets"
+"""The directory (in `TEMPLATES_DIR`) vendored stylesheets are stored in, with the fonts they load"""
+TEMPLATE_ASSETS_DOWNLOAD_TIMEOUT_SECONDS: float = 30
+"""How long to wait for a response when downloading an external resource of a template to vendor it"""
+TEMPLATE_ASSETS_USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/534.34 (KHTML, like Gecko) wkhtmltopdf Safari/534.34"
+)
+"""The user agent of wkhtmltopdf, so that font services serve stylesheets with font formats it can render (truetype)"""
+RESULT_FILES_WORKER_CHUNK_SIZE: int = 4
+"""The amount of result files sent to a worker process at once when generating them in parallel"""
+RESULT_FILES_DEFAULT_PDF_BATCH_SIZE: int = 1
+"""The amount of pdf result files rendered by a single wkhtmltopdf run by default (1 - each file by a run of its own)"""
 
 
 #####################
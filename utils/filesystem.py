@@ -28,12 +28,27 @@ def make_parent_dirs_for_file(
     Returns:
         bool: whether the file should be created or not
     """
-    if_exists_behaviour = if_exists_behaviour.lower()
-
     path = Path(filepath)
     path.parent.mkdir(parents=True, exist_ok=True)
+    return _should_create_file(filepath, if_exists_behaviour)
+
+
+def make_parent_dirs_for_files(filepaths: list[str], if_exists_behaviour: str) -> list[str]:
+    """
+    Same as `make_parent_dirs_for_file` for many files at once: every directory is made once, and what to do with
+    each file that already exists is decided (asked, if `"ask"`) before any of the files are created
+    Returns:
+        list[str]: filepaths of the files that should be created
+    """
+    for parent in dict.fromkeys(Path(filepath).parent for filepath in filepaths):
+        parent.mkdir(parents=True, exist_ok=True)
+    return [filepath for filepath in filepaths if _should_create_file(filepath, if_exists_behaviour)]
+
+
+def _should_create_file(filepath: str, if_exists_behaviour: str) -> bool:
+    if_exists_behaviour = if_exists_behaviour.lower()
 
-    if path.exists():
+    if Path(filepath).exists():
         if if_exists_behaviour == "override":
             print(f"File '{filepath}' already exists. Overriding...")
             return True
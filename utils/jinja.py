@@ -1,6 +1,10 @@
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
+from utils.constants import TEMPLATES_DIR
+from utils.template_assets import inline_asset
+
 
 JINJA_ENV = Environment(
-    loader=FileSystemLoader("templates"), autoescape=select_autoescape(), extensions=["jinja2.ext.loopcontrols"]
+    loader=FileSystemLoader(TEMPLATES_DIR), autoescape=select_autoescape(), extensions=["jinja2.ext.loopcontrols"]
 )
+JINJA_ENV.globals["inline_asset"] = inline_asset
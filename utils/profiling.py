@@ -0,0 +1,169 @@
+"""
+Per-stage timing and counting of a single command run (enabled with the `--profile` cli option).
+
+Stages are timed with `with stage("name"):` and counted with `count("name", amount)` anywhere in the code. When no
+profile is started, both do nothing, so they can be left in place in hot code.
+Code run in worker processes is profiled by running it with `run_in_worker` and merging the stages and counters it
+returns into the profile of the main process with `merge_worker_profile`.
+"""
+
+import cProfile
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from utils.datetime import now_str
+
+
+class RunProfile:
+    """
+    Attributes:
+        stages (dict[str, dict]): key: stage path (names of nested stages are joined with "/"), value: total seconds
+            spent in the stage and how many times it was entered
+        counters (dict[str, int | float]): key: counter name, value: total amount counted
+    """
+
+    def __init__(self, command: str, pstats_path: str | None = None):
+        self.command = command
+        self.argv = sys.argv[1:]
+        self.started_at = now_str(milliseconds=True)
+        self.stages: dict[str, dict] = {}
+        self.counters: dict[str, int | float] = defaultdict(int)
+        self.pstats_path = pstats_path
+        self.total_seconds: float | None = None
+
+        self._stage_stack: list[str] = []
+        self._start = time.perf_counter()
+        self._profiler = cProfile.Profile() if pstats_path else None
+        if self._profiler:
+            self._profiler.enable()
+
+    @contextmanager
+    def stage(self, name: str):
+        self._stage_stack.append(name)
+        # added when entered, so that stages are ordered by when they were first entered (parents before children)
+        stage_info = self.stages.setdefault("/".join(self._stage_stack), {"seconds": 0.0, "calls": 0})
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage_info["seconds"] += time.perf_counter() - start
+            stage_info["calls"] += 1
+            self._stage_stack.pop()
+
+    def count(self, name: str, amount: int | float = 1):
+        self.counters[name] += amount
+
+    def merge(self, stages: dict[str, dict], counters: dict[str, int | float]):
+        """
+        Adds stages (nested in the current stage, with seconds summed over all processes) and counters of a profile of
+        a worker process
+        """
+        for path, worker_stage_info in stages.items():
+            stage_info = self.stages.setdefault("/".join([*self._stage_stack, path]), {"seconds": 0.0, "calls": 0})
+            stage_info["seconds"] += worker_stage_info["seconds"]
+            stage_info["calls"] += worker_stage_info["calls"]
+        for name, amount in counters.items():
+            self.counters[name] += amount
+
+    def finish(self):
+        self.total_seconds = time.perf_counter() - self._start
+        if self._profiler:
+            self._profiler.disable()
+            os.makedirs(os.path.dirname(self.pstats_path) or ".", exist_ok=True)
+            self._profiler.dump_stats(self.pstats_path)
+
+    def to_dict(self) -> dict:
+        return {
+            "command": self.command,
+            "argv": self.argv,
+            "started_at": self.started_at,
+            "total_seconds": self.total_seconds,
+            "stages": self.stages,
+            "counters": dict(self.counters),
+            "pstats_path": self.pstats_path,
+        }
+
+
+_active_profile: RunProfile | None = None
+
+
+def start_profile(command: str, pstats_path: str | None = None) -> RunProfile:
+    """Starts profiling the run of `command`. If `pstats_path` is given, also profiles all calls with cProfile"""
+    global _active_profile
+    _active_profile = RunProfile(command, pstats_path)
+    return _active_profile
+
+
+def finish_profile(report_path: str) -> RunProfile | None:
+    """Stops profiling and writes the JSON run report to `report_path` (and the cProfile stats, if profiled)"""
+    global _active_profile
+    profile, _active_profile = _active_profile, None
+    if profile is None:
+        return None
+
+    profile.finish()
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    with open(report_path, "w", encoding="UTF-8") as report_file:
+        json.dump(profile.to_dict(), report_file, indent=2)
+    return profile
+
+
+def is_profiling() -> bool:
+    return _active_profile is not None
+
+
+def run_in_worker(profiled: bool, function, *args):
+    """
+    Runs `function(*args)` in a worker process, which has no profile of the main process. If `profiled`, stages and
+    counters of the run are collected in a profile of its own.
+    Returns:
+        tuple: the result of `function` and `(stages, counters)` of the run (`None` if not `profiled`), to be merged
+            with `merge_worker_profile`
+    """
+    global _active_profile
+    if not profiled:
+        return function(*args), None
+
+    _active_profile = RunProfile(function.__name__)
+    try:
+        return function(*args), (_active_profile.stages, dict(_active_profile.counters))
+    finally:
+        _active_profile = None
+
+
+def merge_worker_profile(worker_profile: tuple[dict[str, dict], dict[str, int | float]] | None):
+    """Adds `(stages, counters)` returned by `run_in_worker` to the active profile (does nothing if not profiling)"""
+    if _active_profile is not None and worker_profile is not None:
+        _active_profile.merge(*worker_profile)
+
+
+def print_profile_summary(profile: RunProfile, report_path: str):
+    print(f"\nProfile of '{profile.command}' ({profile.total_seconds:.3f} s in total):")
+    for path, stage_info in profile.stages.items():
+        indent = "  " * path.count("/")
+        print(f"  {indent}{path.rsplit('/', 1)[-1]}: {stage_info['seconds']:.3f} s ({stage_info['calls']}x)")
+    for name, amount in profile.counters.items():
+        print(f"  {name}: {amount}")
+    print(f"Run report written to '{report_path}'.")
+    if profile.pstats_path:
+        print(f"cProfile stats written to '{profile.pstats_path}' (view with 'python -m pstats {profile.pstats_path}').")
+
+
+@contextmanager
+def stage(name: str):
+    """Times the code in the `with` block as a stage of the active profile (does nothing if not profiling)"""
+    if _active_profile is None:
+        yield
+        return
+    with _active_profile.stage(name):
+        yield
+
+
+def count(name: str, amount: int | float = 1):
+    """Adds `amount` to a counter of the active profile (does nothing if not profiling)"""
+    if _active_profile is not None:
+        _active_profile.count(name, amount)
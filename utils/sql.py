@@ -2,17 +2,316 @@ import sqlite3
 import tabulate
 import os
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from stat import S_ISREG
+from typing import Callable, Iterable
 
 from program_input_handling.read_csv_input_data import read_data_from_csv
-from utils.constants import DATABASE_PATH
+from utils.constants import (
+    DATABASE_PATH,
+    FILE_HASH_MAX_WORKERS,
+    PROJECT_DATABASES_DIR,
+    SCHEMA_PATH,
+    SQLITE_BULK_WRITE_BATCH_SIZE,
+    SQLITE_BULK_WRITE_CACHE_SIZE_KIB,
+)
+from utils.datetime import now_str
+from utils.profiling import count
 
 
-def get_connection():
-    connection = sqlite3.connect(DATABASE_PATH)
+def _connect(path: str):
+    connection = sqlite3.connect(path)
     connection.row_factory = sqlite3.Row
+    migrate(connection)
     return connection
 
 
+def get_connection(project_id: str | None = None):
+    """
+    Connects to the database holding the data of the project with `project_id`: the project's own database file if it
+    has one, otherwise (or if `project_id` is `None`) the main database, which is also the catalog of all projects
+    """
+    connection = _connect(DATABASE_PATH)
+    if project_id is None:
+        return connection
+
+    database_path = get_project_database_path(connection.cursor(), project_id)
+    if database_path is None:
+        return connection
+    connection.close()
+    if not os.path.isfile(database_path):
+        raise ValueError(f"Database of project '{project_id}' at '{database_path}' does not exist.")
+    return _connect(database_path)
+
+
+def get_project_database_path(cursor, project_id: str) -> str | None:
+    """The path of the project's own database file, `None` if the project is stored in the main database (or does not exist)"""
+    cursor.execute("SELECT database_path FROM projects WHERE code = ?", (project_id,))
+    row = cursor.fetchone()
+    return row["database_path"] if row else None
+
+
+def get_default_project_database_path(project_id: str) -> str:
+    return os.path.join(PROJECT_DATABASES_DIR, f"{project_id}.db")
+
+
+def create_project_database(path: str):
+    """Creates a new (empty) database file for a single project and connects to it"""
+    if os.path.exists(path):
+        raise ValueError(f"Database file '{path}' already exists.")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return _connect(path)
+
+
+def remove_database_files(path: str):
+    """Removes a database file along with its journal files"""
+    for file_path in (path, f"{path}-wal", f"{path}-shm", f"{path}-journal"):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def sync_catalog_project(project_id: str):
+    """
+    Copies the project's row from its own database into the catalog (the main database), so that the catalog shows the
+    same project information. Does nothing if the project is stored in the main database
+    """
+    catalog_connection = _connect(DATABASE_PATH)
+    try:
+        database_path = get_project_database_path(catalog_connection.cursor(), project_id)
+        if database_path is None:
+            return
+        project_connection = _connect(database_path)
+        row = project_connection.execute(
+            "SELECT name, description, csv_path, csv_sha256, csv_size, csv_delimiter, csv_multi_delimiter, score_matrix_path FROM projects WHERE code = ?",
+            (project_id,),
+        ).fetchone()
+        project_connection.close()
+        catalog_connection.execute(
+            "UPDATE projects SET name = ?, description = ?, csv_path = ?, csv_sha256 = ?, csv_size = ?, csv_delimiter = ?, csv_multi_delimiter = ?, score_matrix_path = ? WHERE code = ?",
+            (*row, project_id),
+        )
+        catalog_connection.commit()
+    finally:
+        catalog_connection.close()
+
+
+#########################
+#   SCHEMA MIGRATIONS   #
+#########################
+
+
+def _column_exists(cursor, table_name: str, column_name: str) -> bool:
+    cursor.execute(f'PRAGMA table_info("{table_name}")')
+    return any(column[1] == column_name for column in cursor.fetchall())
+
+
+def _unique_index_exists(cursor, table_name: str, column_names: list[str]) -> bool:
+    """Whether the table has a unique index (of a constraint or not) on exactly these columns, in this order"""
+    cursor.execute(f'PRAGMA index_list("{table_name}")')
+    for index in cursor.fetchall():
+        if not index[2]:  # not unique
+            continue
+        cursor.execute(f'PRAGMA index_info("{index[1]}")')
+        if [column[2] for column in cursor.fetchall()] == column_names:
+            return True
+    return False
+
+
+def _migrate_1_project_indexes(cursor):
+    """Composite indexes on the columns queries of a single project filter by"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS respondents_project_email ON respondents (project_id, email)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS match_results_project_resp2 ON match_results (project_id, resp2_id)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS generated_files_project_type_respondent ON generated_files (project_id, file_type, respondent_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS emails_project_respondent_type ON emails (project_id, respondent_id, email_type)"
+    )
+
+
+def _migrate_2_match_storage(cursor):
+    """Columns and tables of incremental matching and of storing match results as score matrices"""
+    if not _column_exists(cursor, "respondents", "match_fingerprint"):
+        cursor.execute("ALTER TABLE respondents ADD COLUMN match_fingerprint TEXT")
+    if not _column_exists(cursor, "projects", "score_matrix_path"):
+        cursor.execute("ALTER TABLE projects ADD COLUMN score_matrix_path TEXT")
+    if not _unique_index_exists(cursor, "match_results", ["project_id", "resp1_id", "resp2_id"]):
+        cursor.execute(
+            "CREATE UNIQUE INDEX match_results_pairs ON match_results (project_id, resp1_id, resp2_id)"
+        )
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS match_score_matrices (
+            project_id INTEGER PRIMARY KEY,
+            dtype TEXT NOT NULL,
+            respondent_ids BLOB NOT NULL,
+            num_scores INTEGER NOT NULL,
+            num_chunks INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (project_id) REFERENCES projects(id)
+        )"""
+    )
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS match_score_chunks (
+            project_id INTEGER NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            scores BLOB NOT NULL,
+            PRIMARY KEY (project_id, chunk_index),
+            FOREIGN KEY (project_id) REFERENCES match_score_matrices(project_id)
+        )"""
+    )
+
+
+def _migrate_3_project_databases(cursor):
+    """Projects stored in their own database files"""
+    if not _column_exists(cursor, "projects", "database_path"):
+        cursor.execute("ALTER TABLE projects ADD COLUMN database_path TEXT")
+
+
+def _migrate_4_top_k(cursor):
+    """Materialized top matches of every respondent in each group"""
+    if not _column_exists(cursor, "projects", "top_k"):
+        cursor.execute("ALTER TABLE projects ADD COLUMN top_k INTEGER")
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS match_top_k (
+            project_id INTEGER NOT NULL,
+            respondent_id INTEGER NOT NULL,
+            group_code TEXT NOT NULL,
+            group_value TEXT NOT NULL,
+            rank INTEGER NOT NULL,
+            match_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (project_id, respondent_id, group_code, rank),
+            FOREIGN KEY (project_id) REFERENCES projects(id)
+        )"""
+    )
+
+
+def _migrate_5_file_fingerprints(cursor):
+    """Cache of files' hashes by their metadata"""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS file_fingerprints (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            hashed_at TEXT NOT NULL
+        )"""
+    )
+
+
+def _migrate_6_respondent_fingerprints(cursor):
+    """Fingerprints of respondents' stored data (existing respondents have none, so they are updated once)"""
+    if not _column_exists(cursor, "respondents", "fingerprint"):
+        cursor.execute("ALTER TABLE respondents ADD COLUMN fingerprint TEXT")
+
+
+def _migrate_7_gender_pruning(cursor):
+    """Whether match results are only of the pairs scored with '--prune-by-gender' (existing ones are taken as not)"""
+    if not _column_exists(cursor, "projects", "pruned_by_gender"):
+        cursor.execute("ALTER TABLE projects ADD COLUMN pruned_by_gender INTEGER NOT NULL DEFAULT 0")
+
+
+MIGRATIONS: list[tuple[int, Callable]] = [
+    (1, _migrate_1_project_indexes),
+    (2, _migrate_2_match_storage),
+    (3, _migrate_3_project_databases),
+    (4, _migrate_4_top_k),
+    (5, _migrate_5_file_fingerprints),
+    (6, _migrate_6_respondent_fingerprints),
+    (7, _migrate_7_gender_pruning),
+]
+"""Numbered schema migrations, in order. The version of a database's schema is its `user_version`, and the schema in
+`SCHEMA_PATH` is always of the latest version (when changing it, add a migration that changes older databases the same
+way)"""
+
+SCHEMA_VERSION: int = MIGRATIONS[-1][0]
+
+
+def get_schema_version(cursor) -> int:
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0]
+
+
+def migrate(connection) -> list[int]:
+    """
+    Brings the schema of the database up to date: creates it from `SCHEMA_PATH` if the database is empty, otherwise
+    applies every migration newer than the database's version, each in its own transaction. Databases created or
+    migrated are switched to write-ahead logging (which persists in the database file).
+    Returns the versions of the migrations applied
+    """
+    cursor = connection.cursor()
+    version = get_schema_version(cursor)
+    if version == SCHEMA_VERSION:
+        return []
+    if version > SCHEMA_VERSION:
+        raise ValueError(
+            f"Database schema version ({version}) is newer than this program's ({SCHEMA_VERSION}). Update the program."
+        )
+
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'")
+    if cursor.fetchone()[0] == 0:
+        with open(SCHEMA_PATH, "r", encoding="UTF-8") as schema_file:
+            connection.executescript(schema_file.read())
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        return []
+
+    applied_versions = []
+    for migration_version, migration in MIGRATIONS:
+        # (the version is read again inside the transaction, in case another connection migrated the database)
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(cursor) < migration_version:
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {migration_version}")
+                applied_versions.append(migration_version)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    if applied_versions:
+        cursor.execute("PRAGMA journal_mode = WAL")
+        print(f"Migrated the database schema from version {version} to {SCHEMA_VERSION}.")
+    return applied_versions
+
+
+HOT_QUERIES: list[str] = [
+    "SELECT resp1_id, resp2_id, score FROM match_results WHERE project_id = (SELECT id FROM projects WHERE code = ?)",
+    "SELECT COUNT(*) AS count FROM match_results WHERE project_id = ?",
+    "DELETE FROM match_results WHERE project_id = ? AND (resp1_id = ? OR resp2_id = ?)",
+    "SELECT resp2_id, score FROM match_results WHERE project_id = ? AND resp1_id = ? UNION ALL SELECT resp1_id, score FROM match_results WHERE project_id = ? AND resp2_id = ?",
+    "SELECT id, match_fingerprint FROM respondents WHERE project_id = ?",
+    "SELECT id, fingerprint, match_fingerprint FROM respondents WHERE project_id = ?",
+    "SELECT * FROM respondents WHERE project_id = ? AND email IN (?)",
+    "SELECT COUNT(*) AS count FROM generated_files WHERE project_id = ? AND file_type IN (?, ?)",
+    "SELECT respondent_id, path, sha256, size_bytes FROM generated_files WHERE project_id = ? AND file_type = ?",
+    "SELECT COUNT(*) AS count FROM emails WHERE project_id = ? AND respondent_id = ? AND email_type = ?",
+    "SELECT COUNT(*) AS count FROM emails WHERE project_id = ?",
+    "SELECT respondent_id, path, sha256, size_bytes FROM generated_files WHERE project_id = ? AND file_type IN (?, ?)",
+    "SELECT group_code, match_id, score FROM match_top_k WHERE project_id = ? AND respondent_id = ? ORDER BY group_code, rank",
+]
+"""Queries run for a single project (often once per respondent), which must not scan whole tables"""
+
+
+def explain_query_plan(cursor, query: str) -> list[str]:
+    """Returns the steps of SQLite's plan of the query (its `?` parameters do not need values)"""
+    cursor.execute(f"EXPLAIN QUERY PLAN {query}", (None,) * query.count("?"))
+    return [row[3] for row in cursor.fetchall()]
+
+
+def check_hot_query_plans(cursor) -> list[tuple[str, list[str], bool]]:
+    """Returns `(query, plan steps, whether it uses indexes)` of every query in `HOT_QUERIES`"""
+    results = []
+    for query in HOT_QUERIES:
+        plan = explain_query_plan(cursor, query)
+        # steps that read a whole table start with "SCAN <table>" (searching uses an index)
+        results.append((query, plan, not any(step.startswith("SCAN") for step in plan)))
+    return results
+
+
 def project_exists(cursor, project_id: str):
     cursor.execute("SELECT COUNT(*) AS count FROM projects WHERE code = ?", (project_id,))
     project_count = cursor.fetchone()["count"]
@@ -54,35 +353,115 @@ def fetch_and_print(
     print(tabulate.tabulate(dict_rows, headers="keys", tablefmt="grid"))
 
 
-def get_file_info(path: str):
+def get_file_info(path: str, cursor=None, verify_full: bool = False):
     """
     Returns (exists, sha256, size) for a file.
     - exists: bool
     - sha256: hex string or None if file doesn't exist
     - size: int bytes or None if file doesn't exist
+    If `cursor` is given, the file is only hashed if it changed since it was last hashed (see `get_files_info`)
     """
-    if not os.path.isfile(path):
-        return False, None, None
+    return get_files_info([path], cursor, verify_full)[path]
 
-    # get size
-    size = os.path.getsize(path)
 
-    # compute SHA256
-    sha256_hash = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            sha256_hash.update(chunk)
-    return True, sha256_hash.hexdigest(), size
+def get_files_info(
+    paths: Iterable[str], cursor=None, verify_full: bool = False
+) -> dict[str, tuple[bool, str | None, int | None]]:
+    """
+    Returns (exists, sha256, size) of every file in `paths` (see `get_file_info`), by path.
+    If `cursor` is given, hashes are cached in the database (without committing): a file is read and hashed again only
+    if its size, modification time or inode changed since it was last hashed, or if `verify_full`. Files that need to
+    be hashed are hashed in parallel threads
+    """
+    files_info: dict[str, tuple[bool, str | None, int | None]] = {}
+    stats: dict[str, os.stat_result] = {}
+    for path in dict.fromkeys(paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat is None or not S_ISREG(stat.st_mode):
+            files_info[path] = (False, None, None)
+        else:
+            stats[path] = stat
 
+    cached_hashes = {}
+    if cursor is not None and not verify_full:
+        cached_hashes = _get_cached_file_hashes(cursor, stats)
+    paths_to_hash = [path for path in stats if path not in cached_hashes]
+    hashes = _hash_files(paths_to_hash)
+    count("files_hash_cached", len(cached_hashes))
+    count("bytes_hashed", sum(stats[path].st_size for path in paths_to_hash))
 
-def data_csv_file_exists(cursor, project_id: str) -> tuple[bool, str | None]:
+    if cursor is not None:
+        _cache_file_hashes(cursor, {path: stats[path] for path in paths_to_hash}, hashes)
+
+    for path, stat in stats.items():
+        files_info[path] = (True, cached_hashes.get(path) or hashes[path], stat.st_size)
+    return files_info
+
+
+def cache_file_hashes(cursor, hashes: dict[str, str]):
+    """
+    Caches already known sha256 hashes of files (by path), e.g. of files just written, so that checking them does not
+    read them (without committing). Files that do not exist are skipped
+    """
+    stats = {}
+    for path in hashes:
+        try:
+            stats[path] = os.stat(path)
+        except OSError:
+            continue
+    _cache_file_hashes(cursor, stats, hashes)
+
+
+def _cache_file_hashes(cursor, stats: dict[str, os.stat_result], hashes: dict[str, str]):
+    hashed_at = now_str()
+    cursor.executemany(
+        "INSERT INTO file_fingerprints (path, size, mtime_ns, inode, sha256, hashed_at) VALUES(?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, inode = excluded.inode, sha256 = excluded.sha256, hashed_at = excluded.hashed_at",
+        (
+            (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, stat.st_ino, hashes[path], hashed_at)
+            for path, stat in stats.items()
+        ),
+    )
+
+
+def _get_cached_file_hashes(cursor, stats: dict[str, os.stat_result]) -> dict[str, str]:
+    """Returns the cached hashes of files (by path) whose metadata did not change since they were hashed"""
+    cached_hashes = {}
+    for path, stat in stats.items():
+        cursor.execute(
+            "SELECT size, mtime_ns, inode, sha256 FROM file_fingerprints WHERE path = ?", (os.path.abspath(path),)
+        )
+        row = cursor.fetchone()
+        if row and (row[0], row[1], row[2]) == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            cached_hashes[path] = row[3]
+    return cached_hashes
+
+
+def _hash_file(path: str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def _hash_files(paths: list[str]) -> dict[str, str]:
+    """Returns the sha256 of every file, by path (hashing in threads, which read and hash without holding the GIL)"""
+    if len(paths) <= 1:
+        return {path: _hash_file(path) for path in paths}
+    with ThreadPoolExecutor(max_workers=min(FILE_HASH_MAX_WORKERS, len(paths))) as executor:
+        return dict(zip(paths, executor.map(_hash_file, paths)))
+
+
+def data_csv_file_exists(cursor, project_id: str, verify_full: bool = False) -> tuple[bool, str | None]:
+    """Checks the project's csv data file (hashing it only if it changed since last hashed, unless `verify_full`)"""
     if not project_exists(cursor, project_id):
         raise ValueError(f"Project with id '{project_id}' does not exist.")
 
     cursor.execute("SELECT csv_path, csv_sha256, csv_size FROM projects WHERE code = ?", (project_id,))
     path, expected_hash, expected_size = cursor.fetchone()[0:]
 
-    file_exists, file_hash, file_size = get_file_info(path)
+    file_exists, file_hash, file_size = get_file_info(path, cursor, verify_full)
     if not file_exists:
         return (
             False,
@@ -103,6 +482,165 @@ def data_csv_file_exists(cursor, project_id: str) -> tuple[bool, str | None]:
     return True, None
 
 
+def set_bulk_write_pragmas(cursor):
+    """
+    Tunes the connection for writing many rows at once: syncing to disk only at checkpoints of the write-ahead log, a
+    larger page cache and temporary index data in memory. Only changes the connection, not the database file.
+    Must be called outside of a transaction.
+    """
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.execute(f"PRAGMA cache_size = -{SQLITE_BULK_WRITE_CACHE_SIZE_KIB}")
+    cursor.execute("PRAGMA temp_store = MEMORY")
+
+
+def executemany_in_batches(
+    cursor, query: str, rows: Iterable[tuple], batch_size: int = SQLITE_BULK_WRITE_BATCH_SIZE
+) -> int:
+    """
+    Executes `query` for every row, `batch_size` rows per `executemany`, so that `rows` can be a generator that is
+    never held in memory whole. Does not commit. Returns the amount of rows
+    """
+    rows = iter(rows)
+    num_rows = 0
+    while batch := list(islice(rows, batch_size)):
+        cursor.executemany(query, batch)
+        num_rows += len(batch)
+        count("rows_written", len(batch))
+    return num_rows
+
+
+def drop_indexes(cursor, table_name: str) -> list[str]:
+    """
+    Drops the indexes of a table that were made with `CREATE INDEX` (not the ones of its constraints) and returns the
+    statements that create them again
+    """
+    cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table_name,)
+    )
+    indexes = cursor.fetchall()
+    for index in indexes:
+        cursor.execute(f'DROP INDEX "{index[0]}"')
+    return [index[1] for index in indexes]
+
+
+def get_score_matrix_path(cursor, project_id: str) -> str | None:
+    """Returns the directory of the project's memory-mapped score matrix, or `None` if match results are not in one"""
+    cursor.execute("SELECT score_matrix_path FROM projects WHERE code = ?", (project_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def set_score_matrix_path(cursor, project_sql_id: int, path: str | None):
+    cursor.execute("UPDATE projects SET score_matrix_path = ? WHERE id = ?", (path, project_sql_id))
+
+
+def get_project_top_k(cursor, project_id: str) -> int | None:
+    """Returns the amount of top matches of every respondent kept in `match_top_k`, or `None` if they are not kept"""
+    cursor.execute("SELECT top_k FROM projects WHERE code = ?", (project_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def set_project_top_k(cursor, project_sql_id: int, k: int | None):
+    cursor.execute("UPDATE projects SET top_k = ? WHERE id = ?", (k, project_sql_id))
+
+
+def get_project_pruned_by_gender(cursor, project_id: str) -> bool:
+    """Returns whether the project's match results are only of the pairs scored with '--prune-by-gender'"""
+    cursor.execute("SELECT pruned_by_gender FROM projects WHERE code = ?", (project_id,))
+    row = cursor.fetchone()
+    return bool(row[0]) if row else False
+
+
+def set_project_pruned_by_gender(cursor, project_sql_id: int, pruned_by_gender: bool):
+    cursor.execute("UPDATE projects SET pruned_by_gender = ? WHERE id = ?", (int(pruned_by_gender), project_sql_id))
+
+
+def get_respondent_match_fingerprints(cursor, project_sql_id: int) -> dict[int, str | None]:
+    """Returns the fingerprints of respondents' data from when their match results were last calculated"""
+    cursor.execute("SELECT id, match_fingerprint FROM respondents WHERE project_id = ?", (project_sql_id,))
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+def set_respondent_match_fingerprints(cursor, project_sql_id: int, respondents: list):
+    """Stores the fingerprints of respondents' current data as the ones their match results are calculated from
+    (respondents that are not yet in the database are inserted)"""
+    cursor.executemany(
+        "INSERT INTO respondents (id, project_id, name, email, gender, csv_data, fingerprint, match_fingerprint) VALUES(?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(id, project_id) DO UPDATE SET match_fingerprint = excluded.match_fingerprint",
+        ((resp.id, project_sql_id, *_get_respondent_row(resp), resp.get_fingerprint()) for resp in respondents),
+    )
+
+
+def forget_respondent_match_fingerprints(cursor, project_sql_id: int, respondent_ids: Iterable[int]):
+    """
+    Forgets that match results of the respondents were calculated (when their match results are deleted), so that
+    `sync_respondents` deletes the ones no longer in the csv data file
+    """
+    cursor.executemany(
+        "UPDATE respondents SET match_fingerprint = NULL WHERE project_id = ? AND id = ?",
+        ((project_sql_id, resp_id) for resp_id in respondent_ids),
+    )
+
+
+def _get_respondent_row(resp) -> tuple[str, str | None, str, str | None, str]:
+    """
+    Returns `(name, email, gender, csv_data, fingerprint)` of a respondent as stored in `respondents`. The fingerprint
+    is the same one match results are calculated from (all other values are read from the csv data row it hashes)
+    """
+    return resp.full_name, resp.email, str(resp.gender), resp.csv_data_row, resp.get_fingerprint()
+
+
+def sync_respondents(cursor, project_sql_id: int, respondents: list) -> dict[str, int]:
+    """
+    Brings the project's stored respondents up to date with `respondents` (read from the csv data file), comparing
+    them by id and the fingerprint of their stored data: only new respondents are inserted, only changed ones updated
+    and removed ones deleted, in batches and without committing (so that the caller commits it all at once).
+    Removed respondents that still have match results are kept until matching again forgets their results (so that
+    it knows which ones to forget), then they are deleted by the next sync.
+    Returns the amount of respondents `"added"`, `"updated"`, `"removed"`, `"kept"` (removed, but still matched) and
+    `"unchanged"`
+    """
+    cursor.execute("SELECT id, fingerprint, match_fingerprint FROM respondents WHERE project_id = ?", (project_sql_id,))
+    stored = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+    new_rows = []
+    changed_rows = []
+    for resp in respondents:
+        row = _get_respondent_row(resp)
+        if resp.id not in stored:
+            new_rows.append((resp.id, project_sql_id, *row))
+        elif stored[resp.id][0] != row[-1]:
+            changed_rows.append((*row, resp.id, project_sql_id))
+    respondent_ids = {resp.id for resp in respondents}
+    removed_ids = [resp_id for resp_id in stored if resp_id not in respondent_ids]
+    deleted_ids = [resp_id for resp_id in removed_ids if stored[resp_id][1] is None]
+
+    executemany_in_batches(
+        cursor,
+        "INSERT INTO respondents (id, project_id, name, email, gender, csv_data, fingerprint) VALUES(?, ?, ?, ?, ?, ?, ?)",
+        new_rows,
+    )
+    # (the match fingerprint stays, so that matching again finds the respondent changed)
+    executemany_in_batches(
+        cursor,
+        "UPDATE respondents SET name = ?, email = ?, gender = ?, csv_data = ?, fingerprint = ? WHERE id = ? AND project_id = ?",
+        changed_rows,
+    )
+    executemany_in_batches(
+        cursor,
+        "DELETE FROM respondents WHERE id = ? AND project_id = ?",
+        ((resp_id, project_sql_id) for resp_id in deleted_ids),
+    )
+    return {
+        "added": len(new_rows),
+        "updated": len(changed_rows),
+        "removed": len(deleted_ids),
+        "kept": len(removed_ids) - len(deleted_ids),
+        "unchanged": len(respondents) - len(new_rows) - len(changed_rows),
+    }
+
+
 def read_csv_data_file(cursor, project_id: str):
     cursor.execute("SELECT csv_path, csv_delimiter, csv_multi_delimiter FROM projects WHERE code = ?", (project_id,))
     path, delimiter, multi_delimiter = cursor.fetchone()[0:]
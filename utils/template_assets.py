@@ -0,0 +1,207 @@
+import functools
+import hashlib
+import os
+import pathlib
+import re
+import urllib.parse
+import urllib.request
+
+from markupsafe import Markup
+
+from utils.constants import (
+    PDF_RESULTS_TEMPLATE_RELATIVE_PATH,
+    PNG_RESULTS_TEMPLATE_RELATIVE_PATH,
+    TEMPLATE_ASSETS_DOWNLOAD_TIMEOUT_SECONDS,
+    TEMPLATE_ASSETS_RELATIVE_DIR,
+    TEMPLATE_ASSETS_USER_AGENT,
+    TEMPLATES_DIR,
+)
+
+_LINK_TAG_RE = re.compile(r"[ \t]*<link\b[^>]*>[ \t]*\n?", re.IGNORECASE)
+_ATTRIBUTE_RE = re.compile(r"""\b(href|src|rel)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.IGNORECASE)
+_SRC_RE = re.compile(r"""<(?:img|script|iframe|source|embed)\b[^>]*?\bsrc\s*=\s*["']?([^"'\s>]+)""", re.IGNORECASE)
+_CSS_URL_RE = re.compile(r"""url\(\s*(["']?)([^"')]+)\1\s*\)""", re.IGNORECASE)
+_CSS_IMPORT_RE = re.compile(r"""@import\s+(?:url\(\s*)?["']?([^"')\s;]+)""", re.IGNORECASE)
+_CSS_IMPORT_RULE_RE = re.compile(r"""@import\s+(?:url\(\s*)?["']?([^"')\s;]+)[^;]*;""", re.IGNORECASE)
+_FONT_EXTENSIONS = (".ttf", ".otf", ".woff", ".woff2")
+
+
+def get_rendered_template_paths() -> list[str]:
+    """
+    Returns paths of all files in the directories of templates rendered by wkhtmltopdf and imgkit (pdf and png result
+    files) and of vendored assets (except fonts), the files that must not load anything from the network
+    """
+    directories = [
+        os.path.join(TEMPLATES_DIR, os.path.dirname(PDF_RESULTS_TEMPLATE_RELATIVE_PATH)),
+        os.path.join(TEMPLATES_DIR, os.path.dirname(PNG_RESULTS_TEMPLATE_RELATIVE_PATH)),
+        os.path.join(TEMPLATES_DIR, TEMPLATE_ASSETS_RELATIVE_DIR),
+    ]
+    paths = []
+    for directory in dict.fromkeys(directories):
+        for root, _, filenames in os.walk(directory):
+            paths.extend(
+                os.path.join(root, filename)
+                for filename in sorted(filenames)
+                if os.path.splitext(filename)[1].lower() not in _FONT_EXTENSIONS
+            )
+    return paths
+
+
+def is_external_url(url: str) -> bool:
+    return url.lower().startswith(("http://", "https://", "//"))
+
+
+def find_external_resources(template_paths: list[str]) -> list[tuple[str, int, str]]:
+    """
+    Finds resources the templates load from the network: linked stylesheets (and other `<link>` tags, e.g. preconnect
+    hints), `src` of embedded elements and `url()` and `@import` of styles. Links of `<a>` tags are not resources.
+    Returns:
+        list[tuple[str, int, str]]: `(template path, line, url)` of every external resource
+    """
+    external_resources = []
+    for path in template_paths:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+
+        urls: list[tuple[int, str]] = []
+        for match in _LINK_TAG_RE.finditer(text):
+            href = _get_attributes(match.group()).get("href", "")
+            urls.append((match.start(), href))
+        urls.extend((match.start(1), match.group(1)) for match in _SRC_RE.finditer(text))
+        urls.extend((match.start(2), match.group(2)) for match in _CSS_URL_RE.finditer(text))
+        urls.extend((match.start(1), match.group(1)) for match in _CSS_IMPORT_RE.finditer(text))
+
+        for position, url in sorted(urls):
+            if is_external_url(url):
+                external_resources.append((path, text.count("\n", 0, position) + 1, url))
+    return external_resources
+
+
+def vendor_external_resources(template_paths: list[str], verbose: bool = True) -> list[tuple[str, str, str]]:
+    """
+    Downloads stylesheets linked by the templates, and the fonts (and other files) they load next to them, into
+    `TEMPLATE_ASSETS_RELATIVE_DIR` and replaces their `<link>` tags with the stylesheets included by `inline_asset`.
+    Hints to connect to external hosts early (preconnect, dns-prefetch) are removed, since nothing is loaded from them
+    anymore. Other external resources are left as they are (`find_external_resources` still finds them).
+    Returns:
+        list[tuple[str, str, str]]: `(template path, url, vendored asset path relative to TEMPLATES_DIR)` of every
+            replaced stylesheet
+    """
+    vendored = []
+    # key: url of a stylesheet, value: path of its vendored asset (every stylesheet is downloaded once)
+    assets: dict[str, str] = {}
+
+    def replace_link_tag(match: re.Match) -> str:
+        attributes = _get_attributes(match.group())
+        href = attributes.get("href", "")
+        rel = attributes.get("rel", "").lower().split()
+        if not is_external_url(href):
+            return match.group()
+        if "preconnect" in rel or "dns-prefetch" in rel:
+            return ""
+        if "stylesheet" not in rel:
+            return match.group()
+
+        if href not in assets:
+            assets[href] = _vendor_stylesheet(href, verbose)
+        vendored.append((path, href, assets[href]))
+        indentation = match.group()[: len(match.group()) - len(match.group().lstrip(" \t"))]
+        ending = "\n" if match.group().endswith("\n") else ""
+        return f'{indentation}<style>{{{{ inline_asset("{assets[href]}") }}}}</style>{ending}'
+
+    for path in template_paths:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        new_text = _LINK_TAG_RE.sub(replace_link_tag, text)
+        if new_text != text:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(new_text)
+            if verbose:
+                print(f"Rewrote template '{path}'.")
+    return vendored
+
+
+@functools.lru_cache(maxsize=None)
+def inline_asset(relative_path: str) -> Markup:
+    """
+    Returns the contents of a vendored stylesheet (path relative to `TEMPLATES_DIR`) to be included in a template,
+    with relative `url()` of the files it loads replaced with their absolute `file://` urls. The fonts are then read
+    from disk by wkhtmltopdf and imgkit instead of being a part of every rendered document. Read once per process
+    """
+    asset_path = os.path.abspath(os.path.join(TEMPLATES_DIR, relative_path))
+    with open(asset_path, encoding="utf-8") as f:
+        css = f.read()
+
+    def replace_url(match: re.Match) -> str:
+        url = match.group(2).strip()
+        if url.startswith(("data:", "#", "file:")) or is_external_url(url):
+            return match.group()
+        file_path = os.path.join(os.path.dirname(asset_path), urllib.parse.unquote(url))
+        return f'url("{pathlib.Path(file_path).as_uri()}")'
+
+    return Markup(_CSS_URL_RE.sub(replace_url, css))
+
+
+def _get_attributes(tag: str) -> dict[str, str]:
+    return {
+        match.group(1).lower(): next(value for value in match.groups()[1:] if value is not None)
+        for match in _ATTRIBUTE_RE.finditer(tag)
+    }
+
+
+def _download(url: str) -> tuple[bytes, str]:
+    """Returns `(contents, url the contents were downloaded from)`"""
+    if url.startswith("//"):
+        url = f"https:{url}"
+    request = urllib.request.Request(url, headers={"User-Agent": TEMPLATE_ASSETS_USER_AGENT})
+    with urllib.request.urlopen(request, timeout=TEMPLATE_ASSETS_DOWNLOAD_TIMEOUT_SECONDS) as response:
+        return response.read(), response.geturl()
+
+
+def _vendor_stylesheet(url: str, verbose: bool) -> str:
+    """Downloads the stylesheet and everything it loads and returns the path of its asset"""
+    contents, final_url = _download(url)
+    css = _inline_stylesheet(contents.decode("utf-8"), final_url, verbose)
+
+    host = urllib.parse.urlsplit(final_url).hostname or "stylesheet"
+    relative_path = f"{TEMPLATE_ASSETS_RELATIVE_DIR}/{host}-{hashlib.sha256(url.encode()).hexdigest()[:16]}.css"
+    asset_path = os.path.join(TEMPLATES_DIR, relative_path)
+    os.makedirs(os.path.dirname(asset_path), exist_ok=True)
+    with open(asset_path, "w", encoding="utf-8") as f:
+        f.write(f"/* Vendored from {url} */\n{css}")
+    if verbose:
+        print(f"Vendored '{url}' into '{asset_path}' ({len(css)} characters).")
+    return relative_path
+
+
+def _inline_stylesheet(css: str, base_url: str, verbose: bool) -> str:
+    """
+    Replaces `@import` rules with the imported stylesheets, and `url()` of files with the paths (relative to the
+    stylesheet's asset) of their copies downloaded into `TEMPLATE_ASSETS_RELATIVE_DIR`
+    """
+
+    def replace_import(match: re.Match) -> str:
+        # (the whole rule is replaced, media queries of the import are not kept)
+        contents, final_url = _download(urllib.parse.urljoin(base_url, match.group(1)))
+        return _inline_stylesheet(contents.decode("utf-8"), final_url, verbose)
+
+    def replace_url(match: re.Match) -> str:
+        url = match.group(2).strip()
+        if url.startswith(("data:", "#")):
+            return match.group()
+        file_url = urllib.parse.urljoin(base_url, url)
+        contents, _ = _download(file_url)
+        host = urllib.parse.urlsplit(file_url).hostname or "file"
+        extension = os.path.splitext(urllib.parse.urlsplit(file_url).path)[1].lower()
+        filename = f"{host}-{hashlib.sha256(file_url.encode()).hexdigest()[:16]}{extension}"
+        file_path = os.path.join(TEMPLATES_DIR, TEMPLATE_ASSETS_RELATIVE_DIR, filename)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(contents)
+        if verbose:
+            print(f"Vendored '{file_url}' into '{file_path}' ({len(contents)} bytes).")
+        return f'url("{filename}")'
+
+    css = _CSS_IMPORT_RULE_RE.sub(replace_import, css)
+    return _CSS_URL_RE.sub(replace_url, css)
+
@@ -0,0 +1,23 @@
+"""
+Helpers for storing the upper triangle (without the diagonal) of a symmetric `n` x `n` matrix in a flat array,
+row by row: `(0, 1), (0, 2), ..., (0, n-1), (1, 2), ..., (n-2, n-1)`.
+"""
+
+
+def num_pairs(n: int) -> int:
+    """Returns the amount of pairs (cells above the diagonal) in an `n` x `n` matrix"""
+    return n * (n - 1) // 2
+
+
+def row_offset(i: int, n: int) -> int:
+    """Returns the flat index of the pair `(i, i + 1)`, i.e. where the row `i` starts in the flat array"""
+    return i * (2 * n - i - 1) // 2
+
+
+def pair_index(i: int, j: int, n: int) -> int:
+    """Returns the flat index of the pair `(i, j)`. The order of `i` and `j` does not matter, but they must differ."""
+    if i > j:
+        i, j = j, i
+    if i == j:
+        raise ValueError(f"Pair index requested for the diagonal cell ({i}, {j})")
+    return row_offset(i, n) + (j - i - 1)